@@ -0,0 +1,183 @@
+"""Бенчмарк операций с балансом на одном «горячем» пользователе.
+
+Сотни параллельных списаний с одного баланса двумя способами:
+  1. orm    — прежний путь: прочитать User, `user.balance -= amount`, commit;
+  2. ledger — debit_balance: один оператор (условный UPDATE + запись в журнал).
+Для каждого способа — пропускная способность, задержки и потерянные
+обновления. Затем смешанная нагрузка (зачисления + списания при почти пустом
+балансе) проверяет, что баланс не уходит в минус и совпадает с журналом.
+
+Запускать ТОЛЬКО против локальной/тестовой БД (настройки берутся из .env):
+скрипт создаёт своего пользователя и удаляет его по завершении.
+
+    python scripts/bench_balance.py --confirm
+    python scripts/bench_balance.py --confirm --ops 5000 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.config import settings
+from src.database.models import BalanceLedger, User
+from src.services.balance import InsufficientFunds, credit_balance, debit_balance
+
+TELEGRAM_ID_BASE = 9_200_000_000_000
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] if ordered else 0.0
+
+
+async def _measure(op, ops: int, concurrency: int) -> tuple:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(n: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await op(n)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(ops)))
+    return time.perf_counter() - started, latencies
+
+
+def _report(title: str, elapsed: float, latencies: list, extra: str = "") -> None:
+    print(
+        f"  {title:<8} {len(latencies) / elapsed:8.0f} ops/s  "
+        f"p50={_percentile(latencies, 50) * 1000:6.1f}ms p99={_percentile(latencies, 99) * 1000:6.1f}ms {extra}"
+    )
+
+
+async def _balance(session_maker, user_id: int) -> float:
+    async with session_maker() as session:
+        return (await session.execute(select(User.balance).where(User.id == user_id))).scalar_one()
+
+
+async def _set_balance(session_maker, user_id: int, balance: float) -> None:
+    async with session_maker() as session:
+        user = await session.get(User, user_id)
+        user.balance = balance
+        await session.commit()
+
+
+async def run(args) -> int:
+    engine = create_async_engine(
+        settings.DATABASE_URL, pool_size=args.concurrency, max_overflow=0, pool_timeout=120
+    )
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    problems = []
+
+    async with session_maker() as session:
+        user = User(telegram_id=TELEGRAM_ID_BASE + int(time.time()) % 1_000_000, first_name="bench-balance")
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+
+    try:
+        start = args.ops * args.amount
+        print(f"🏁 {args.ops} debits of {args.amount:.2f} on one user, concurrency {args.concurrency}")
+
+        await _set_balance(session_maker, user_id, start)
+
+        async def orm_debit(n: int) -> None:
+            async with session_maker() as session:
+                user = await session.get(User, user_id)
+                if user.balance >= args.amount:
+                    user.balance -= args.amount
+                    await session.commit()
+
+        elapsed, latencies = await _measure(orm_debit, args.ops, args.concurrency)
+        lost = round((await _balance(session_maker, user_id)) / args.amount)
+        _report("orm", elapsed, latencies, f"lost updates={lost}")
+
+        await _set_balance(session_maker, user_id, start)
+
+        async def ledger_debit(n: int) -> None:
+            async with session_maker() as session:
+                await debit_balance(session, user_id, args.amount, "bench")
+                await session.commit()
+
+        elapsed, latencies = await _measure(ledger_debit, args.ops, args.concurrency)
+        lost = round((await _balance(session_maker, user_id)) / args.amount)
+        _report("ledger", elapsed, latencies, f"lost updates={lost}")
+        if lost:
+            problems.append(f"ledger debits lost {lost} updates")
+
+        print(f"\n🔀 mixed: {args.ops} credits/debits around an almost empty balance")
+        await _set_balance(session_maker, user_id, 0.0)
+        async with session_maker() as session:
+            await session.execute(delete(BalanceLedger).where(BalanceLedger.user_id == user_id))
+            await session.commit()
+        rejected = 0
+
+        async def mixed(n: int) -> None:
+            nonlocal rejected
+            async with session_maker() as session:
+                if random.random() < 0.4:
+                    await credit_balance(session, user_id, args.amount, "bench")
+                else:
+                    try:
+                        await debit_balance(session, user_id, args.amount, "bench")
+                    except InsufficientFunds:
+                        rejected += 1
+                        await session.rollback()
+                        return
+                await session.commit()
+
+        elapsed, latencies = await _measure(mixed, args.ops, args.concurrency)
+        _report("mixed", elapsed, latencies, f"rejected debits={rejected}")
+
+        async with session_maker() as session:
+            ledger_sum, negative = (await session.execute(
+                select(func.coalesce(func.sum(BalanceLedger.amount), 0), func.count().filter(BalanceLedger.balance_after < 0))
+                .where(BalanceLedger.user_id == user_id)
+            )).one()
+        balance = await _balance(session_maker, user_id)
+        if abs(balance - ledger_sum) > 1e-6:
+            problems.append(f"balance {balance:.2f} != ledger sum {ledger_sum:.2f}")
+        if balance < 0 or negative:
+            problems.append(f"balance went negative ({negative} ledger rows below zero)")
+
+        print("\n🔍 Invariants")
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        if not problems:
+            print(f"  ✅ no lost updates, balance {balance:.2f} matches the ledger and never went negative")
+    finally:
+        async with session_maker() as session:
+            await session.execute(delete(BalanceLedger).where(BalanceLedger.user_id == user_id))
+            await session.execute(delete(User).where(User.id == user_id))
+            await session.commit()
+        await engine.dispose()
+    return 1 if problems else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark balance debits on a single hot user")
+    parser.add_argument("--confirm", action="store_true", help="I understand this writes to the configured DB")
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--amount", type=float, default=10.0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.confirm:
+        print(
+            f"⚠️  This benchmark writes to {settings.DATABASE_HOST}:{settings.DATABASE_PORT}/"
+            f"{settings.DATABASE_NAME}. Re-run with --confirm against a local database."
+        )
+        sys.exit(2)
+    sys.exit(asyncio.run(run(args)))
@@ -0,0 +1,144 @@
+"""Бенчмарк: рассылки пропускают пользователей, заблокировавших бота.
+
+Две рассылки подряд через заглушку Bot API из bench_broadcast.py, где каждый
+50-й чат отвечает 403. Бот подключён с BotBlockedMiddleware, как в main:
+первая рассылка тратит запросы на заблокировавших и отмечает их, вторая
+обходит их без единого запроса. Затем один из отмеченных «пишет /start» и
+снова попадает в число получателей.
+
+Запускать ТОЛЬКО против локальной/тестовой БД (настройки берутся из .env):
+скрипт создаёт своих пользователей и задачи рассылки и удаляет их по
+завершении. Рассылка уходит всем достижимым пользователям БД — но только в
+заглушку; отметки, поставленные чужим пользователям, снимаются.
+
+    python scripts/bench_bot_blocked.py --confirm
+    python scripts/bench_bot_blocked.py --confirm --users 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, insert, select, update
+
+from scripts.bench_broadcast import BLOCKED_EVERY, FakeBotAPI, serve
+from src.bot.middlewares.bot_blocked import BotBlockedMiddleware
+from src.config import settings
+from src.database.database import async_session_maker
+from src.database.models import BroadcastJob, User
+from src.services.bot_blocked import clear_bot_blocked, reachable_users
+from src.services.broadcast import BroadcastJobRunner, create_broadcast_job
+from src.utils.rate_limit import bot_throttle
+
+TELEGRAM_ID_BASE = 9_500_000_000_000
+
+
+async def broadcast(bot, batch: int) -> BroadcastJob:
+    async with async_session_maker() as session:
+        created = await create_broadcast_job(session, "bench", created_by=0)
+    runner = BroadcastJobRunner(poll_interval=1.0, lease_seconds=300, batch_size=batch)
+    runner.bot = bot
+    job = await runner._claim_job()
+    if job is None or job.id != created.id:
+        raise RuntimeError("another broadcast job is pending in this database")
+    await runner.run_job(job)
+    async with async_session_maker() as session:
+        return await session.get(BroadcastJob, job.id)
+
+
+async def run(args) -> int:
+    settings.BROADCAST_RATE = args.rate
+    bot_throttle().set_rate(args.rate)  # заглушка API без лимита — общий лимит бота не мешает замеру
+    settings.BROADCAST_CONCURRENCY = args.concurrency
+    api = FakeBotAPI(latency=0.01, limit=1_000_000, flaky=0.0)
+    server, bot = await serve(api)
+    bot.session.middleware(BotBlockedMiddleware())
+
+    base = TELEGRAM_ID_BASE + int(time.time()) % 1_000_000 * 1_000_000
+    async with async_session_maker() as session:
+        already_blocked = set((await session.execute(
+            select(User.id).where(User.bot_blocked_at.isnot(None))
+        )).scalars())
+        await session.execute(insert(User), [
+            {"telegram_id": base + n, "first_name": "bench-blocked"} for n in range(args.users)
+        ])
+        await session.commit()
+    print(f"🏁 {args.users} users, every {BLOCKED_EVERY}th chat blocked the bot")
+
+    problems = []
+    rounds = []
+    try:
+        for n in (1, 2):
+            api.reset()
+            started = time.perf_counter()
+            job = await broadcast(bot, args.batch)
+            elapsed = time.perf_counter() - started
+            requests = api.accepted + api.forbidden + api.errors + api.flood
+            rounds.append((job, requests, api.forbidden))
+            print(
+                f"  broadcast #{n}: recipients={job.total} requests={requests} 403={api.forbidden} "
+                f"sent={job.sent} failed={job.failed} time={elapsed:.1f}s"
+            )
+
+        (first, _, forbidden), (second, requests, forbidden_again) = rounds
+        if not forbidden:
+            problems.append("the fake API returned no 403s")
+        if forbidden_again:
+            problems.append(f"second broadcast still made {forbidden_again} requests to blocked chats")
+        if second.total != first.total - forbidden or requests != second.total:
+            problems.append(f"second broadcast targeted {second.total}, expected {first.total - forbidden}")
+
+        async with async_session_maker() as session:
+            user = (await session.execute(
+                select(User).where(User.telegram_id == base + BLOCKED_EVERY - base % BLOCKED_EVERY)
+            )).scalar_one()
+            await clear_bot_blocked(session, user)  # пользователь снова написал /start
+            reachable = (await session.execute(select(func.count(User.id)).where(reachable_users()))).scalar()
+        if reachable != second.total + 1:
+            problems.append("/start did not make the user reachable again")
+
+        print("\n🔍 Invariants")
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        if not problems:
+            print(
+                f"  ✅ second broadcast skipped {forbidden} blocked chats "
+                f"({forbidden / first.total:.1%} of API calls saved); /start restores the user"
+            )
+    finally:
+        async with async_session_maker() as session:
+            await session.execute(delete(BroadcastJob).where(BroadcastJob.id.in_([job.id for job, _, _ in rounds])))
+            await session.execute(delete(User).where(User.telegram_id >= base, User.telegram_id < base + args.users))
+            await session.execute(
+                update(User)
+                .where(User.bot_blocked_at.isnot(None), User.id.notin_(already_blocked or [0]))
+                .values(bot_blocked_at=None)
+            )
+            await session.commit()
+        await bot.session.close()
+        await server.cleanup()
+    return 1 if problems else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check that broadcasts skip users who blocked the bot")
+    parser.add_argument("--confirm", action="store_true", help="I understand this writes to the configured DB")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=settings.BROADCAST_BATCH)
+    parser.add_argument("--rate", type=float, default=2000.0, help="messages per second (the fake API has no limit)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.confirm:
+        print(
+            f"⚠️  This benchmark writes to {settings.DATABASE_HOST}:{settings.DATABASE_PORT}/"
+            f"{settings.DATABASE_NAME}. Re-run with --confirm against a local database."
+        )
+        sys.exit(2)
+    sys.exit(asyncio.run(run(args)))
@@ -0,0 +1,234 @@
+"""Бенчмарк рассылки на локальной заглушке Bot API.
+
+Заглушка отвечает на sendMessage с задержкой --latency и ведёт себя как
+Telegram: больше --limit сообщений за скользящую секунду — 429 с
+retry_after, каждый 50-й чат «заблокировал бота» (403), доля --flaky
+запросов — 502. Остальные методы (правки сообщения-статуса) просто
+записываются в edits. Сравниваются:
+  1. legacy    — прежний цикл: по одному сообщению, sleep(1) каждые 25;
+  2. engine    — Broadcaster с целевой скоростью --rate;
+  3. overdrive — Broadcaster с завышенной скоростью (лимит превышается
+     намеренно): проверяет, что 429 не теряет сообщений.
+База данных не нужна.
+
+    python scripts/bench_broadcast.py
+    python scripts/bench_broadcast.py --messages 1000 --rate 28 --latency 0.1
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter, deque
+from typing import Any, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+from src.services.broadcast import Broadcaster
+from src.utils.rate_limit import bot_throttle
+
+BLOCKED_EVERY = 50
+
+
+class FakeBotAPI:
+    """Заглушка Bot API: задержка, глобальный flood limit, 403 и 502.
+
+    Понимает sendMessage и отправку медиа (sendPhoto, sendDocument, sendVideo,
+    sendAnimation): файл, пришедший загрузкой, получает новый file_id, а
+    загрузки идут через общий канал шириной upload_rate байт/с (None — без
+    ограничения).
+    """
+
+    MEDIA_FIELDS = {"sendphoto": "photo", "senddocument": "document", "sendvideo": "video", "sendanimation": "animation"}
+
+    def __init__(self, latency: float, limit: int, flaky: float, upload_rate: Optional[float] = None):
+        self.latency = latency
+        self.limit = limit
+        self.flaky = flaky
+        self.upload_rate = upload_rate
+        self._window: deque = deque()
+        self._uplink = asyncio.Lock()
+        self.accepted = 0
+        self.flood = 0
+        self.errors = 0
+        self.forbidden = 0
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self.received: Counter = Counter()
+        self.edits: list = []  # (время, текст) правок сообщения-статуса
+
+    async def _media(self, field: str, value) -> Any:
+        """Описание медиа для ответа; загруженному файлу — новый file_id."""
+        if isinstance(value, web.FileField):
+            size = len(value.file.read())
+            async with self._uplink:
+                if self.upload_rate:
+                    await asyncio.sleep(size / self.upload_rate)
+            self.uploads += 1
+            self.uploaded_bytes += size
+            value = f"bench-file-{self.uploads}"
+        media = {"file_id": value, "file_unique_id": value}
+        if field == "photo":
+            return [{**media, "width": 1280, "height": 720}]
+        if field in ("video", "animation"):
+            return {**media, "width": 1280, "height": 720, "duration": 1}
+        return media
+
+    async def handle(self, request: web.Request) -> web.Response:
+        data = await request.post()
+        chat_id = int(data["chat_id"])
+        method = request.match_info["method"].lower()
+        await asyncio.sleep(self.latency)
+        if method != "sendmessage" and method not in self.MEDIA_FIELDS:
+            self.edits.append((time.monotonic(), data.get("text", "")))
+            return web.json_response({"ok": True, "result": {
+                "message_id": int(data.get("message_id", 1)), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "text": data.get("text", ""),
+            }})
+
+        now = time.monotonic()
+        while self._window and now - self._window[0] >= 1.0:
+            self._window.popleft()
+        if len(self._window) >= self.limit:
+            self.flood += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            }, status=429)
+        self._window.append(now)
+
+        if random.random() < self.flaky:
+            self.errors += 1
+            return web.json_response({"ok": False, "error_code": 502, "description": "Bad Gateway"}, status=502)
+        if chat_id % BLOCKED_EVERY == 0:
+            self.forbidden += 1
+            return web.json_response({
+                "ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user",
+            }, status=403)
+        result = {"message_id": self.accepted + 1, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}}
+        if method == "sendmessage":
+            result["text"] = data.get("text", "")
+        else:
+            field = self.MEDIA_FIELDS[method]
+            value = data[field]
+            if value.startswith("attach://"):  # файл — отдельной частью формы
+                value = data[value[len("attach://"):]]
+            result[field] = await self._media(field, value)
+            if data.get("caption"):
+                result["caption"] = data["caption"]
+        self.accepted += 1
+        self.received[chat_id] += 1
+        return web.json_response({"ok": True, "result": result})
+
+    def reset(self) -> None:
+        self._window.clear()
+        self.accepted = self.flood = self.errors = self.forbidden = self.uploads = self.uploaded_bytes = 0
+        self.received.clear()
+        self.edits.clear()
+
+
+async def serve(api: FakeBotAPI) -> tuple:
+    """Поднять заглушку на свободном порту. Возвращает (runner, бот, смотрящий в неё)."""
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}"))
+    return runner, Bot("123456:BENCH", session=session)
+
+
+async def legacy(bot: Bot, chat_ids: list, text: str) -> tuple:
+    """Прежний цикл из mass_broadcast_process (для сравнения)."""
+    sent, failed = 0, 0
+    for i, chat_id in enumerate(chat_ids):
+        try:
+            await bot.send_message(chat_id, text)
+            sent += 1
+        except Exception:
+            failed += 1
+        if (i + 1) % 25 == 0:
+            await asyncio.sleep(1)
+    return sent, failed, 0
+
+
+async def engine(bot: Bot, chat_ids: list, text: str, rate: float, concurrency: int) -> tuple:
+    stats = await Broadcaster(rate=rate, concurrency=concurrency, retry_base=0.2).run(
+        chat_ids, lambda chat_id: bot.send_message(chat_id, text),
+    )
+    return stats.sent, stats.failed, stats.retries
+
+
+async def run(args) -> int:
+    api = FakeBotAPI(args.latency, args.limit, args.flaky)
+    runner, bot = await serve(api)
+    chat_ids = list(range(1, args.messages + 1))
+    deliverable = sum(1 for chat_id in chat_ids if chat_id % BLOCKED_EVERY)
+    variants = (
+        ("legacy", lambda: legacy(bot, chat_ids, "bench")),
+        ("engine", lambda: engine(bot, chat_ids, "bench", args.rate, args.concurrency)),
+        ("overdrive", lambda: engine(bot, chat_ids, "bench", args.limit * 2, args.concurrency)),
+    )
+
+    problems = []
+    print(
+        f"🏁 {args.messages} messages, API limit {args.limit}/s, latency {args.latency * 1000:.0f}ms, "
+        f"{args.flaky:.0%} flaky, target {args.rate}/s"
+    )
+    try:
+        for title, variant in variants:
+            api.reset()
+            # общий лимит бота поднят до overdrive и сброшен после 429 прошлого варианта:
+            # замеряется собственный Throttle рассылки
+            bot_throttle().set_rate(args.limit * 2)
+            await asyncio.sleep(1)  # окно лимита заглушки пустеет
+            started = time.perf_counter()
+            sent, failed, retries = await variant()
+            elapsed = time.perf_counter() - started
+            print(
+                f"  {title:<9} {sent / elapsed:6.1f} msg/s  sent={sent} failed={failed} "
+                f"retries={retries} 429={api.flood} 502={api.errors} time={elapsed:.1f}s"
+            )
+            if title == "legacy":
+                continue
+            if sent != deliverable:
+                problems.append(f"{title}: delivered {sent} of {deliverable} deliverable messages")
+            if title == "engine":
+                if api.flood:
+                    problems.append(f"engine: hit the flood limit {api.flood} times at {args.rate}/s")
+                if sent / elapsed < args.rate * 0.85:
+                    problems.append(f"engine: {sent / elapsed:.1f} msg/s is below 85% of the {args.rate}/s target")
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+    print("\n🔍 Invariants")
+    for problem in problems:
+        print(f"  ❌ {problem}")
+    if not problems:
+        print("  ✅ engine holds the target rate without 429s; 429s and 502s lose no messages")
+    return 1 if problems else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Broadcast throughput against a fake Bot API server")
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=25.0, help="engine target, messages per second")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=30, help="fake API flood limit, messages per second")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake API response time, seconds")
+    parser.add_argument("--flaky", type=float, default=0.01, help="share of 502 responses")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))
@@ -0,0 +1,182 @@
+"""Бенчмарк сегментов аудитории рассылки.
+
+Создаёт --users пользователей с покупками, балансами, активностью,
+приглашёнными и подписками на поступление, затем для каждого сегмента:
+  * COUNT предпросмотра — время и индексы из плана;
+  * чтение получателей пачками по users.id > cursor, как у исполнителя
+    рассылки, — время, число пачек и совпадение с COUNT.
+Показывает, насколько сегмент меньше всей базы — столько запросов к Bot API
+и времени рассылки экономится.
+
+Запускать ТОЛЬКО против локальной/тестовой БД (настройки берутся из .env):
+скрипт создаёт своих пользователей, категорию, товар и заказы и удаляет их
+по завершении.
+
+    python scripts/bench_broadcast_audience.py --confirm
+    python scripts/bench_broadcast_audience.py --confirm --users 200000
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, insert, select, text
+
+from src.config import settings
+from src.database.database import async_session_maker
+from src.database.models import Category, Order, Product, StockNotification, User
+from src.services.audience import audience_condition, count_audience, make_audience
+from src.services.bot_blocked import reachable_users
+
+TELEGRAM_ID_BASE = 9_700_000_000_000
+
+
+async def seed(session, base: int, users: int, product_id: int) -> None:
+    rng = random.Random(46)
+    now = datetime.now()
+    rows = []
+    for n in range(users):
+        rows.append({
+            "telegram_id": base + n,
+            "first_name": "bench-audience",
+            "balance": rng.choice((0.0,) * 19 + (rng.uniform(1, 5000),)),
+            "last_seen_at": now - timedelta(days=rng.expovariate(1 / 60)) if rng.random() < 0.5 else None,
+        })
+    for start in range(0, users, 10_000):
+        await session.execute(insert(User), rows[start:start + 10_000])
+    ids = (await session.execute(
+        select(User.id).where(User.telegram_id >= base, User.telegram_id < base + users).order_by(User.id)
+    )).scalars().all()
+
+    referrers = rng.sample(ids, len(ids) // 100)
+    for start in range(0, len(ids), 5000):
+        chunk = ids[start:start + 5000]
+        await session.execute(
+            text("UPDATE users SET referred_by = :ref WHERE id = ANY(:ids)"),
+            [{"ref": rng.choice(referrers), "ids": [uid]} for uid in rng.sample(chunk, len(chunk) // 20)],
+        )
+    await session.execute(insert(Order), [
+        {"user_id": uid, "product_id": product_id, "quantity": 1, "price_per_unit": 10.0,
+         "total_amount": 10.0, "status": rng.choice(("ВЫПОЛНЕНО", "ВЫПОЛНЕНО", "ОТМЕНЕНО"))}
+        for uid in rng.sample(ids, len(ids) // 30)
+    ])
+    await session.execute(insert(StockNotification), [
+        {"user_id": uid, "product_id": product_id} for uid in rng.sample(ids, len(ids) // 100)
+    ])
+    await session.commit()
+    for table in ("users", "orders", "stock_notifications"):
+        await session.execute(text(f"ANALYZE {table}"))
+
+
+async def stream(audience: str, batch: int) -> tuple:
+    """Получатели пачками по users.id > cursor, каждая пачка — своя короткая сессия."""
+    cursor, total, batches = 0, 0, 0
+    condition = audience_condition(audience)
+    while True:
+        async with async_session_maker() as session:
+            rows = (await session.execute(
+                select(User.id, User.telegram_id)
+                .where(User.id > cursor, reachable_users(), condition)
+                .order_by(User.id)
+                .limit(batch)
+            )).all()
+        if not rows:
+            return total, batches
+        cursor, total, batches = rows[-1].id, total + len(rows), batches + 1
+
+
+async def plan_indexes(session, audience: str) -> str:
+    stmt = select(func.count(User.id)).where(reachable_users(), audience_condition(audience))
+    compiled = stmt.compile(session.bind, compile_kwargs={"literal_binds": True})
+    plan = "\n".join((await session.execute(text(f"EXPLAIN {compiled}"))).scalars())
+    indexes = sorted({a or b for a, b in re.findall(r"(?:Index Scan|Index Only Scan)(?: Backward)? using (\w+)|Bitmap Index Scan on (\w+)", plan)})
+    seq = sorted(set(re.findall(r"Seq Scan on (\w+)", plan)))
+    return ", ".join(indexes + [f"seq:{name}" for name in seq]) or "-"
+
+
+async def run(args) -> int:
+    base = TELEGRAM_ID_BASE + int(time.time()) % 1_000_000 * 1_000_000
+    async with async_session_maker() as session:
+        category = Category(name=f"bench-audience-{base}")
+        session.add(category)
+        await session.flush()
+        product = Product(name="bench-audience", price=10.0, category_id=category.id)
+        session.add(product)
+        await session.commit()
+        category_id, product_id = category.id, product.id
+
+    problems = []
+    try:
+        started = time.perf_counter()
+        async with async_session_maker() as session:
+            await seed(session, base, args.users, product_id)
+        print(f"🏁 seeded {args.users} users in {time.perf_counter() - started:.1f}s, batch {args.batch}\n")
+
+        segments = [
+            make_audience("all"),
+            make_audience("product", str(product_id)),
+            make_audience("category", str(category_id)),
+            make_audience("balance", "1000"),
+            make_audience("active", "30"),
+            make_audience("referrers"),
+            make_audience("subscribers"),
+        ]
+        everyone = None
+        for audience in segments:
+            async with async_session_maker() as session:
+                started = time.perf_counter()
+                count = await count_audience(session, audience)
+                counted_in = time.perf_counter() - started
+                indexes = await plan_indexes(session, audience)
+            started = time.perf_counter()
+            streamed, batches = await stream(audience, args.batch)
+            streamed_in = time.perf_counter() - started
+            everyone = everyone or count
+            print(
+                f"  {audience.split(':')[0]:<11} {count:>7} users ({count / everyone:6.1%})  "
+                f"COUNT {counted_in * 1000:6.1f}ms  stream {streamed_in * 1000:7.1f}ms in {batches:>3} batches  "
+                f"[{indexes}]"
+            )
+            if streamed != count:
+                problems.append(f"{audience}: streamed {streamed} recipients, COUNT said {count}")
+    finally:
+        async with async_session_maker() as session:
+            bench_users = select(User.id).where(User.telegram_id >= base, User.telegram_id < base + args.users)
+            await session.execute(delete(StockNotification).where(StockNotification.user_id.in_(bench_users)))
+            await session.execute(delete(Order).where(Order.product_id == product_id))
+            await session.execute(delete(User).where(User.telegram_id >= base, User.telegram_id < base + args.users))
+            await session.execute(delete(Product).where(Product.id == product_id))
+            await session.execute(delete(Category).where(Category.id == category_id))
+            await session.commit()
+
+    print("\n🔍 Invariants")
+    for problem in problems:
+        print(f"  ❌ {problem}")
+    if not problems:
+        print("  ✅ every segment streams exactly the recipients its COUNT preview promised")
+    return 1 if problems else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Broadcast audience segments: COUNT preview and keyset streaming")
+    parser.add_argument("--confirm", action="store_true", help="I understand this writes to the configured DB")
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--batch", type=int, default=settings.BROADCAST_BATCH)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.confirm:
+        print(
+            f"⚠️  This benchmark writes to {settings.DATABASE_HOST}:{settings.DATABASE_PORT}/"
+            f"{settings.DATABASE_NAME}. Re-run with --confirm against a local database."
+        )
+        sys.exit(2)
+    sys.exit(asyncio.run(run(args)))
@@ -0,0 +1,103 @@
+"""Бенчмарк медиа-рассылки: загрузка файла каждому получателю против file_id.
+
+Заглушка Bot API из bench_broadcast.py пропускает загрузки через общий канал
+шириной --bandwidth МБ/с (исходящий канал сервера бота). Сравниваются:
+  1. upload  — send_photo с файлом для каждого получателя;
+  2. file_id — как делает бот: файл загружен один раз (сообщением
+     администратора), дальше send_broadcast_message шлёт его file_id через
+     тот же Broadcaster.
+База данных не нужна.
+
+    python scripts/bench_broadcast_media.py
+    python scripts/bench_broadcast_media.py --messages 1000 --size 2000 --bandwidth 10 --rate 25
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.types import BufferedInputFile
+
+from scripts.bench_broadcast import BLOCKED_EVERY, FakeBotAPI, serve
+from src.database.models import BroadcastJob
+from src.services.broadcast import Broadcaster, send_broadcast_message
+from src.utils.rate_limit import bot_throttle
+
+ADMIN_CHAT_ID = 1
+CAPTION = "<b>Новинка!</b> Подробности в каталоге."
+
+
+async def upload_each(bot, chat_ids: list, payload: bytes, rate: float, concurrency: int):
+    """Прежний способ: файл уходит в каждом запросе."""
+    return await Broadcaster(rate=rate, concurrency=concurrency, retry_base=0.2).run(
+        chat_ids,
+        lambda chat_id: bot.send_photo(
+            chat_id, BufferedInputFile(payload, "post.jpg"), caption=CAPTION, parse_mode="HTML",
+        ),
+    )
+
+
+async def by_file_id(bot, chat_ids: list, payload: bytes, rate: float, concurrency: int):
+    # Администратор прислал фото боту — оно загружено один раз, дальше только file_id
+    message = await bot.send_photo(ADMIN_CHAT_ID, BufferedInputFile(payload, "post.jpg"))
+    job = BroadcastJob(message_text=CAPTION, media_type="photo", media_file_id=message.photo[-1].file_id)
+    return await Broadcaster(rate=rate, concurrency=concurrency, retry_base=0.2).run(
+        chat_ids, lambda chat_id: send_broadcast_message(bot, job, chat_id),
+    )
+
+
+async def run(args) -> int:
+    bot_throttle().set_rate(args.rate)
+    api = FakeBotAPI(latency=args.latency, limit=1_000_000, flaky=0.0, upload_rate=args.bandwidth * 2 ** 20)
+    server, bot = await serve(api)
+    payload = os.urandom(args.size * 1024)
+    chat_ids = list(range(2, args.messages + 2))
+    deliverable = sum(1 for chat_id in chat_ids if chat_id % BLOCKED_EVERY)
+    print(
+        f"🏁 {args.messages} photos of {args.size} KB, uplink {args.bandwidth} MB/s, "
+        f"target {args.rate}/s, {args.concurrency} senders"
+    )
+
+    problems = []
+    try:
+        for title, variant in (("upload", upload_each), ("file_id", by_file_id)):
+            api.reset()
+            started = time.perf_counter()
+            stats = await variant(bot, chat_ids, payload, args.rate, args.concurrency)
+            elapsed = time.perf_counter() - started
+            print(
+                f"  {title:<8} {stats.sent / elapsed:6.1f} msg/s  sent={stats.sent} failed={stats.failed}  "
+                f"uploads={api.uploads} uploaded={api.uploaded_bytes / 2 ** 20:7.1f} MB  time={elapsed:5.1f}s"
+            )
+            if stats.sent != deliverable:
+                problems.append(f"{title}: delivered {stats.sent} of {deliverable}")
+            if title == "file_id" and api.uploads != 1:
+                problems.append(f"file_id: {api.uploads} uploads instead of one")
+    finally:
+        await bot.session.close()
+        await server.cleanup()
+
+    print("\n🔍 Invariants")
+    for problem in problems:
+        print(f"  ❌ {problem}")
+    if not problems:
+        print("  ✅ the media broadcast uploads the file once and delivers every message")
+    return 1 if problems else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Media broadcast: per-recipient upload vs file_id reuse")
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--size", type=int, default=500, help="file size, KB")
+    parser.add_argument("--bandwidth", type=float, default=5.0, help="uplink to the Bot API, MB/s")
+    parser.add_argument("--rate", type=float, default=25.0, help="Broadcaster target, messages per second")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake API response time, seconds")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))
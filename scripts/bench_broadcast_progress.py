@@ -0,0 +1,162 @@
+"""Бенчмарк прогресса и отмены фоновой рассылки.
+
+Рассылка идёт через заглушку Bot API из bench_broadcast.py исполнителем
+broadcast_jobs, как в боте. Проверяется:
+  * прогресс в сообщении-статусе обновляется не чаще
+    BROADCAST_PROGRESS_INTERVAL и показывает оценку оставшегося времени;
+  * «⛔ Остановить» в той же реплике (cancel_broadcast_job) прерывает отправку
+    сразу — досылаются только уже начатые сообщения;
+  * отмена из другой реплики (только запись CANCELLED в БД) замечается при
+    следующей проверке прогресса;
+  * итог «Рассылка остановлена» приходит в сообщение-статус, статус задачи
+    остаётся CANCELLED, занятых и не записанных доставок не остаётся.
+
+Запускать ТОЛЬКО против локальной/тестовой БД (настройки берутся из .env):
+скрипт создаёт своих пользователей и задачи рассылки и удаляет их по
+завершении. Рассылка уходит всем достижимым пользователям БД — но только в
+заглушку.
+
+    python scripts/bench_broadcast_progress.py --confirm
+    python scripts/bench_broadcast_progress.py --confirm --users 10000 --rate 500 --interval 1
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, insert, select, update
+
+from scripts.bench_broadcast import FakeBotAPI, serve
+from src.config import settings
+from src.database.database import async_session_maker
+from src.database.models import BroadcastDelivery, BroadcastJob, User
+from src.services.broadcast import broadcast_jobs, cancel_broadcast_job, create_broadcast_job
+from src.utils.rate_limit import bot_throttle
+
+TELEGRAM_ID_BASE = 9_600_000_000_000
+STATUS_CHAT_ID = 1
+
+
+async def cancel_remotely(job_id: int) -> None:
+    """Отмена из другой реплики: только запись в БД, без вызова исполнителя."""
+    async with async_session_maker() as session:
+        await session.execute(
+            update(BroadcastJob).where(BroadcastJob.id == job_id).values(status="CANCELLED", finished_at=func.now())
+        )
+        await session.commit()
+
+
+async def scenario(api: FakeBotAPI, title: str, remote: bool, args) -> list:
+    api.reset()
+    async with async_session_maker() as session:
+        job = await create_broadcast_job(
+            session, "bench", created_by=0, status_chat_id=STATUS_CHAT_ID, status_message_id=1,
+        )
+    while api.accepted < job.total // 3:
+        await asyncio.sleep(0.05)
+
+    cancelled_at = time.monotonic()
+    accepted = api.accepted
+    if remote:
+        await cancel_remotely(job.id)
+    else:
+        async with async_session_maker() as session:
+            await cancel_broadcast_job(session, job.id)
+    while not any("остановлена" in text for _, text in api.edits):
+        await asyncio.sleep(0.02)
+    stopped_in = time.monotonic() - cancelled_at
+    await asyncio.sleep(0.5)
+
+    async with async_session_maker() as session:
+        job = await session.get(BroadcastJob, job.id)
+        sending = (await session.execute(
+            select(func.count()).where(BroadcastDelivery.job_id == job.id, BroadcastDelivery.status == "SENDING")
+        )).scalar()
+    progress = [(at, text) for at, text in api.edits if "идёт" in text]
+    gaps = [b[0] - a[0] for a, b in zip(progress, progress[1:])]
+    after_cancel = api.accepted - accepted
+    print(
+        f"  {title:<7} stopped in {stopped_in:4.1f}s, {after_cancel} sends after cancel, "
+        f"{len(progress)} progress edits (min gap {min(gaps, default=0):.1f}s), "
+        f"job {job.status} sent={job.sent} failed={job.failed} of {job.total}"
+    )
+    if progress:
+        print("          last progress: " + progress[-1][1].replace("\n", " | "))
+
+    problems = []
+    if not progress or "Осталось" not in progress[-1][1]:
+        problems.append(f"{title}: no progress with ETA was shown")
+    if gaps and min(gaps) < args.interval * 0.8:
+        problems.append(f"{title}: progress edited every {min(gaps):.2f}s, interval is {args.interval}s")
+    if job.status != "CANCELLED":
+        problems.append(f"{title}: job ended as {job.status}")
+    if sending:
+        problems.append(f"{title}: {sending} deliveries left in SENDING")
+    # Уже начатые отправки плюс начатые, пока коммитится отмена (и до проверки в другой реплике)
+    budget = args.concurrency + args.rate * (args.interval if remote else 0.1)
+    if after_cancel > budget:
+        problems.append(f"{title}: {after_cancel} messages sent after cancel (budget {budget:.0f})")
+    return problems
+
+
+async def run(args) -> int:
+    settings.BROADCAST_RATE = args.rate
+    bot_throttle().set_rate(args.rate)  # заглушка API без лимита — общий лимит бота не мешает замеру
+    settings.BROADCAST_CONCURRENCY = args.concurrency
+    settings.BROADCAST_PROGRESS_INTERVAL = args.interval
+    api = FakeBotAPI(latency=0.02, limit=1_000_000, flaky=0.0)
+    server, bot = await serve(api)
+
+    base = TELEGRAM_ID_BASE + int(time.time()) % 1_000_000 * 1_000_000
+    async with async_session_maker() as session:
+        await session.execute(insert(User), [
+            {"telegram_id": base + n, "first_name": "bench-progress"} for n in range(args.users)
+        ])
+        await session.commit()
+    print(f"🏁 {args.users} users at {args.rate}/s, progress every {args.interval}s")
+
+    broadcast_jobs.poll_interval = 0.2
+    await broadcast_jobs.start(bot)
+    problems = []
+    try:
+        problems += await scenario(api, "local", remote=False, args=args)
+        problems += await scenario(api, "remote", remote=True, args=args)
+    finally:
+        await broadcast_jobs.stop()
+        async with async_session_maker() as session:
+            await session.execute(delete(BroadcastJob).where(BroadcastJob.created_by == 0, BroadcastJob.message_text == "bench"))
+            await session.execute(delete(User).where(User.telegram_id >= base, User.telegram_id < base + args.users))
+            await session.commit()
+        await bot.session.close()
+        await server.cleanup()
+
+    print("\n🔍 Invariants")
+    for problem in problems:
+        print(f"  ❌ {problem}")
+    if not problems:
+        print("  ✅ throttled progress with ETA; cancel stops the job and reports it in the status message")
+    return 1 if problems else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Broadcast progress updates and cancellation")
+    parser.add_argument("--confirm", action="store_true", help="I understand this writes to the configured DB")
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--rate", type=float, default=200.0, help="messages per second (the fake API has no limit)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=1.0, help="BROADCAST_PROGRESS_INTERVAL, seconds")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.confirm:
+        print(
+            f"⚠️  This benchmark writes to {settings.DATABASE_HOST}:{settings.DATABASE_PORT}/"
+            f"{settings.DATABASE_NAME}. Re-run with --confirm against a local database."
+        )
+        sys.exit(2)
+    sys.exit(asyncio.run(run(args)))
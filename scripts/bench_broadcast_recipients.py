@@ -0,0 +1,162 @@
+"""Бенчмарк источника получателей рассылки: память и соединения пула.
+
+  1. legacy — как прежний mass_broadcast_process: select(User).scalars().all()
+     в сессии хендлера, которая держит соединение всю рассылку;
+  2. job    — BroadcastJobRunner.run_job: telegram_id пачками по users.id в
+     коротких сессиях, итоги пачек пишутся по ходу.
+Отправка подменена заглушкой без сети и без лимита скорости — измеряется
+только работа с получателями: пик памяти Python (tracemalloc), максимум
+одновременно занятых соединений пула и суммарное время их удержания. Для
+job оба показателя не должны расти с числом пользователей.
+
+Запускать ТОЛЬКО против локальной/тестовой БД (настройки берутся из .env):
+скрипт создаёт своих пользователей и задачи рассылки и удаляет их по
+завершении.
+
+    python scripts/bench_broadcast_recipients.py --confirm
+    python scripts/bench_broadcast_recipients.py --confirm --users 5000 50000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, event, insert, select
+
+from src.config import settings
+from src.database.database import async_session_maker, engine
+from src.database.models import BroadcastJob, User
+from src.services.broadcast import Broadcaster, BroadcastJobRunner, create_broadcast_job
+from src.utils.rate_limit import bot_throttle
+
+TELEGRAM_ID_BASE = 9_400_000_000_000
+
+
+class NullBot:
+    """Бот, который ничего не отправляет."""
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        return None
+
+    async def edit_message_text(self, *args, **kwargs) -> None:
+        return None
+
+
+class PoolWatch:
+    """Сколько соединений пула занято одновременно и как долго они удерживались."""
+
+    def __init__(self):
+        self.busy = 0
+        self.max_busy = 0
+        self.held = 0.0
+        self._since = {}
+        event.listen(engine.sync_engine, "checkout", self._checkout)
+        event.listen(engine.sync_engine, "checkin", self._checkin)
+
+    def reset(self) -> None:
+        self.max_busy = self.busy
+        self.held = 0.0
+
+    def _checkout(self, dbapi_conn, record, proxy) -> None:
+        self.busy += 1
+        self.max_busy = max(self.max_busy, self.busy)
+        self._since[id(record)] = time.perf_counter()
+
+    def _checkin(self, dbapi_conn, record) -> None:
+        self.busy -= 1
+        started = self._since.pop(id(record), None)
+        if started is not None:
+            self.held += time.perf_counter() - started
+
+
+async def legacy(bot: NullBot) -> None:
+    """Прежний путь (для сравнения): все User в памяти, сессия открыта до конца."""
+    async with async_session_maker() as session:
+        users = (await session.execute(select(User).where(User.is_blocked == False))).scalars().all()
+        await Broadcaster().run(
+            [user.telegram_id for user in users],
+            lambda chat_id: bot.send_message(chat_id, "bench"),
+        )
+
+
+async def job(bot: NullBot, batch: int) -> None:
+    async with async_session_maker() as session:
+        created = await create_broadcast_job(session, "bench", created_by=0)
+    runner = BroadcastJobRunner(poll_interval=1.0, lease_seconds=300, batch_size=batch)
+    runner.bot = bot
+    claimed = await runner._claim_job()
+    if claimed is None or claimed.id != created.id:
+        raise RuntimeError("another broadcast job is pending in this database")
+    await runner.run_job(claimed)
+
+
+async def run(args) -> int:
+    settings.BROADCAST_RATE = 1_000_000
+    bot_throttle().set_rate(1_000_000)
+    settings.BROADCAST_CONCURRENCY = args.concurrency
+    bot = NullBot()
+    watch = PoolWatch()
+    base = TELEGRAM_ID_BASE + int(time.time()) % 1_000_000 * 1_000_000
+    created = 0
+    rows = {}
+    print(f"🏁 users {args.users}, batch {args.batch}, concurrency {args.concurrency}")
+    try:
+        for users in sorted(args.users):
+            async with async_session_maker() as session:
+                await session.execute(insert(User), [
+                    {"telegram_id": base + n, "first_name": "bench-recipients"} for n in range(created, users)
+                ])
+                await session.commit()
+            created = users
+            for title, variant in (("legacy", lambda: legacy(bot)), ("job", lambda: job(bot, args.batch))):
+                watch.reset()
+                tracemalloc.start()
+                started = time.perf_counter()
+                await variant()
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                rows[(title, users)] = peak
+                print(
+                    f"  {title:<6} users={users:<7} peak={peak / 2 ** 20:7.1f} MiB  "
+                    f"max connections={watch.max_busy}  held={watch.held:6.2f}s  time={elapsed:6.2f}s"
+                )
+    finally:
+        async with async_session_maker() as session:
+            await session.execute(delete(BroadcastJob).where(BroadcastJob.created_by == 0, BroadcastJob.message_text == "bench"))
+            await session.execute(delete(User).where(User.telegram_id >= base, User.telegram_id < base + created))
+            await session.commit()
+        await engine.dispose()
+
+    smallest, largest = min(args.users), max(args.users)
+    growth = rows[("job", largest)] / max(1, rows[("job", smallest)])
+    print("\n🔍 Invariants")
+    if len(args.users) > 1 and growth > 1.5:
+        print(f"  ❌ job peak memory grew {growth:.1f}x from {smallest} to {largest} users")
+        return 1
+    print(f"  ✅ job peak memory x{growth:.2f} from {smallest} to {largest} users")
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Memory and pool usage of broadcast recipient loading")
+    parser.add_argument("--confirm", action="store_true", help="I understand this writes to the configured DB")
+    parser.add_argument("--users", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--batch", type=int, default=settings.BROADCAST_BATCH)
+    parser.add_argument("--concurrency", type=int, default=20)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.confirm:
+        print(
+            f"⚠️  This benchmark writes to {settings.DATABASE_HOST}:{settings.DATABASE_PORT}/"
+            f"{settings.DATABASE_NAME}. Re-run with --confirm against a local database."
+        )
+        sys.exit(2)
+    sys.exit(asyncio.run(run(args)))
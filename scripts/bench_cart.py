@@ -0,0 +1,214 @@
+"""Бенчмарк покупки нескольких товаров: по одному заказу против корзины.
+
+  1. single — K отдельных покупок: place_order + COMMIT, затем
+     pay_order_from_balance на каждый заказ (K транзакций брони, K списаний);
+  2. cart   — корзина из тех же K строк: checkout_cart (одна транзакция на все
+     строки) и pay_cart_from_balance (одно списание).
+Корзины заполняются заранее и в замер не входят. Для каждого способа —
+корзины в секунду, задержки, SQL-операторы и записи журнала баланса на
+корзину; для оплаты через провайдера последнее равно числу платежей.
+
+Запускать ТОЛЬКО против локальной/тестовой БД (настройки берутся из .env):
+скрипт создаёт свои категорию, товары, аккаунты и пользователей и удаляет их
+по завершении.
+
+    python scripts/bench_cart.py --confirm
+    python scripts/bench_cart.py --confirm --baskets 500 --items 8 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.config import settings
+from src.database.models import Account, BalanceLedger, Cart, CartItem, Category, NotificationOutbox, Order, Product, User
+from src.services.cart_service import checkout_cart, pay_cart_from_balance, set_cart_item
+from src.services.order_service import pay_order_from_balance, place_order
+
+TELEGRAM_ID_BASE = 9_200_000_000_000
+
+
+async def single_basket(session: AsyncSession, user: User, lines: list) -> None:
+    for product_id, quantity in lines:
+        order = await place_order(session, user.telegram_id, product_id, quantity)
+        await session.commit()
+        if not await pay_order_from_balance(session, order, user):
+            raise RuntimeError(f"order #{order.id} was not paid")
+
+
+async def cart_basket(session: AsyncSession, user: User, lines: list) -> None:
+    cart_id, _ = await checkout_cart(session, user)
+    if not await pay_cart_from_balance(session, cart_id, user):
+        raise RuntimeError(f"cart #{cart_id} was not paid")
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] if ordered else 0.0
+
+
+async def run(args) -> int:
+    engine = create_async_engine(
+        settings.DATABASE_URL, pool_size=args.concurrency, max_overflow=0, pool_timeout=120
+    )
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    statements = 0
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _count(*_):
+        nonlocal statements
+        statements += 1
+
+    tag = datetime.now().strftime("%Y%m%d%H%M%S")
+    stock = args.baskets * 2 * args.max_quantity
+    async with session_maker() as session:
+        category = Category(name=f"bench-cart-{tag}")
+        session.add(category)
+        await session.flush()
+        products = [
+            Product(name=f"bench-cart-{tag}-{n}", price=10.0 + n, category_id=category.id, stock_count=stock)
+            for n in range(args.products)
+        ]
+        session.add_all(products)
+        await session.flush()
+        for product in products:
+            await session.execute(insert(Account), [
+                {"product_id": product.id, "account_data": f"bench:{tag}:{product.id}:{n}"} for n in range(stock)
+            ])
+        base = TELEGRAM_ID_BASE + int(time.time()) % 1_000_000 * 10_000
+        users = [
+            User(telegram_id=base + n, first_name=f"bench-{tag}", balance=1_000_000.0)
+            for n in range(args.baskets * 2)
+        ]
+        session.add_all(users)
+        await session.commit()
+        category_id = category.id
+        product_ids = [p.id for p in products]
+        user_ids = [u.id for u in users]
+
+    # Одинаковый состав корзин для обоих способов
+    baskets = [
+        [(pid, random.randint(1, args.max_quantity)) for pid in random.sample(product_ids, args.items)]
+        for _ in range(args.baskets)
+    ]
+    async with session_maker() as session:
+        for user_id, lines in zip(user_ids[args.baskets:], baskets):
+            for product_id, quantity in lines:
+                await set_cart_item(session, user_id, product_id, quantity)
+        await session.commit()
+
+    problems = []
+    print(
+        f"🏁 {args.baskets} baskets of {args.items} products per variant, "
+        f"concurrency {args.concurrency}, up to {args.max_quantity} accounts per line"
+    )
+    try:
+        for index, (title, buy) in enumerate((("single", single_basket), ("cart", cart_basket))):
+            variant_user_ids = user_ids[index * args.baskets:(index + 1) * args.baskets]
+            semaphore = asyncio.Semaphore(args.concurrency)
+            latencies, errors = [], 0
+
+            async def one(user_id: int, lines: list) -> None:
+                nonlocal errors
+                async with semaphore:
+                    started = time.perf_counter()
+                    try:
+                        async with session_maker() as session:
+                            user = await session.get(User, user_id)
+                            await buy(session, user, lines)
+                    except Exception:
+                        errors += 1
+                        return
+                    latencies.append(time.perf_counter() - started)
+
+            statements = 0
+            started = time.perf_counter()
+            await asyncio.gather(*(one(u, lines) for u, lines in zip(variant_user_ids, baskets)))
+            elapsed = time.perf_counter() - started
+            async with session_maker() as session:
+                debits = (await session.execute(
+                    select(func.count(BalanceLedger.id)).where(BalanceLedger.user_id.in_(variant_user_ids))
+                )).scalar()
+            print(
+                f"  {title:<6} {len(latencies) / elapsed:7.0f} baskets/s  "
+                f"p50={_percentile(latencies, 50) * 1000:6.1f}ms p99={_percentile(latencies, 99) * 1000:6.1f}ms "
+                f"statements/basket={statements / max(1, len(latencies)):.1f} "
+                f"debits/basket={debits / max(1, len(latencies)):.1f} errors={errors}"
+            )
+            if errors:
+                problems.append(f"{title}: {errors} failed baskets")
+
+        async with session_maker() as session:
+            mismatched = (await session.execute(
+                select(func.count()).select_from(
+                    select(Order.id)
+                    .outerjoin(Account, Account.order_id == Order.id)
+                    .where(Order.product_id.in_(product_ids))
+                    .group_by(Order.id, Order.quantity)
+                    .having(func.count(Account.id) != Order.quantity)
+                    .subquery()
+                )
+            )).scalar()
+            unpaid = (await session.execute(
+                select(func.count(Order.id)).where(Order.product_id.in_(product_ids), Order.status != "ВЫПОЛНЕНО")
+            )).scalar()
+        if mismatched:
+            problems.append(f"{mismatched} orders do not own exactly `quantity` accounts")
+        if unpaid:
+            problems.append(f"{unpaid} orders left unpaid")
+
+        print("\n🔍 Invariants")
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        if not problems:
+            print("  ✅ every order is paid and owns exactly its quantity of accounts")
+    finally:
+        async with session_maker() as session:
+            cart_ids = select(Cart.id).where(Cart.user_id.in_(user_ids))
+            await session.execute(delete(BalanceLedger).where(BalanceLedger.user_id.in_(user_ids)))
+            await session.execute(delete(Account).where(Account.product_id.in_(product_ids)))
+            await session.execute(delete(Order).where(Order.user_id.in_(user_ids)))
+            await session.execute(delete(CartItem).where(CartItem.cart_id.in_(cart_ids)))
+            await session.execute(delete(Cart).where(Cart.user_id.in_(user_ids)))
+            await session.execute(delete(NotificationOutbox).where(
+                NotificationOutbox.product.in_(select(Product.name).where(Product.id.in_(product_ids)))
+            ))
+            await session.execute(delete(Product).where(Product.id.in_(product_ids)))
+            await session.execute(delete(Category).where(Category.id == category_id))
+            await session.execute(delete(User).where(User.id.in_(user_ids)))
+            await session.commit()
+        await engine.dispose()
+    return 1 if problems else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare buying products one by one with a single cart checkout")
+    parser.add_argument("--confirm", action="store_true", help="I understand this writes to the configured DB")
+    parser.add_argument("--baskets", type=int, default=200, help="baskets per variant")
+    parser.add_argument("--items", type=int, default=5, help="products per basket")
+    parser.add_argument("--products", type=int, default=10, help="products in the catalog")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--max-quantity", type=int, default=3)
+    args = parser.parse_args()
+    if args.items > args.products:
+        parser.error("--items must not exceed --products")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.confirm:
+        print(
+            f"⚠️  This benchmark writes to {settings.DATABASE_HOST}:{settings.DATABASE_PORT}/"
+            f"{settings.DATABASE_NAME}. Re-run with --confirm against a local database."
+        )
+        sys.exit(2)
+    sys.exit(asyncio.run(run(args)))
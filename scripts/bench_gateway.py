@@ -0,0 +1,157 @@
+"""Бенчмарк HTTP-клиента платёжных шлюзов на локальном stub-сервере.
+
+Поднимает aiohttp-заглушку API платёжной системы и сравнивает:
+  1. новый ClientSession на каждый вызов (как было раньше);
+  2. долгоживущий GatewayClient с keep-alive пулом.
+Затем проверяет повторы при нестабильном провайдере и размыкание circuit
+breaker при лежащем. База данных не нужна.
+
+    python scripts/bench_gateway.py
+    python scripts/bench_gateway.py --requests 5000 --concurrency 100 --latency 0.005
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import ClientSession, web
+
+from src.services.gateway import CircuitBreaker, GatewayClient, GatewayError, GatewayUnavailable
+
+
+class Stub:
+    """Заглушка API: задержка ответа, доля ошибок 503, режим «лежит»."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.failure_rate = 0.0
+        self.down = False
+        self.hits = 0
+
+    async def get_payment(self, request: web.Request) -> web.Response:
+        self.hits += 1
+        await asyncio.sleep(self.latency)
+        if self.down or random.random() < self.failure_rate:
+            return web.json_response({"error": "unavailable"}, status=503)
+        return web.json_response({"id": request.match_info["payment_id"], "status": "pending"})
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] if ordered else 0.0
+
+
+async def _measure(call, requests: int, concurrency: int) -> tuple:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(n: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await call(n)
+            except GatewayError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(requests)))
+    return time.perf_counter() - started, latencies, errors
+
+
+def _report(title: str, elapsed: float, latencies: list, errors: int, extra: str = "") -> None:
+    print(
+        f"  {title:<28} {len(latencies) / elapsed:8.0f} req/s  "
+        f"p50={_percentile(latencies, 50) * 1000:6.1f}ms p99={_percentile(latencies, 99) * 1000:6.1f}ms "
+        f"errors={errors} {extra}"
+    )
+
+
+async def run(args) -> None:
+    stub = Stub(args.latency)
+    app = web.Application()
+    app.router.add_get("/v3/payments/{payment_id}", stub.get_payment)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    base_url = f"http://127.0.0.1:{args.port}/v3"
+
+    def client(retries: int = 2, threshold: int = 5, reset: float = 30.0) -> GatewayClient:
+        return GatewayClient(
+            "stub", base_url, timeout=5, connect_timeout=2, pool_limit=args.concurrency,
+            retries=retries, backoff_base=0.01, breaker=CircuitBreaker(threshold, reset),
+        )
+
+    print(f"🏁 {args.requests} GET requests, concurrency {args.concurrency}, stub latency {args.latency * 1000:.0f}ms")
+
+    async def session_per_call(n: int) -> None:
+        async with ClientSession() as session:
+            async with session.get(f"{base_url}/payments/p{n}") as resp:
+                await resp.json()
+
+    _report("new session per call", *await _measure(session_per_call, args.requests, args.concurrency))
+
+    pooled = client()
+    await pooled.start()
+
+    async def pooled_call(n: int) -> None:
+        await pooled.request("GET", f"/payments/p{n}", endpoint="get_payment", idempotent=True)
+
+    _report("pooled GatewayClient", *await _measure(pooled_call, args.requests, args.concurrency))
+
+    print(f"\n🌩  flaky provider ({args.failure_rate:.0%} of responses are 503)")
+    stub.failure_rate = args.failure_rate
+    flaky = client(retries=2, threshold=10_000)
+    await flaky.start()
+
+    async def flaky_call(n: int) -> None:
+        await flaky.request("GET", f"/payments/p{n}", endpoint="get_payment", idempotent=True)
+
+    elapsed, latencies, errors = await _measure(flaky_call, args.requests, args.concurrency)
+    _report("with retries", elapsed, latencies, errors, f"retries={flaky.metrics()['get_payment']['retries']}")
+    await flaky.close()
+
+    print("\n⛔ provider down")
+    stub.failure_rate = 0.0
+    stub.down = True
+    stub.hits = 0
+    breaker = client(retries=0, threshold=5, reset=60)
+    await breaker.start()
+    rejected = 0
+
+    async def down_call(n: int) -> None:
+        nonlocal rejected
+        try:
+            await breaker.request("GET", f"/payments/p{n}", endpoint="get_payment", idempotent=True)
+        except GatewayUnavailable:
+            rejected += 1
+            raise
+
+    _report(
+        "circuit breaker", *await _measure(down_call, args.requests, args.concurrency),
+        f"reached provider={stub.hits} short-circuited={rejected} state={breaker.breaker.state}",
+    )
+    await breaker.close()
+
+    print("\n📊 pooled client metrics:", pooled.metrics())
+    await pooled.close()
+    await runner.cleanup()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the payment gateway HTTP client against a stub")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.002, help="stub response delay, s")
+    parser.add_argument("--failure-rate", type=float, default=0.3)
+    parser.add_argument("--port", type=int, default=8090)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
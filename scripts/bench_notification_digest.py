@@ -0,0 +1,212 @@
+"""Бенчмарк сводки уведомлений администраторам во время распродажи.
+
+Поток покупок (на каждую — notify_new_order и notify_admins_about_purchase в
+транзакции «покупки») и регистраций ставится в notification_outbox, отправляет
+OutboxWorker через заглушку Bot API из bench_broadcast.py без
+NOTIFICATIONS_CHAT_ID, то есть каждому из --admins администраторов:
+  1. legacy — NOTIFY_DIGEST_INTERVAL = 0, по сообщению на событие;
+  2. digest — сводка раз в --interval секунд или по --max-events событий.
+В конце распродажи покупается последняя единица товара — это важное событие
+должно уйти сразу, не дожидаясь сводки. Сравнивается число запросов к API.
+
+Запускать ТОЛЬКО против локальной/тестовой БД (настройки берутся из .env):
+скрипт создаёт своего пользователя, категорию, товары и аккаунты и удаляет их
+и свои строки outbox по завершении. Заказы в БД не пишутся.
+
+    python scripts/bench_notification_digest.py --confirm
+    python scripts/bench_notification_digest.py --confirm --orders 1000 --duration 20 --admins 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, insert, select
+
+from scripts.bench_broadcast import FakeBotAPI, serve
+from src.config import settings
+from src.database.database import async_session_maker
+from src.database.models import Account, Category, NotificationOutbox, Order, Product, User
+from src.services import outbox
+from src.services.notifications import notify_admins_about_purchase, notify_new_order, notify_user_registration
+from src.services.outbox import OutboxWorker
+from src.utils.rate_limit import bot_throttle
+
+TELEGRAM_ID_BASE = 9_700_000_000_000
+DIGEST_EVENTS = re.compile(r"— (\d+) событий")
+
+
+async def sale(user: User, products: list, args) -> None:
+    """Распродажа: --orders покупок за --duration секунд, каждая — своя транзакция."""
+    pause = args.duration / args.orders
+    for n in range(args.orders):
+        product = random.choice(products)
+        quantity = random.randint(1, 3)
+        order = Order(
+            id=n + 1, user_id=user.id, product_id=product.id, quantity=quantity,
+            price_per_unit=product.price, total_amount=product.price * quantity,
+            status="ВЫПОЛНЕНО", payment_method="balance",
+        )
+        async with async_session_maker() as session:
+            await notify_new_order(session, order)
+            await notify_admins_about_purchase(session, order)
+            if n % 5 == 0:
+                await notify_user_registration(session, user)
+            await session.commit()
+        await asyncio.sleep(pause)
+
+
+async def pending(first_id: int) -> int:
+    async with async_session_maker() as session:
+        return (await session.execute(
+            select(func.count()).where(NotificationOutbox.id > first_id, NotificationOutbox.status == "PENDING")
+        )).scalar()
+
+
+async def run(args) -> int:
+    settings.NOTIFICATIONS_CHAT_ID = ""
+    settings.ADMIN_IDS = ",".join(str(n) for n in range(1, args.admins + 1))
+    api = FakeBotAPI(latency=args.latency, limit=1_000_000, flaky=0.0)
+    server, bot = await serve(api)
+
+    texts = []
+    send = bot.send_message
+
+    async def recording_send(chat_id, text, **kwargs):
+        texts.append(text)
+        return await send(chat_id, text, **kwargs)
+
+    bot.send_message = recording_send
+
+    tag = TELEGRAM_ID_BASE + int(time.time()) % 1_000_000
+    async with async_session_maker() as session:
+        first_id = (await session.execute(select(func.coalesce(func.max(NotificationOutbox.id), 0)))).scalar()
+        user = User(telegram_id=tag, first_name="bench-digest", username="bench_digest")
+        category = Category(name=f"bench-digest-{tag}")
+        session.add_all([user, category])
+        await session.flush()
+        products = [
+            Product(name=f"bench-digest-{n}", price=50.0 * (n + 1), category_id=category.id, stock_count=1000)
+            for n in range(args.products)
+        ]
+        last = Product(name="bench-digest-last", price=10.0, category_id=category.id, stock_count=0)
+        session.add_all(products + [last])
+        await session.flush()
+        # Остаток для уведомлений — непроданные аккаунты; у last их нет
+        await session.execute(insert(Account), [
+            {"product_id": product.id, "account_data": f"bench-digest-{tag}-{product.id}-{n}"}
+            for product in products for n in range(10)
+        ])
+        await session.commit()
+    print(
+        f"🏁 {args.orders} purchases in {args.duration:.0f}s across {args.products} products, "
+        f"{args.admins} admins, API latency {args.latency * 1000:.0f}ms"
+    )
+
+    bot_throttle().set_rate(1000)
+    problems = []
+    try:
+        for title, interval in (("legacy", 0.0), ("digest", args.interval)):
+            worker = outbox.outbox_worker = OutboxWorker(
+                poll_interval=0.5, rate=1000, batch_size=settings.OUTBOX_BATCH, lease_seconds=60,
+                max_attempts=3, retry_base=0.5, retry_max=2,
+                digest_interval=interval, digest_max_events=args.max_events,
+            )
+            await worker.start(bot)
+            api.reset()
+            texts.clear()
+            await sale(user, products, args)
+
+            # Последняя единица товара: уведомление уходит сразу, сводка ещё копится
+            before = api.accepted
+            async with async_session_maker() as session:
+                order = Order(
+                    id=args.orders + 1, user_id=user.id, product_id=last.id, quantity=1,
+                    price_per_unit=last.price, total_amount=last.price, status="ВЫПОЛНЕНО",
+                )
+                await notify_admins_about_purchase(session, order)
+                await session.commit()
+            started = time.perf_counter()
+            while api.accepted - before < args.admins and time.perf_counter() - started < 2:
+                await asyncio.sleep(0.02)
+            urgent_after = time.perf_counter() - started
+            urgent = api.accepted - before
+
+            while await pending(first_id) and time.perf_counter() - started < 300:
+                await asyncio.sleep(0.2)
+            drained = time.perf_counter() - started
+            await worker.stop()
+            async with async_session_maker() as session:
+                rows = (await session.execute(
+                    select(func.count()).where(NotificationOutbox.id > first_id)
+                )).scalar()
+                await session.execute(delete(NotificationOutbox).where(NotificationOutbox.id > first_id))
+                await session.commit()
+
+            delivered = sum(int(m.group(1)) if (m := DIGEST_EVENTS.search(t)) else 1 for t in texts)
+            print(
+                f"  {title:<6} outbox rows={rows:<5} API requests={api.accepted:<5} "
+                f"urgent delivered in {urgent_after * 1000:.0f}ms, queue drained {drained:.1f}s after the sale"
+            )
+            if urgent != args.admins:
+                problems.append(f"{title}: urgent purchase reached {urgent} of {args.admins} admins within 2s")
+            if delivered != rows:
+                problems.append(f"{title}: messages cover {delivered} of {rows} outbox rows")
+            if title == "legacy":
+                legacy_requests = api.accepted
+            elif api.accepted * 10 > legacy_requests:
+                problems.append(f"digest: {api.accepted} requests is not 10x fewer than {legacy_requests}")
+            elif not any(t.startswith("📊") and "bench-digest-0" in t for t in texts):
+                problems.append("digest: no per-product totals in the digest")
+        if not problems:
+            print(f"\n📨 sample digest:\n{next(t for t in texts if t.startswith('📊'))}")
+
+        print("\n🔍 Invariants")
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        if not problems:
+            print(
+                f"  ✅ {legacy_requests} → {api.accepted} API requests; every event is in a digest; "
+                f"the last-unit purchase skips the digest"
+            )
+    finally:
+        await outbox.outbox_worker.stop()
+        async with async_session_maker() as session:
+            await session.execute(delete(NotificationOutbox).where(NotificationOutbox.id > first_id))
+            await session.execute(delete(Account).where(Account.product_id.in_([p.id for p in products])))
+            await session.execute(delete(Product).where(Product.category_id == category.id))
+            await session.execute(delete(Category).where(Category.id == category.id))
+            await session.execute(delete(User).where(User.id == user.id))
+            await session.commit()
+        await bot.session.close()
+        await server.cleanup()
+    return 1 if problems else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Admin notification digest during a sale")
+    parser.add_argument("--confirm", action="store_true", help="I understand this writes to the configured DB")
+    parser.add_argument("--orders", type=int, default=300)
+    parser.add_argument("--duration", type=float, default=10.0, help="sale length, seconds")
+    parser.add_argument("--products", type=int, default=5)
+    parser.add_argument("--admins", type=int, default=3)
+    parser.add_argument("--interval", type=float, default=3.0, help="digest interval, seconds")
+    parser.add_argument("--max-events", type=int, default=settings.NOTIFY_DIGEST_MAX_EVENTS)
+    parser.add_argument("--latency", type=float, default=0.03, help="fake API response time, seconds")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.confirm:
+        print(
+            f"⚠️  This benchmark writes to {settings.DATABASE_HOST}:{settings.DATABASE_PORT}/"
+            f"{settings.DATABASE_NAME}. Re-run with --confirm against a local database."
+        )
+        sys.exit(2)
+    sys.exit(asyncio.run(run(args)))
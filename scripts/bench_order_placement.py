@@ -0,0 +1,192 @@
+"""Бенчмарк размещения заказа: прежний пошаговый путь против place_order.
+
+  1. steps — как раньше в process_quantity: SELECT товара, SELECT пользователя,
+     reserve_accounts (SELECT ... FOR UPDATE SKIP LOCKED + UPDATE), INSERT
+     заказа с flush, UPDATE order_id у аккаунтов, COMMIT и refresh;
+  2. cte   — place_order: один оператор с CTE + COMMIT.
+Для каждого способа — заказы в секунду, задержки и число SQL-операторов на
+заказ. Выигрыш по задержке растёт с RTT до базы: каждый лишний оператор —
+лишний сетевой круг. В конце проверяется, что аккаунты не проданы дважды.
+
+Запускать ТОЛЬКО против локальной/тестовой БД (настройки берутся из .env):
+скрипт создаёт свои категорию, товар, аккаунты и пользователей и удаляет их
+по завершении.
+
+    python scripts/bench_order_placement.py --confirm
+    python scripts/bench_order_placement.py --confirm --orders 5000 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.config import settings
+from src.database.models import Account, Category, NotificationOutbox, Order, Product, User
+from src.services.account_service import reserve_accounts
+from src.services.discount import calculate_total_price
+from src.services.order_service import place_order
+
+TELEGRAM_ID_BASE = 9_100_000_000_000
+
+
+async def steps_order(session: AsyncSession, telegram_id: int, product_id: int, quantity: int) -> Order:
+    """Прежний путь размещения заказа (для сравнения)."""
+    product = (await session.execute(select(Product).where(Product.id == product_id))).scalar_one()
+    user = (await session.execute(select(User).where(User.telegram_id == telegram_id))).scalar_one()
+    discount_percent, total_amount = calculate_total_price(product.price, quantity)
+    reserved = await reserve_accounts(session, product.id, quantity, None)
+    order = Order(
+        user_id=user.id,
+        product_id=product.id,
+        quantity=quantity,
+        price_per_unit=product.price,
+        discount=discount_percent,
+        total_amount=total_amount,
+        status="ОЖИДАЕТ ОПЛАТЫ",
+        reserved_until=datetime.now() + timedelta(minutes=settings.ORDER_RESERVATION_MINUTES),
+    )
+    session.add(order)
+    await session.flush()
+    await session.execute(
+        update(Account).where(Account.id.in_([a.id for a in reserved])).values(order_id=order.id)
+    )
+    await session.commit()
+    await session.refresh(order)
+    return order
+
+
+async def cte_order(session: AsyncSession, telegram_id: int, product_id: int, quantity: int) -> Order:
+    order = await place_order(session, telegram_id, product_id, quantity)
+    await session.commit()
+    return order
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] if ordered else 0.0
+
+
+async def run(args) -> int:
+    engine = create_async_engine(
+        settings.DATABASE_URL, pool_size=args.concurrency, max_overflow=0, pool_timeout=120
+    )
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    statements = 0
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _count(*_):
+        nonlocal statements
+        statements += 1
+
+    tag = datetime.now().strftime("%Y%m%d%H%M%S")
+    stock = args.orders * args.max_quantity * 2
+    async with session_maker() as session:
+        category = Category(name=f"bench-order-{tag}")
+        session.add(category)
+        await session.flush()
+        product = Product(name=f"bench-order-{tag}", price=10.0, category_id=category.id, stock_count=stock)
+        session.add(product)
+        await session.flush()
+        await session.execute(insert(Account), [
+            {"product_id": product.id, "account_data": f"bench:{tag}:{n}"} for n in range(stock)
+        ])
+        base = TELEGRAM_ID_BASE + int(time.time()) % 1_000_000 * 10_000
+        users = [User(telegram_id=base + n, first_name=f"bench-{tag}") for n in range(args.users)]
+        session.add_all(users)
+        await session.commit()
+        category_id, product_id = category.id, product.id
+        telegram_ids = [u.telegram_id for u in users]
+        user_ids = [u.id for u in users]
+
+    problems = []
+    print(f"🏁 {args.orders} orders per variant, concurrency {args.concurrency}, up to {args.max_quantity} accounts each")
+    try:
+        for title, place in (("steps", steps_order), ("cte", cte_order)):
+            semaphore = asyncio.Semaphore(args.concurrency)
+            latencies, errors = [], 0
+
+            async def one(n: int) -> None:
+                nonlocal errors
+                async with semaphore:
+                    started = time.perf_counter()
+                    try:
+                        async with session_maker() as session:
+                            await place(session, random.choice(telegram_ids), product_id, random.randint(1, args.max_quantity))
+                    except Exception:
+                        errors += 1
+                        return
+                    latencies.append(time.perf_counter() - started)
+
+            statements = 0
+            started = time.perf_counter()
+            await asyncio.gather(*(one(n) for n in range(args.orders)))
+            elapsed = time.perf_counter() - started
+            print(
+                f"  {title:<6} {len(latencies) / elapsed:7.0f} orders/s  "
+                f"p50={_percentile(latencies, 50) * 1000:6.1f}ms p99={_percentile(latencies, 99) * 1000:6.1f}ms "
+                f"statements/order={statements / max(1, len(latencies)):.1f} errors={errors}"
+            )
+            if errors:
+                problems.append(f"{title}: {errors} failed orders")
+
+        async with session_maker() as session:
+            mismatched = (await session.execute(
+                select(func.count()).select_from(
+                    select(Order.id)
+                    .outerjoin(Account, Account.order_id == Order.id)
+                    .where(Order.product_id == product_id)
+                    .group_by(Order.id, Order.quantity)
+                    .having(func.count(Account.id) != Order.quantity)
+                    .subquery()
+                )
+            )).scalar()
+        if mismatched:
+            problems.append(f"{mismatched} orders do not own exactly `quantity` accounts")
+
+        print("\n🔍 Invariants")
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        if not problems:
+            print("  ✅ every order owns exactly its quantity of accounts")
+    finally:
+        async with session_maker() as session:
+            await session.execute(delete(Account).where(Account.product_id == product_id))
+            await session.execute(delete(Order).where(Order.product_id == product_id))
+            await session.execute(delete(NotificationOutbox).where(
+                NotificationOutbox.product.in_(select(Product.name).where(Product.id == product_id))
+            ))
+            await session.execute(delete(Product).where(Product.id == product_id))
+            await session.execute(delete(Category).where(Category.id == category_id))
+            await session.execute(delete(User).where(User.id.in_(user_ids)))
+            await session.commit()
+        await engine.dispose()
+    return 1 if problems else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare step-by-step order placement with the single-statement one")
+    parser.add_argument("--confirm", action="store_true", help="I understand this writes to the configured DB")
+    parser.add_argument("--orders", type=int, default=2000, help="orders per variant")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--max-quantity", type=int, default=3)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.confirm:
+        print(
+            f"⚠️  This benchmark writes to {settings.DATABASE_HOST}:{settings.DATABASE_PORT}/"
+            f"{settings.DATABASE_NAME}. Re-run with --confirm against a local database."
+        )
+        sys.exit(2)
+    sys.exit(asyncio.run(run(args)))
@@ -0,0 +1,396 @@
+"""Нагрузочный тест пути покупки DFC Mail.
+
+Сотни параллельных «покупателей» проходят настоящий путь сервисов:
+place_order (резерв аккаунтов + заказ) → cancel_pending_order или
+pay_order_from_balance. Скрипт меряет пропускную способность и задержки,
+считает дедлоки и ожидания блокировок, а в конце проверяет инварианты склада.
+
+Запускать ТОЛЬКО против локальной/тестовой БД (настройки берутся из .env):
+скрипт создаёт свои категорию, товары, аккаунты и пользователей и удаляет их
+по завершении.
+
+    python scripts/bench_purchase.py --confirm
+    python scripts/bench_purchase.py --confirm --buyers 2000 --concurrency 200 --products 1 --stock 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.config import settings
+from src.database.models import Account, BalanceLedger, Category, NotificationOutbox, Order, Product, User
+from src.services.account_service import refresh_stock_counts
+from src.services.order_service import cancel_pending_order, pay_order_from_balance, place_order
+
+DEADLOCK = "40P01"
+SERIALIZATION_FAILURE = "40001"
+LOCK_NOT_AVAILABLE = "55P03"
+
+TELEGRAM_ID_BASE = 9_000_000_000_000
+
+
+class Stats:
+    """Задержки по операциям и счётчики ошибок."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.sold_out = 0
+        self.insufficient_funds = 0
+        self.status_conflicts = 0
+
+    def record(self, op: str, started: float) -> None:
+        self.latencies[op].append(time.perf_counter() - started)
+
+    def record_error(self, op: str, exc: Exception) -> None:
+        sqlstate = getattr(getattr(exc, "orig", None), "sqlstate", None)
+        if sqlstate == DEADLOCK:
+            kind = "deadlock"
+        elif sqlstate == SERIALIZATION_FAILURE:
+            kind = "serialization"
+        elif sqlstate == LOCK_NOT_AVAILABLE:
+            kind = "lock_not_available"
+        else:
+            kind = type(exc).__name__
+        self.errors[f"{op}:{kind}"] += 1
+
+
+def _percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _pct(part: int, total: int) -> float:
+    return part / total * 100 if total else 0.0
+
+
+class LockWaitSampler:
+    """Периодически считает сессии, ожидающие блокировку (pg_stat_activity)."""
+
+    def __init__(self, engine, interval: float = 0.02):
+        self.engine = engine
+        self.interval = interval
+        self.samples = 0
+        self.samples_with_waits = 0
+        self.max_waiting = 0
+        self._task = None
+
+    async def _run(self) -> None:
+        query = text(
+            "SELECT count(*) FROM pg_stat_activity "
+            "WHERE datname = current_database() AND wait_event_type = 'Lock'"
+        )
+        async with self.engine.connect() as conn:
+            while True:
+                waiting = (await conn.execute(query)).scalar() or 0
+                await conn.commit()
+                self.samples += 1
+                if waiting:
+                    self.samples_with_waits += 1
+                    self.max_waiting = max(self.max_waiting, waiting)
+                await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+async def _db_deadlocks(engine) -> int:
+    async with engine.connect() as conn:
+        return (await conn.execute(text(
+            "SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()"
+        ))).scalar() or 0
+
+
+# ── Подготовка и очистка данных ──
+
+async def setup(session_maker, args, tag: str) -> dict:
+    async with session_maker() as session:
+        category = Category(name=f"bench-{tag}")
+        session.add(category)
+        await session.flush()
+
+        products = [
+            Product(name=f"bench-{tag}-{n}", price=args.price, category_id=category.id, stock_count=args.stock)
+            for n in range(args.products)
+        ]
+        session.add_all(products)
+        await session.flush()
+
+        for product in products:
+            await session.execute(insert(Account), [
+                {"product_id": product.id, "account_data": f"bench:{tag}:{product.id}:{n}"}
+                for n in range(args.stock)
+            ])
+
+        base = TELEGRAM_ID_BASE + int(time.time()) % 1_000_000 * 10_000
+        users = [
+            User(telegram_id=base + n, first_name=f"bench-{tag}", balance=args.balance)
+            for n in range(args.users or args.buyers)
+        ]
+        session.add_all(users)
+        await session.commit()
+
+        return {
+            "category_id": category.id,
+            "product_ids": [p.id for p in products],
+            "user_ids": [u.id for u in users],
+            "telegram_ids": [u.telegram_id for u in users],
+        }
+
+
+async def cleanup(session_maker, data: dict) -> None:
+    async with session_maker() as session:
+        product_ids = data["product_ids"]
+        await session.execute(delete(Account).where(Account.product_id.in_(product_ids)))
+        await session.execute(delete(Order).where(Order.product_id.in_(product_ids)))
+        await session.execute(delete(NotificationOutbox).where(
+            NotificationOutbox.product.in_(select(Product.name).where(Product.id.in_(product_ids)))
+        ))
+        await session.execute(delete(Product).where(Product.id.in_(product_ids)))
+        await session.execute(delete(Category).where(Category.id == data["category_id"]))
+        await session.execute(delete(BalanceLedger).where(BalanceLedger.user_id.in_(data["user_ids"])))
+        await session.execute(delete(User).where(User.id.in_(data["user_ids"])))
+        await session.commit()
+
+
+# ── Покупатель ──
+
+async def buyer(session_maker, data: dict, args, stats: Stats, index: int) -> None:
+    user_id = data["user_ids"][index % len(data["user_ids"])]
+    telegram_id = data["telegram_ids"][index % len(data["telegram_ids"])]
+    product_id = random.choice(data["product_ids"])
+    quantity = random.randint(1, args.max_quantity)
+
+    started = time.perf_counter()
+    try:
+        async with session_maker() as session:
+            try:
+                order = await place_order(session, telegram_id, product_id, quantity)
+            except ValueError:
+                stats.sold_out += 1
+                return
+            await session.commit()
+            order_id = order.id
+        stats.record("create", started)
+    except DBAPIError as e:
+        stats.record_error("create", e)
+        return
+
+    if args.think_time:
+        await asyncio.sleep(random.uniform(0, args.think_time))
+
+    cancel = random.random() < args.cancel_ratio
+    op = "cancel" if cancel else "pay"
+    started = time.perf_counter()
+    try:
+        async with session_maker() as session:
+            if cancel:
+                if not await cancel_pending_order(session, order_id):
+                    stats.status_conflicts += 1
+            else:
+                order = await session.get(Order, order_id)
+                user = await session.get(User, user_id)
+                try:
+                    if not await pay_order_from_balance(session, order, user):
+                        stats.status_conflicts += 1
+                except ValueError:
+                    stats.insufficient_funds += 1
+        stats.record(op, started)
+    except DBAPIError as e:
+        stats.record_error(op, e)
+
+
+# ── Проверка инвариантов ──
+
+async def check_invariants(session_maker, data: dict, args) -> list:
+    """Вернуть список нарушений (пустой — всё в порядке)."""
+    problems = []
+    product_ids = data["product_ids"]
+    async with session_maker() as session:
+        cached = dict((await session.execute(
+            select(Product.id, Product.stock_count).where(Product.id.in_(product_ids))
+        )).all())
+        unsold = dict((await session.execute(
+            select(Account.product_id, func.count(Account.id))
+            .where(Account.product_id.in_(product_ids), Account.is_sold == False)
+            .group_by(Account.product_id)
+        )).all())
+        drift = {pid: (cached[pid], unsold.get(pid, 0)) for pid in product_ids if cached[pid] != unsold.get(pid, 0)}
+        print(f"  stock_count drift before cache refresh: {len(drift)} products")
+
+        await refresh_stock_counts(session, product_ids)
+        await session.commit()
+        cached = dict((await session.execute(
+            select(Product.id, Product.stock_count).where(Product.id.in_(product_ids))
+        )).all())
+        for pid in product_ids:
+            if cached[pid] != unsold.get(pid, 0):
+                problems.append(f"product {pid}: stock_count={cached[pid]} unsold={unsold.get(pid, 0)}")
+
+        # Каждый живой заказ держит ровно quantity аккаунтов — иначе аккаунт продан дважды/потерян
+        held = (
+            select(Account.order_id, func.count(Account.id).label("held"))
+            .where(Account.order_id.isnot(None))
+            .group_by(Account.order_id)
+            .subquery()
+        )
+        mismatched = (await session.execute(
+            select(Order.id, Order.quantity, func.coalesce(held.c.held, 0))
+            .outerjoin(held, held.c.order_id == Order.id)
+            .where(Order.product_id.in_(product_ids), Order.status != "ОТМЕНЕНО")
+            .where(Order.quantity != func.coalesce(held.c.held, 0))
+        )).all()
+        for order_id, quantity, count in mismatched:
+            problems.append(f"order {order_id}: quantity={quantity} but holds {count} accounts")
+
+        cancelled_holding = (await session.execute(
+            select(func.count(Account.id))
+            .join(Order, Order.id == Account.order_id)
+            .where(Order.product_id.in_(product_ids), Order.status == "ОТМЕНЕНО")
+        )).scalar()
+        if cancelled_holding:
+            problems.append(f"{cancelled_holding} accounts still attached to cancelled orders")
+
+        orphaned = (await session.execute(
+            select(func.count(Account.id)).where(
+                Account.product_id.in_(product_ids),
+                (Account.is_sold == True) != Account.order_id.isnot(None),
+            )
+        )).scalar()
+        if orphaned:
+            problems.append(f"{orphaned} accounts with is_sold inconsistent with order_id")
+
+        total_accounts = (await session.execute(
+            select(func.count(Account.id)).where(Account.product_id.in_(product_ids))
+        )).scalar()
+        if total_accounts != args.stock * args.products:
+            problems.append(f"accounts total {total_accounts} != {args.stock * args.products}")
+
+        # Баланс: списано ровно столько, сколько стоят выполненные заказы (нет потерянных обновлений)
+        spent = dict((await session.execute(
+            select(Order.user_id, func.sum(Order.total_amount))
+            .where(Order.product_id.in_(product_ids), Order.status == "ВЫПОЛНЕНО")
+            .group_by(Order.user_id)
+        )).all())
+        balances = (await session.execute(
+            select(User.id, User.balance).where(User.id.in_(data["user_ids"]))
+        )).all()
+        for user_id, balance in balances:
+            expected = args.balance - (spent.get(user_id) or 0)
+            if abs(balance - expected) > 0.01:
+                problems.append(f"user {user_id}: balance={balance:.2f} expected={expected:.2f}")
+    return problems
+
+
+# ── Запуск ──
+
+async def run(args) -> int:
+    engine = create_async_engine(
+        settings.DATABASE_URL,
+        pool_size=args.pool_size or args.concurrency,
+        max_overflow=0,
+        pool_timeout=120,
+    )
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    tag = datetime.now().strftime("%Y%m%d%H%M%S")
+    stats = Stats()
+
+    data = await setup(session_maker, args, tag)
+    print(
+        f"🏁 {args.buyers} buyers, concurrency {args.concurrency}, "
+        f"{args.products} products × {args.stock} accounts, {len(data['user_ids'])} users"
+    )
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(index: int) -> None:
+        async with semaphore:
+            await buyer(session_maker, data, args, stats, index)
+
+    sampler = LockWaitSampler(engine)
+    deadlocks_before = await _db_deadlocks(engine)
+    sampler.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(limited(i) for i in range(args.buyers)))
+    elapsed = time.perf_counter() - started
+    await sampler.stop()
+    deadlocks = await _db_deadlocks(engine) - deadlocks_before
+
+    created = len(stats.latencies["create"])
+    print(f"\n⏱  {elapsed:.2f}s, {created / elapsed:.1f} orders/s, {args.buyers / elapsed:.1f} buyers/s")
+    for op in ("create", "cancel", "pay"):
+        values = stats.latencies[op]
+        if values:
+            print(
+                f"  {op:<7} n={len(values):<6} p50={_percentile(values, 50) * 1000:7.1f}ms "
+                f"p99={_percentile(values, 99) * 1000:7.1f}ms max={max(values) * 1000:7.1f}ms"
+            )
+    print(
+        f"  sold out: {stats.sold_out}, insufficient funds: {stats.insufficient_funds}, "
+        f"status conflicts: {stats.status_conflicts}"
+    )
+    print(f"  deadlocks (pg_stat_database): {deadlocks}")
+    print(
+        f"  lock waits: {_pct(sampler.samples_with_waits, sampler.samples):.1f}% of samples, "
+        f"max {sampler.max_waiting} sessions waiting"
+    )
+    for kind, count in sorted(stats.errors.items()):
+        print(f"  error {kind}: {count}")
+
+    print("\n🔍 Invariants")
+    problems = await check_invariants(session_maker, data, args)
+    for problem in problems[:50]:
+        print(f"  ❌ {problem}")
+    if not problems:
+        print("  ✅ no oversell, stock_count matches unsold accounts, balances consistent")
+
+    if not args.keep:
+        await cleanup(session_maker, data)
+    await engine.dispose()
+    return 1 if problems or stats.errors else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrency stress test of the purchase path")
+    parser.add_argument("--confirm", action="store_true", help="I understand this writes to the configured DB")
+    parser.add_argument("--buyers", type=int, default=500, help="total simulated buyers")
+    parser.add_argument("--concurrency", type=int, default=100, help="buyers in flight at once")
+    parser.add_argument("--pool-size", type=int, default=0, help="DB pool size (default: concurrency)")
+    parser.add_argument("--products", type=int, default=3)
+    parser.add_argument("--stock", type=int, default=300, help="accounts per product")
+    parser.add_argument("--max-quantity", type=int, default=3)
+    parser.add_argument("--users", type=int, default=0, help="distinct users (default: one per buyer)")
+    parser.add_argument("--balance", type=float, default=1_000_000.0)
+    parser.add_argument("--price", type=float, default=10.0)
+    parser.add_argument("--cancel-ratio", type=float, default=0.3)
+    parser.add_argument("--think-time", type=float, default=0.0, help="max pause between order and payment, s")
+    parser.add_argument("--keep", action="store_true", help="do not delete benchmark data")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.confirm:
+        print(
+            f"⚠️  This benchmark writes to {settings.DATABASE_HOST}:{settings.DATABASE_PORT}/"
+            f"{settings.DATABASE_NAME}. Re-run with --confirm against a local database."
+        )
+        sys.exit(2)
+    sys.exit(asyncio.run(run(args)))
@@ -0,0 +1,248 @@
+"""Бенчмарк уведомлений о поступлении товара.
+
+Создаёт товар без остатка и --subscribers подписчиков, затем сравнивает:
+  1. legacy — прежний notify_stock_available: select(User) на каждую
+     подписку и отправка по одной;
+  2. import — как в админке: аккаунты загружены, коммит будит задачу
+     планировщика stock_notify, она рассылает уведомления через Broadcaster.
+     Два пополнения подряд проверяют, что никто не получит уведомление дважды;
+  3. sweep — товар распродан и пополнен без пробуждения задачи
+     (перезапуск, возврат аккаунтов отменённого заказа, кэш остатка не
+     увидел нуля): переподписавшихся находит задача notify_restocked_products.
+Отправка — в заглушку Bot API из bench_broadcast.py (каждый 50-й чат — 403).
+Считаются SQL-запросы, время и доставленные сообщения.
+
+Запускать ТОЛЬКО против локальной/тестовой БД (настройки берутся из .env):
+скрипт создаёт своих пользователей, категорию, товар и аккаунты и удаляет
+их по завершении.
+
+    python scripts/bench_stock_notify.py --confirm
+    python scripts/bench_stock_notify.py --confirm --subscribers 1000 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, event, func, insert, select, update
+
+from scripts.bench_broadcast import BLOCKED_EVERY, FakeBotAPI, serve
+from src.config import settings
+from src.database.database import async_session_maker, engine
+from src.database.models import Account, Category, Product, StockNotification, User
+from src.services.account_service import refresh_stock_counts
+from src.services.notifications import notify_restocked_products, wake_stock_notify
+from src.services.scheduler import scheduler
+from src.utils.rate_limit import bot_throttle
+
+TELEGRAM_ID_BASE = 9_800_000_000_000
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args) -> None:
+        self.count += 1
+
+
+async def legacy(bot, product_id: int) -> int:
+    """Прежний notify_stock_available (для сравнения)."""
+    sent = 0
+    async with async_session_maker() as session:
+        product = await session.get(Product, product_id)
+        notifications = (await session.execute(
+            select(StockNotification).where(
+                StockNotification.product_id == product_id, StockNotification.is_notified == False,
+            )
+        )).scalars().all()
+        for notification in notifications:
+            try:
+                user = (await session.execute(select(User).where(User.id == notification.user_id))).scalar_one_or_none()
+                if user and not user.is_blocked:
+                    await bot.send_message(user.telegram_id, f"🔔 {product.name}", parse_mode="HTML")
+                    notification.is_notified = True
+                    sent += 1
+            except Exception:
+                pass
+        await session.commit()
+    return sent
+
+
+async def restock(product_id: int, accounts: int, notify: bool = True) -> None:
+    """Пополнение склада, как в account_import_process (notify=False — не будить stock_notify)."""
+    async with async_session_maker() as session:
+        await session.execute(insert(Account), [
+            {"product_id": product_id, "account_data": f"bench-stock-{time.time_ns()}-{n}"} for n in range(accounts)
+        ])
+        await refresh_stock_counts(session, [product_id])
+        if notify:
+            wake_stock_notify(session)
+        await session.commit()
+
+
+async def sell_out(product_id: int) -> None:
+    async with async_session_maker() as session:
+        await session.execute(delete(Account).where(Account.product_id == product_id))
+        await session.commit()
+
+
+async def pending_subscriptions(product_id: int) -> int:
+    async with async_session_maker() as session:
+        return (await session.execute(
+            select(func.count()).where(
+                StockNotification.product_id == product_id, StockNotification.is_notified == False,
+            )
+        )).scalar()
+
+
+async def run(args) -> int:
+    settings.BROADCAST_RATE = args.rate
+    bot_throttle().set_rate(args.rate)
+    api = FakeBotAPI(latency=args.latency, limit=1_000_000, flaky=0.0)
+    server, bot = await serve(api)
+    counter = StatementCounter()
+    base = TELEGRAM_ID_BASE + int(time.time()) % 1_000_000 * 1_000_000
+
+    async with async_session_maker() as session:
+        category = Category(name=f"bench-stock-{base}")
+        session.add(category)
+        await session.flush()
+        product = Product(name="bench-stock", price=10.0, category_id=category.id, stock_count=0)
+        session.add(product)
+        await session.flush()
+        product_id, category_id = product.id, category.id
+        await session.execute(insert(User), [
+            {"telegram_id": base + n, "first_name": "bench-stock"} for n in range(args.subscribers)
+        ])
+        await session.execute(
+            insert(StockNotification).from_select(
+                ["user_id", "product_id"],
+                select(User.id, product_id).where(User.telegram_id >= base, User.telegram_id < base + args.subscribers),
+            )
+        )
+        await session.commit()
+    deliverable = sum(1 for n in range(args.subscribers) if (base + n) % BLOCKED_EVERY)
+    print(f"🏁 {args.subscribers} subscribers, API latency {args.latency * 1000:.0f}ms, rate {args.rate}/s")
+
+    problems = []
+    try:
+        # 1. Прежний путь
+        api.reset()
+        counter.count = 0
+        started = time.perf_counter()
+        sent = await legacy(bot, product_id)
+        print(
+            f"  legacy  sent={sent:<5} statements={counter.count:<6} "
+            f"time={time.perf_counter() - started:5.1f}s"
+        )
+
+        # 2. Новый путь: пополнение будит stock_notify; второе пополнение следом
+        async with async_session_maker() as session:
+            await session.execute(
+                update(StockNotification).where(StockNotification.product_id == product_id).values(is_notified=False)
+            )
+            await session.commit()
+        # Интервал больше времени бенчмарка: задачу запускает только пробуждение
+        job = scheduler.add_interval_job("stock_notify", partial(notify_restocked_products, bot), 3600, timeout=600)
+        await scheduler.start()
+        while not scheduler.is_leader:
+            await asyncio.sleep(0.1)
+        api.reset()
+        counter.count = 0
+        started = time.perf_counter()
+        await restock(product_id, 5)
+        await sell_out(product_id)
+        await restock(product_id, 5)
+        # Готово, когда пробуждений не осталось и в ожидании только заблокировавшие бота
+        while (
+            job.wakeup.is_set() or not job.metrics.runs
+            or await pending_subscriptions(product_id) != args.subscribers - deliverable
+        ) and time.perf_counter() - started < 600:
+            await asyncio.sleep(0.2)
+        elapsed = time.perf_counter() - started
+        await scheduler.stop()
+        pending = await pending_subscriptions(product_id)
+        print(
+            f"  import  sent={api.accepted:<5} statements={counter.count:<6} time={elapsed:5.1f}s  "
+            f"403={api.forbidden} still pending={pending}"
+        )
+
+        duplicates = [chat_id for chat_id, count in api.received.items() if count > 1]
+        if duplicates:
+            problems.append(f"{len(duplicates)} subscribers were notified twice")
+        if api.accepted != deliverable:
+            problems.append(f"delivered {api.accepted} of {deliverable} deliverable notifications")
+        if pending != args.subscribers - deliverable:
+            problems.append(f"{pending} subscriptions pending, expected {args.subscribers - deliverable} (blocked chats)")
+
+        # 3. Часть пользователей подписалась снова; товар распродан и пополнен
+        # без пробуждения задачи — их находит плановый запуск stock_notify
+        resubscribed = args.subscribers // 10
+        async with async_session_maker() as session:
+            await session.execute(
+                update(StockNotification)
+                .where(
+                    StockNotification.product_id == product_id,
+                    StockNotification.user_id == User.id,
+                    User.telegram_id < base + resubscribed,
+                )
+                .values(is_notified=False)
+            )
+            await session.commit()
+        await sell_out(product_id)
+        await restock(product_id, 5, notify=False)
+        api.reset()
+        started = time.perf_counter()
+        sent = await notify_restocked_products(bot)
+        again = await notify_restocked_products(bot)
+        expected = sum(1 for n in range(resubscribed) if (base + n) % BLOCKED_EVERY)
+        print(f"  sweep   sent={sent:<5} time={time.perf_counter() - started:5.1f}s  second run sent={again}")
+        if sent != expected or again:
+            problems.append(f"sweep delivered {sent} + {again}, expected {expected} resubscribed once")
+    finally:
+        await scheduler.stop()
+        async with async_session_maker() as session:
+            await session.execute(delete(StockNotification).where(StockNotification.product_id == product_id))
+            await session.execute(delete(Account).where(Account.product_id == product_id))
+            await session.execute(delete(Product).where(Product.id == product_id))
+            await session.execute(delete(Category).where(Category.id == category_id))
+            await session.execute(delete(User).where(User.telegram_id >= base, User.telegram_id < base + args.subscribers))
+            await session.commit()
+        await bot.session.close()
+        await server.cleanup()
+
+    print("\n🔍 Invariants")
+    for problem in problems:
+        print(f"  ❌ {problem}")
+    if not problems:
+        print(
+            "  ✅ restock notifies every reachable subscriber exactly once; failed ones stay pending; "
+            "the scheduled sweep catches a restock that skipped the upload trigger"
+        )
+    return 1 if problems else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stock-arrival notifications: legacy loop vs batched fan-out")
+    parser.add_argument("--confirm", action="store_true", help="I understand this writes to the configured DB")
+    parser.add_argument("--subscribers", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.1, help="fake API response time, seconds")
+    parser.add_argument("--rate", type=float, default=25.0, help="BROADCAST_RATE, messages per second")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.confirm:
+        print(
+            f"⚠️  This benchmark writes to {settings.DATABASE_HOST}:{settings.DATABASE_PORT}/"
+            f"{settings.DATABASE_NAME}. Re-run with --confirm against a local database."
+        )
+        sys.exit(2)
+    sys.exit(asyncio.run(run(args)))
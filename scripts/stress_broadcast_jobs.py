@@ -0,0 +1,161 @@
+"""Стресс-тест фоновой рассылки: перезапуски посреди задачи.
+
+Рассылка идёт через заглушку Bot API из bench_broadcast.py, а исполнитель
+задач несколько раз останавливается на случайном месте:
+  * штатно (как при деплое) — итоги пачки записываются, неначатый хвост
+    освобождается;
+  * «падением» — итоги не записываются, задача подхватывается после
+    истечения аренды.
+В конце проверяется, что ни один чат не получил сообщение дважды, у каждого
+получателя есть запись о доставке, SENT совпадает с фактически принятыми
+заглушкой сообщениями, а потери ограничены UNKNOWN-записями после падений.
+
+Запускать ТОЛЬКО против локальной/тестовой БД (настройки берутся из .env):
+скрипт создаёт своих пользователей и задачу рассылки и удаляет их по
+завершении. Рассылка уходит всем незаблокированным пользователям БД —
+но только в заглушку.
+
+    python scripts/stress_broadcast_jobs.py --confirm
+    python scripts/stress_broadcast_jobs.py --confirm --users 20000 --restarts 8 --rate 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, insert, select
+
+from scripts.bench_broadcast import FakeBotAPI, serve
+from src.config import settings
+from src.database.database import async_session_maker
+from src.database.models import BroadcastDelivery, BroadcastJob, User
+from src.services.broadcast import BroadcastJobRunner, create_broadcast_job
+from src.utils.rate_limit import bot_throttle
+
+TELEGRAM_ID_BASE = 9_300_000_000_000
+
+
+async def run(args) -> int:
+    settings.BROADCAST_RATE = args.rate
+    bot_throttle().set_rate(args.rate)  # заглушка API без лимита — общий лимит бота не мешает замеру
+    settings.BROADCAST_CONCURRENCY = args.concurrency
+    api = FakeBotAPI(latency=0.02, limit=10_000, flaky=0.01)
+    server, bot = await serve(api)
+
+    base = TELEGRAM_ID_BASE + int(time.time()) % 1_000_000 * 100_000
+    async with async_session_maker() as session:
+        await session.execute(insert(User), [
+            {"telegram_id": base + n, "first_name": "stress-broadcast"} for n in range(args.users)
+        ])
+        await session.commit()
+        job = await create_broadcast_job(session, "stress", created_by=0)
+        job_id = job.id
+    print(f"🏁 broadcast #{job_id} to {job.total} users, {args.restarts} restarts, batch {args.batch}")
+
+    problems = []
+    crashes = 0
+    try:
+        for n in range(args.restarts + 1):
+            runner = BroadcastJobRunner(poll_interval=0.2, lease_seconds=args.lease, batch_size=args.batch)
+            crash = n < args.restarts and random.random() < 0.5
+            if crash:
+                # «Падение»: итоги прерванной пачки не записываются, аренда не снимается
+                original = runner._record
+
+                async def _record(*a, interrupted=False, _original=original, **kw):
+                    if not interrupted:
+                        await _original(*a, **kw)
+
+                runner._record = _record
+            await runner.start(bot)
+            if n == args.restarts:
+                while True:
+                    async with async_session_maker() as session:
+                        status = (await session.execute(
+                            select(BroadcastJob.status).where(BroadcastJob.id == job_id)
+                        )).scalar()
+                    if status == "DONE":
+                        break
+                    await asyncio.sleep(0.5)
+                await runner.stop()
+                break
+            await asyncio.sleep(random.uniform(0.5, args.run_time))
+            await runner.stop()
+            crashes += crash
+            print(f"  {'💥 crash' if crash else '🔁 restart'} #{n + 1}: {api.accepted} messages accepted so far")
+            if crash:
+                await asyncio.sleep(args.lease)  # аренда упавшей реплики истекает
+
+        async with async_session_maker() as session:
+            job = await session.get(BroadcastJob, job_id)
+            statuses = dict((await session.execute(
+                select(BroadcastDelivery.status, func.count())
+                .where(BroadcastDelivery.job_id == job_id)
+                .group_by(BroadcastDelivery.status)
+            )).all())
+            sent_chats = set((await session.execute(
+                select(User.telegram_id)
+                .join(BroadcastDelivery, BroadcastDelivery.user_id == User.id)
+                .where(BroadcastDelivery.job_id == job_id, BroadcastDelivery.status == "SENT")
+            )).scalars())
+        print(f"\n📊 job: sent={job.sent} failed={job.failed} total={job.total}; deliveries: {statuses}")
+
+        duplicates = [chat_id for chat_id, count in api.received.items() if count > 1]
+        if duplicates:
+            problems.append(f"{len(duplicates)} chats received the message more than once")
+        if sum(statuses.values()) != job.total:
+            problems.append(f"{sum(statuses.values())} delivery rows for {job.total} recipients")
+        if statuses.get("SENDING"):
+            problems.append(f"{statuses['SENDING']} deliveries stuck in SENDING")
+        if sent_chats != {chat_id for chat_id in sent_chats if api.received[chat_id] == 1}:
+            problems.append("some SENT deliveries never reached the API")
+        unconfirmed = set(api.received) - sent_chats
+        if len(unconfirmed) > statuses.get("UNKNOWN", 0):
+            problems.append(f"{len(unconfirmed)} messages reached the API without a SENT record")
+        if statuses.get("UNKNOWN") and not crashes:
+            problems.append("UNKNOWN deliveries without a crash")
+
+        print("\n🔍 Invariants")
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        if not problems:
+            print(
+                f"  ✅ no duplicates after {args.restarts} restarts ({crashes} crashes); "
+                f"{statuses.get('UNKNOWN', 0)} deliveries left UNKNOWN by crashes"
+            )
+    finally:
+        async with async_session_maker() as session:
+            await session.execute(delete(BroadcastJob).where(BroadcastJob.id == job_id))
+            await session.execute(delete(User).where(User.telegram_id >= base, User.telegram_id < base + args.users))
+            await session.commit()
+        await bot.session.close()
+        await server.cleanup()
+    return 1 if problems else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Interrupt a background broadcast and check delivery guarantees")
+    parser.add_argument("--confirm", action="store_true", help="I understand this writes to the configured DB")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--restarts", type=int, default=6)
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=400.0, help="messages per second (the fake API has no limit)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--lease", type=int, default=2, help="job lease, seconds")
+    parser.add_argument("--run-time", type=float, default=3.0, help="max seconds between restarts")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.confirm:
+        print(
+            f"⚠️  This test writes to {settings.DATABASE_HOST}:{settings.DATABASE_PORT}/"
+            f"{settings.DATABASE_NAME}. Re-run with --confirm against a local database."
+        )
+        sys.exit(2)
+    sys.exit(asyncio.run(run(args)))
@@ -0,0 +1,230 @@
+"""Стресс-тест outbox уведомлений: сбои Bot API, flood control и падение воркера.
+
+Уведомления о покупках идут через заглушку Bot API из bench_broadcast.py, где
+доля --flaky запросов отвечает 502, а больше --limit сообщений в секунду — 429.
+  1. inline — как прежде: отправка каждому админу прямо в запросе покупателя,
+     ошибки проглатываются;
+  2. outbox — notify_admins_about_purchase в транзакции покупки, отправляет
+     OutboxWorker; посреди отправки воркер «падает» (задача отменяется, аренда
+     не снимается) и через время аренды поднимается новый.
+Часть транзакций откатывается — их уведомления не должны уйти. В конце
+проверяется, что каждое закоммиченное уведомление дошло до каждого админа,
+в очереди не осталось PENDING/DEAD, а повторы ограничены моментом падения.
+
+Запускать ТОЛЬКО против локальной/тестовой БД (настройки берутся из .env):
+скрипт создаёт своего пользователя, категорию и товар и удаляет их и свои
+строки outbox по завершении. Заказы в БД не пишутся.
+
+    python scripts/stress_notification_outbox.py --confirm
+    python scripts/stress_notification_outbox.py --confirm --purchases 500 --flaky 0.5
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, select
+
+from scripts.bench_broadcast import FakeBotAPI, serve
+from src.config import settings
+from src.database.database import async_session_maker
+from src.database.models import Category, NotificationOutbox, Order, Product, User
+from src.services import outbox
+from src.services.notifications import notify_admins_about_purchase
+from src.services.outbox import OutboxWorker
+from src.utils.rate_limit import bot_throttle
+
+TELEGRAM_ID_BASE = 9_800_000_000_000
+ORDER_ID = re.compile(r"Заказ: #(\d+)")
+
+
+def make_order(n: int, user: User, product: Product) -> Order:
+    return Order(
+        id=n, user_id=user.id, product_id=product.id, quantity=1, price_per_unit=product.price,
+        total_amount=product.price, status="ВЫПОЛНЕНО", payment_method="balance",
+    )
+
+
+async def inline(bot, user: User, product: Product, orders: range) -> float:
+    """Прежний путь (для сравнения): отправка в запросе покупателя. Возвращает среднее время покупки."""
+    started = time.perf_counter()
+    for n in orders:
+        async with async_session_maker() as session:
+            await session.commit()
+        for admin_id in settings.admin_ids_list:
+            try:
+                await bot.send_message(admin_id, f"🛒 Новая покупка\n🆔 Заказ: #{n}")
+            except Exception:
+                pass
+    return (time.perf_counter() - started) / len(orders)
+
+
+async def checkout(user: User, product: Product, n: int, commit: bool) -> float:
+    started = time.perf_counter()
+    async with async_session_maker() as session:
+        await notify_admins_about_purchase(session, make_order(n, user, product))
+        if commit:
+            await session.commit()
+        else:
+            await session.rollback()
+    return time.perf_counter() - started
+
+
+def new_worker(args) -> OutboxWorker:
+    bot_throttle().set_rate(args.rate)
+    worker = outbox.outbox_worker = OutboxWorker(
+        poll_interval=0.2, rate=args.rate, batch_size=settings.OUTBOX_BATCH, lease_seconds=args.lease,
+        max_attempts=50, retry_base=0.2, retry_max=1.0, digest_interval=0, digest_max_events=1,
+    )
+    return worker
+
+
+async def run(args) -> int:
+    logging.getLogger("src.services.outbox").setLevel(logging.ERROR)  # без строки на каждый повтор
+    settings.NOTIFICATIONS_CHAT_ID = ""
+    settings.ADMIN_IDS = ",".join(str(n) for n in range(1, args.admins + 1))
+    api = FakeBotAPI(latency=args.latency, limit=args.limit, flaky=args.flaky)
+    server, bot = await serve(api)
+
+    delivered: Counter = Counter()
+    send = bot.send_message
+
+    async def recording_send(chat_id, text, **kwargs):
+        result = await send(chat_id, text, **kwargs)
+        delivered[(int(chat_id), int(ORDER_ID.search(text).group(1)))] += 1
+        return result
+
+    bot.send_message = recording_send
+
+    tag = TELEGRAM_ID_BASE + int(time.time()) % 1_000_000
+    async with async_session_maker() as session:
+        first_id = (await session.execute(select(func.coalesce(func.max(NotificationOutbox.id), 0)))).scalar()
+        user = User(telegram_id=tag, first_name="stress-outbox", username="stress_outbox")
+        category = Category(name=f"stress-outbox-{tag}")
+        session.add_all([user, category])
+        await session.flush()
+        product = Product(name=f"stress-outbox-{tag}", price=100.0, category_id=category.id, stock_count=1000)
+        session.add(product)
+        await session.commit()
+    print(
+        f"🏁 {args.purchases} purchases, {args.admins} admins, API: {args.flaky:.0%} 502, "
+        f"limit {args.limit}/s, latency {args.latency * 1000:.0f}ms; worker {args.rate}/s"
+    )
+
+    problems = []
+    worker = None
+    try:
+        # 1. Прежний путь
+        per_checkout = await inline(bot, user, product, range(1, args.inline + 1))
+        lost = args.inline * args.admins - sum(delivered.values())
+        print(f"  inline  checkout={per_checkout * 1000:6.1f}ms  lost={lost} of {args.inline * args.admins}")
+        delivered.clear()
+        api.reset()
+        await asyncio.sleep(1)  # окно лимита заглушки пустеет
+
+        # 2. Outbox: покупки пишут очередь, воркер отправляет и один раз падает
+        worker = new_worker(args)
+        await worker.start(bot)
+        rolled_back = set(range(args.purchases + 1, args.purchases + 1 + args.purchases // 10))
+        durations = [await checkout(user, product, n, True) for n in range(1, args.purchases + 1)]
+        durations += [await checkout(user, product, n, False) for n in rolled_back]
+        print(f"  outbox  checkout={sum(durations) / len(durations) * 1000:6.1f}ms  (enqueue + commit)")
+
+        await asyncio.sleep(args.crash_after)
+        worker._task.cancel()  # «падение»: аренда занятых строк не снимается
+        await asyncio.gather(worker._task, return_exceptions=True)
+        crashed_at = sum(delivered.values())
+        print(f"  💥 worker crashed after {crashed_at} messages, restarting after the {args.lease}s lease")
+        await asyncio.sleep(args.lease)
+        worker = new_worker(args)
+        await worker.start(bot)
+
+        started = time.perf_counter()
+        while time.perf_counter() - started < args.timeout:
+            async with async_session_maker() as session:
+                statuses = dict((await session.execute(
+                    select(NotificationOutbox.status, func.count())
+                    .where(NotificationOutbox.id > first_id)
+                    .group_by(NotificationOutbox.status)
+                )).all())
+                retried = (await session.execute(
+                    select(func.count()).where(NotificationOutbox.id > first_id, NotificationOutbox.attempts > 1)
+                )).scalar()
+            if not statuses.get("PENDING"):
+                break
+            await asyncio.sleep(0.5)
+        await worker.stop()
+        print(
+            f"  outbox  rows={statuses}  retried rows={retried}  "
+            f"429={api.flood} 502={api.errors} time={time.perf_counter() - started:.1f}s"
+        )
+
+        expected = {(admin_id, n) for admin_id in settings.admin_ids_list for n in range(1, args.purchases + 1)}
+        missing = expected - set(delivered)
+        duplicates = sum(count - 1 for count in delivered.values() if count > 1)
+        leaked = [key for key in delivered if key[1] in rolled_back]
+        if missing:
+            problems.append(f"{len(missing)} committed notifications never reached an admin")
+        if leaked:
+            problems.append(f"{len(leaked)} notifications of rolled-back purchases were sent")
+        if statuses.get("PENDING") or statuses.get("DEAD"):
+            problems.append(f"outbox left unfinished: {statuses}")
+        if duplicates > 1:
+            problems.append(f"{duplicates} duplicates, at most 1 expected from the crash")
+        if args.flaky and not retried:
+            problems.append("no retries despite 502s")
+
+        print("\n🔍 Invariants")
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        if not problems:
+            print(
+                f"  ✅ all {len(expected)} notifications delivered through 502s, 429s and a crash "
+                f"({duplicates} duplicate); rolled-back purchases sent nothing; "
+                f"checkout {per_checkout * 1000:.0f}ms → {sum(durations) / len(durations) * 1000:.0f}ms"
+            )
+    finally:
+        if worker is not None:
+            await worker.stop()
+        async with async_session_maker() as session:
+            await session.execute(delete(NotificationOutbox).where(NotificationOutbox.id > first_id))
+            await session.execute(delete(Product).where(Product.id == product.id))
+            await session.execute(delete(Category).where(Category.id == category.id))
+            await session.execute(delete(User).where(User.id == user.id))
+            await session.commit()
+        await bot.session.close()
+        await server.cleanup()
+    return 1 if problems else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Deliver outbox notifications through API failures and a crash")
+    parser.add_argument("--confirm", action="store_true", help="I understand this writes to the configured DB")
+    parser.add_argument("--purchases", type=int, default=200)
+    parser.add_argument("--inline", type=int, default=50, help="purchases for the inline comparison")
+    parser.add_argument("--admins", type=int, default=2)
+    parser.add_argument("--flaky", type=float, default=0.3, help="share of 502 responses")
+    parser.add_argument("--limit", type=int, default=15, help="fake API flood limit, messages per second")
+    parser.add_argument("--latency", type=float, default=0.03, help="fake API response time, seconds")
+    parser.add_argument("--rate", type=float, default=30.0, help="worker rate, messages per second")
+    parser.add_argument("--lease", type=int, default=2, help="outbox lease, seconds")
+    parser.add_argument("--crash-after", type=float, default=2.0, help="seconds of sending before the crash")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.confirm:
+        print(
+            f"⚠️  This test writes to {settings.DATABASE_HOST}:{settings.DATABASE_PORT}/"
+            f"{settings.DATABASE_NAME}. Re-run with --confirm against a local database."
+        )
+        sys.exit(2)
+    sys.exit(asyncio.run(run(args)))
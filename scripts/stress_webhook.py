@@ -0,0 +1,251 @@
+"""Стресс-тест идемпотентности платёжных webhook'ов DFC Mail.
+
+Поднимает маршруты /webhook/yookassa и /webhook/heleket на локальном порту и
+отправляет одно и то же событие N раз параллельно для нескольких сценариев
+(события обрабатываются воркерами inbox, скрипт дожидается разбора очереди):
+пополнение по известному платежу, событие по неизвестному платежу (не
+зачисляется), оплата заказа, оплата уже отменённого заказа. Проверяет, что
+деньги зачислены и заказ выполнен ровно один раз. События подписываются
+ключами из .env (или тестовыми, если ключей нет).
+
+Запускать ТОЛЬКО против локальной/тестовой БД (настройки берутся из .env):
+
+    python scripts/stress_webhook.py --confirm
+    python scripts/stress_webhook.py --confirm --parallel 200
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import ClientSession, web
+from sqlalchemy import delete, func, select
+
+from src.config import settings
+from src.database.database import async_session_maker, engine, init_db
+from src.database.models import BalanceLedger, Category, InboxEvent, NotificationOutbox, Order, Payment, Product, User
+from src.bot.handlers.webhook import SIGNATURE_HEADER, setup_webhook_routes
+from src.services.inbox import inbox_workers
+
+TELEGRAM_ID = 9_100_000_000_000 + int(time.time()) % 1_000_000
+AMOUNT = 150.0
+
+
+def _yookassa_event(payment_id: str, telegram_id: int, order_id: int = 0) -> dict:
+    return {
+        "event": "payment.succeeded",
+        "object": {
+            "id": payment_id,
+            "status": "succeeded",
+            "amount": {"value": f"{AMOUNT:.2f}", "currency": "RUB"},
+            "metadata": {"order_id": order_id, "user_id": telegram_id},
+        },
+    }
+
+
+def _heleket_event(payment_id: str, telegram_id: int, order_id: int = 0) -> dict:
+    return {
+        "payment_id": payment_id,
+        "status": "completed",
+        "amount": AMOUNT,
+        "order_id": str(order_id),
+        "user_id": telegram_id,
+    }
+
+
+def _signature(url: str, payload: dict) -> str:
+    """Подпись события, как её проверяет PaymentService.verify_*_webhook."""
+    if url.endswith("/yookassa"):
+        key = settings.YOOKASSA_SECRET_KEY
+        message = f"{payload['event']}#{payload['object']['id']}"
+    else:
+        key = settings.HELEKET_API_KEY
+        message = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hmac.new(key.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+
+async def _fire(url: str, payload: dict, parallel: int) -> dict:
+    headers = {SIGNATURE_HEADER: _signature(url, payload)}
+    async with ClientSession() as http:
+        async def one():
+            async with http.post(url, json=payload, headers=headers) as resp:
+                return resp.status
+
+        statuses = await asyncio.gather(*(one() for _ in range(parallel)))
+    counts = {}
+    for status in statuses:
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+async def _balance(user_id: int) -> float:
+    async with async_session_maker() as session:
+        return (await session.execute(select(User.balance).where(User.id == user_id))).scalar()
+
+
+async def _order_status(order_id: int) -> str:
+    async with async_session_maker() as session:
+        return (await session.execute(select(Order.status).where(Order.id == order_id))).scalar()
+
+
+async def _payment_rows(method: str, payment_id: str) -> list:
+    async with async_session_maker() as session:
+        return (await session.execute(
+            select(Payment.status, func.count()).where(
+                Payment.payment_method == method, Payment.payment_id == payment_id
+            ).group_by(Payment.status)
+        )).all()
+
+
+async def _drain(tag: str, timeout: float = 30.0) -> float:
+    """Дождаться обработки событий теста воркерами inbox."""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        async with async_session_maker() as session:
+            pending = (await session.execute(
+                select(func.count(InboxEvent.id)).where(
+                    InboxEvent.event_id.contains(tag), InboxEvent.status == "PENDING"
+                )
+            )).scalar()
+        if not pending:
+            break
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - started
+
+
+async def run(args) -> int:
+    await init_db()
+    settings.WEBHOOK_VERIFY_SIGNATURE = True
+    settings.YOOKASSA_SECRET_KEY = settings.YOOKASSA_SECRET_KEY or "stress-yookassa-key"
+    settings.HELEKET_API_KEY = settings.HELEKET_API_KEY or "stress-heleket-key"
+    tag = uuid.uuid4().hex[:8]
+    async with async_session_maker() as session:
+        user = User(telegram_id=TELEGRAM_ID, first_name=f"stress-{tag}", balance=0.0)
+        category = Category(name=f"stress-{tag}")
+        session.add_all([user, category])
+        await session.flush()
+        product = Product(name=f"stress-{tag}", price=AMOUNT, category_id=category.id)
+        session.add(product)
+        await session.flush()
+        order_kwargs = dict(
+            user_id=user.id, product_id=product.id, quantity=1, price_per_unit=AMOUNT,
+            total_amount=AMOUNT, status="ОЖИДАЕТ ОПЛАТЫ",
+        )
+        pending_order = Order(**order_kwargs)
+        cancelled_order = Order(**order_kwargs)
+        session.add_all([pending_order, cancelled_order])
+        await session.flush()
+        cancelled_order.status = "ОТМЕНЕНО"
+
+        ids = {name: f"stress-{tag}-{name}" for name in ("topup", "unknown", "order", "cancelled")}
+        session.add_all([
+            Payment(user_id=user.id, amount=AMOUNT, payment_method="yookassa",
+                    payment_id=ids["topup"], status="PENDING"),
+            Payment(user_id=user.id, amount=AMOUNT, payment_method="heleket",
+                    payment_id=ids["order"], order_id=pending_order.id, status="PENDING"),
+            Payment(user_id=user.id, amount=AMOUNT, payment_method="yookassa",
+                    payment_id=ids["cancelled"], order_id=cancelled_order.id, status="PENDING"),
+        ])
+        await session.commit()
+
+    app = web.Application()
+    setup_webhook_routes(app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    await inbox_workers.start()
+    base = f"http://127.0.0.1:{args.port}/webhook"
+
+    scenarios = [
+        ("top-up, known payment", f"{base}/yookassa", _yookassa_event(ids["topup"], TELEGRAM_ID),
+         "yookassa", ids["topup"], AMOUNT, None),
+        ("unknown payment is not credited", f"{base}/yookassa", _yookassa_event(ids["unknown"], TELEGRAM_ID),
+         "yookassa", ids["unknown"], 0.0, None),
+        ("order payment", f"{base}/heleket", _heleket_event(ids["order"], TELEGRAM_ID, pending_order.id),
+         "heleket", ids["order"], 0.0, (pending_order.id, "ВЫПОЛНЕНО")),
+        ("payment of cancelled order", f"{base}/yookassa",
+         _yookassa_event(ids["cancelled"], TELEGRAM_ID, cancelled_order.id),
+         "yookassa", ids["cancelled"], AMOUNT, (cancelled_order.id, "ОТМЕНЕНО")),
+    ]
+
+    failures = 0
+    try:
+        for title, url, payload, method, payment_id, credit, order_check in scenarios:
+            before = await _balance(user.id)
+            started = time.perf_counter()
+            statuses = await _fire(url, payload, args.parallel)
+            elapsed = time.perf_counter() - started
+            drained = await _drain(tag)
+            after = await _balance(user.id)
+            rows = await _payment_rows(method, payment_id)
+
+            problems = []
+            if statuses != {200: args.parallel}:
+                problems.append(f"responses {statuses}")
+            if abs((after - before) - credit) > 0.001:
+                problems.append(f"balance changed by {after - before:.2f}, expected {credit:.2f}")
+            if rows != ([] if payment_id == ids["unknown"] else [("COMPLETED", 1)]):
+                problems.append(f"payment rows {rows}")
+            if order_check and await _order_status(order_check[0]) != order_check[1]:
+                problems.append(f"order #{order_check[0]} is {await _order_status(order_check[0])}")
+
+            mark = "❌" if problems else "✅"
+            print(
+                f"{mark} {title}: {args.parallel} deliveries accepted in {elapsed * 1000:.0f}ms, "
+                f"processed in {drained * 1000:.0f}ms {'; '.join(problems)}"
+            )
+            failures += bool(problems)
+
+        # Событие с неверной подписью отклоняется ещё до inbox
+        async with ClientSession() as http:
+            forged = _yookassa_event(f"stress-{tag}-forged", TELEGRAM_ID)
+            async with http.post(f"{base}/yookassa", json=forged, headers={SIGNATURE_HEADER: "0" * 64}) as resp:
+                forged_status = resp.status
+        mark = "✅" if forged_status == 403 else "❌"
+        print(f"{mark} forged signature: HTTP {forged_status}")
+        failures += forged_status != 403
+    finally:
+        await inbox_workers.stop()
+        await runner.cleanup()
+        async with async_session_maker() as session:
+            await session.execute(delete(InboxEvent).where(InboxEvent.event_id.contains(tag)))
+            await session.execute(delete(Payment).where(Payment.user_id == user.id))
+            await session.execute(delete(Order).where(Order.user_id == user.id))
+            await session.execute(delete(NotificationOutbox).where(
+                NotificationOutbox.product.in_(select(Product.name).where(Product.id == product.id))
+            ))
+            await session.execute(delete(Product).where(Product.id == product.id))
+            await session.execute(delete(Category).where(Category.id == category.id))
+            await session.execute(delete(BalanceLedger).where(BalanceLedger.user_id == user.id))
+            await session.execute(delete(User).where(User.id == user.id))
+            await session.commit()
+        await engine.dispose()
+
+    return 1 if failures else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fire the same payment webhook many times in parallel")
+    parser.add_argument("--confirm", action="store_true", help="I understand this writes to the configured DB")
+    parser.add_argument("--parallel", type=int, default=50, help="deliveries of each event")
+    parser.add_argument("--port", type=int, default=8089)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.confirm:
+        print(
+            f"⚠️  This test writes to {settings.DATABASE_HOST}:{settings.DATABASE_PORT}/"
+            f"{settings.DATABASE_NAME}. Re-run with --confirm against a local database."
+        )
+        sys.exit(2)
+    sys.exit(asyncio.run(run(args)))
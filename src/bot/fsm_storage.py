@@ -0,0 +1,128 @@
+"""Хранилища FSM: PostgreSQL (по умолчанию), Redis или память процесса.
+
+Состояния сценариев (ввод количества, пополнение, импорт, рассылка,
+_menu_msg_id) переживают перезапуск и общие для всех реплик за одним webhook.
+Локального кэша нет: соседние апдейты пользователя могут прийти на разные
+реплики, и каждое чтение должно видеть последнюю запись. Состояние, не
+менявшееся дольше FSM_STATE_TTL, считается истёкшим: при чтении его нет,
+строки удаляет задача prune_fsm_states.
+"""
+import logging
+from datetime import timedelta
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import case, delete, func, literal, null, or_, select
+from sqlalchemy.dialects.postgresql import JSONB, insert
+
+from src.config import settings
+from src.database.database import async_session_maker
+from src.database.models import FsmState
+
+logger = logging.getLogger(__name__)
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+class PostgresStorage(BaseStorage):
+    """FSM в таблице fsm_states: одна строка (state, data) на ключ."""
+
+    def __init__(self, state_ttl: int = 0, key_builder: Optional[KeyBuilder] = None):
+        self.state_ttl = state_ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    def _expired(self):
+        if not self.state_ttl:
+            return literal(False)
+        return FsmState.updated_at < func.now() - timedelta(seconds=self.state_ttl)
+
+    async def _read(self, key: StorageKey, column) -> Any:
+        async with async_session_maker() as session:
+            return (await session.execute(
+                select(column).where(FsmState.key == self.key_builder.build(key), ~self._expired())
+            )).scalar_one_or_none()
+
+    async def _write(self, key: StorageKey, **values) -> None:
+        # Истёкшая строка перезаписывается как новая: вторая половина (state
+        # или data) не должна «ожить» вместе с записанной
+        expired = self._expired()
+        keep = {
+            "state": case((expired, null()), else_=FsmState.state),
+            "data": case((expired, literal({}, JSONB)), else_=FsmState.data),
+        }
+        stmt = insert(FsmState).values(key=self.key_builder.build(key), updated_at=func.now(), **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FsmState.key],
+            set_={
+                **{name: keep[name] for name in keep if name not in values},
+                **{name: stmt.excluded[name] for name in values},
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        async with async_session_maker() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._write(key, state=_state_name(state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._read(key, FsmState.state)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._write(key, data=dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return dict(await self._read(key, FsmState.data) or {})
+
+    async def close(self) -> None:
+        pass
+
+
+def _redis_storage() -> BaseStorage:
+    try:
+        from aiogram.fsm.storage.redis import RedisStorage
+    except ImportError as e:
+        raise RuntimeError("FSM_STORAGE=redis требует пакет redis: pip install redis") from e
+    if not settings.REDIS_URL:
+        raise RuntimeError("FSM_STORAGE=redis требует REDIS_URL")
+    ttl = settings.FSM_STATE_TTL or None
+    return RedisStorage.from_url(
+        settings.REDIS_URL,
+        key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+        state_ttl=ttl,
+        data_ttl=ttl,
+    )
+
+
+def build_fsm_storage() -> BaseStorage:
+    """Хранилище FSM по настройке FSM_STORAGE (memory / postgres / redis)."""
+    backend = settings.FSM_STORAGE.lower()
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "postgres":
+        storage = PostgresStorage(state_ttl=settings.FSM_STATE_TTL)
+    elif backend == "redis":
+        storage = _redis_storage()
+    else:
+        raise ValueError(f"Неизвестное FSM_STORAGE: {settings.FSM_STORAGE!r}")
+    logger.info("FSM storage: %s", backend)
+    return storage
+
+
+async def prune_fsm_states() -> int:
+    """Удалить истёкшие и пустые (state и data сброшены) состояния из fsm_states."""
+    expired = literal(False)
+    if settings.FSM_STATE_TTL:
+        expired = FsmState.updated_at < func.now() - timedelta(seconds=settings.FSM_STATE_TTL)
+    empty = FsmState.state.is_(None) & (FsmState.data == literal({}, JSONB))
+    async with async_session_maker() as session:
+        result = await session.execute(delete(FsmState).where(or_(expired, empty)))
+        await session.commit()
+    if result.rowcount:
+        logger.info("FSM: pruned %s states", result.rowcount)
+    return result.rowcount
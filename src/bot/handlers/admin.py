@@ -2,6 +2,7 @@
 
 Все операции: каталог CRUD, пользователи, заказы, настройки, аккаунты, статистика, логи.
 """
+import html
 import logging
 from datetime import datetime
 
@@ -16,6 +17,7 @@ from aiogram.types import (
 from sqlalchemy import delete as sa_delete
 from sqlalchemy import func, select, update as sa_update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
 from src.bot.handlers.start import is_admin, is_developer
 from src.bot.keyboards import (
@@ -27,6 +29,7 @@ from src.bot.keyboards import (
     admin_menu_kb,
     admin_order_status_filter_kb,
     admin_orders_kb,
+    admin_outbox_kb,
     admin_products_list_kb,
     admin_products_menu_kb,
     admin_role_kb,
@@ -44,6 +47,7 @@ from src.bot.utils import answer_callback, safe_edit
 from src.config import settings
 from src.database.models import (
     Account,
+    AccountArchive,
     AuditLog,
     Category,
     Log,
@@ -53,6 +57,9 @@ from src.database.models import (
     Setting,
     User,
 )
+from src.services.account_service import refresh_stock_counts
+from src.services.archive import restore_archived_accounts
+from src.services.balance import InsufficientFunds, credit_balance, debit_balance
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -233,16 +240,12 @@ async def order_cancel(callback: CallbackQuery, session: AsyncSession):
     if not order:
         await answer_callback(callback, "❌ Заказ не найден.")
         return
-    # Возвращаем аккаунты
+    # Возвращаем аккаунты (в т.ч. уже перенесённые в архив)
+    await restore_archived_accounts(session, order_id)
     await session.execute(
         sa_update(Account).where(Account.order_id == order_id).values(is_sold=False, order_id=None, sold_at=None)
     )
-    product = (await session.execute(select(Product).where(Product.id == order.product_id))).scalar_one_or_none()
-    if product:
-        accs = (await session.execute(
-            select(func.count(Account.id)).where(Account.product_id == product.id, Account.is_sold == False)
-        )).scalar() or 0
-        product.stock_count = accs
+    await refresh_stock_counts(session, [order.product_id])
 
     order.status = "ОТМЕНЕНО"
     await session.commit()
@@ -575,6 +578,7 @@ async def cat_del_execute(callback: CallbackQuery, session: AsyncSession):
     prods = (await session.execute(select(Product).where(Product.category_id == cat_id))).scalars().all()
     for p in prods:
         await session.execute(sa_delete(Account).where(Account.product_id == p.id))
+        await session.execute(sa_delete(AccountArchive).where(AccountArchive.product_id == p.id))
         await session.delete(p)
     await session.delete(cat)
     await session.commit()
@@ -1000,6 +1004,7 @@ async def prod_del_execute(callback: CallbackQuery, session: AsyncSession):
     if not product:
         return
     await session.execute(sa_delete(Account).where(Account.product_id == pid))
+    await session.execute(sa_delete(AccountArchive).where(AccountArchive.product_id == pid))
     await session.delete(product)
     await session.commit()
     await safe_edit(callback, f"✅ Товар «{product.name}» удалён.", back_admin_kb("adm:prod:list"))
@@ -1080,9 +1085,10 @@ async def account_add_process(message: Message, state: FSMContext, session: Asyn
         return
 
     session.add(Account(product_id=pid, account_data=account_data, is_sold=False))
-    await session.execute(
-        sa_update(Product).where(Product.id == pid).values(stock_count=Product.stock_count + 1)
-    )
+    await session.flush()
+    await refresh_stock_counts(session, [pid])
+    from src.services.notifications import wake_stock_notify
+    wake_stock_notify(session)
     await session.commit()
 
     await message.bot.edit_message_text(
@@ -1135,6 +1141,11 @@ async def account_import_process(message: Message, state: FSMContext, session: A
 
         from src.services.account_service import upload_accounts_from_file
         loaded, dupes = await upload_accounts_from_file(session, pid, content)
+        await session.flush()
+        await refresh_stock_counts(session, [pid])
+        if loaded:
+            from src.services.notifications import wake_stock_notify
+            wake_stock_notify(session)
         await session.commit()
 
         result = (
@@ -1194,9 +1205,8 @@ async def account_delete_one(callback: CallbackQuery, session: AsyncSession):
     acc = (await session.execute(select(Account).where(Account.id == acc_id))).scalar_one_or_none()
     if acc:
         await session.delete(acc)
-        prod = (await session.execute(select(Product).where(Product.id == pid))).scalar_one_or_none()
-        if prod and prod.stock_count > 0:
-            prod.stock_count -= 1
+        await session.flush()
+        await refresh_stock_counts(session, [pid])
         await session.commit()
 
     await safe_edit(callback, "✅ Аккаунт удалён.", back_admin_kb(f"adm:acc:prod:{pid}"))
@@ -1212,12 +1222,7 @@ async def account_delete_all(callback: CallbackQuery, session: AsyncSession):
         sa_delete(Account).where(Account.product_id == pid, Account.is_sold == False)
     )
     deleted = result.rowcount
-    prod = (await session.execute(select(Product).where(Product.id == pid))).scalar_one_or_none()
-    if prod:
-        remaining = (await session.execute(
-            select(func.count(Account.id)).where(Account.product_id == pid, Account.is_sold == False)
-        )).scalar() or 0
-        prod.stock_count = remaining
+    await refresh_stock_counts(session, [pid])
     await session.commit()
 
     await safe_edit(callback, f"✅ Удалено {deleted} аккаунтов.", back_admin_kb(f"adm:acc:prod:{pid}"))
@@ -1310,6 +1315,8 @@ async def user_detail(callback: CallbackQuery, session: AsyncSession):
 
 def _user_detail_text(user) -> str:
     status = "🔒 Заблокирован" if user.is_blocked else "✅ Активен"
+    if user.bot_blocked_at:
+        status += f" · 🚫 бот заблокирован пользователем {user.bot_blocked_at:%d.%m.%Y}"
     return (
         f"👤 <b>Пользователь</b>\n\n"
         f"🆔 ID: <code>{user.telegram_id}</code>\n"
@@ -1422,8 +1429,24 @@ async def user_balance_finish(message: Message, state: FSMContext, session: Asyn
     if not user:
         return
 
-    user.balance += amount
+    current_balance = user.balance
+    try:
+        if amount >= 0:
+            new_balance = await credit_balance(session, user.id, amount, "admin", f"admin:{message.from_user.id}")
+        else:
+            new_balance = await debit_balance(session, user.id, -amount, "admin", f"admin:{message.from_user.id}")
+    except InsufficientFunds:
+        await session.rollback()
+        await message.bot.edit_message_text(
+            f"❌ Недостаточно средств: баланс пользователя <b>{current_balance:.2f} ₽</b>.",
+            chat_id=message.chat.id, message_id=msg_id,
+            reply_markup=back_admin_kb("adm:users"), parse_mode="HTML",
+        )
+        return
+    from src.services.notifications import notify_balance_topup
+    notify_balance_topup(session, user, amount, new_balance)
     await session.commit()
+    set_committed_value(user, "balance", new_balance)
 
     await message.bot.edit_message_text(
         f"✅ Баланс пользователя {user.first_name or user.telegram_id}: <b>{user.balance:.2f} ₽</b> ({'+' if amount >= 0 else ''}{amount:.2f})",
@@ -1431,12 +1454,6 @@ async def user_balance_finish(message: Message, state: FSMContext, session: Asyn
         reply_markup=back_admin_kb("adm:users"), parse_mode="HTML",
     )
 
-    try:
-        from src.services.notifications import notify_balance_topup
-        await notify_balance_topup(session, user, amount, message.bot)
-    except Exception:
-        pass
-
 
 @router.callback_query(F.data.startswith("adm:user:role:"))
 async def user_role_menu(callback: CallbackQuery, session: AsyncSession):
@@ -1535,6 +1552,48 @@ async def admin_logs(callback: CallbackQuery, session: AsyncSession):
     await answer_callback(callback)
 
 
+# ═══════════════════════════════════════════════════
+# ОЧЕРЕДЬ УВЕДОМЛЕНИЙ
+# ═══════════════════════════════════════════════════
+
+async def _show_outbox(callback: CallbackQuery, session: AsyncSession) -> None:
+    from src.services.outbox import outbox_backlog
+    backlog = await outbox_backlog(session)
+    oldest = backlog["oldest"]
+    text = (
+        "📤 <b>Очередь уведомлений</b>\n\n"
+        f"⏳ Ожидают отправки: {backlog['pending']}\n"
+        f"🔁 Из них повторяются после ошибки: {backlog['retrying']}\n"
+        f"❌ Не доставлены: {backlog['dead']}\n"
+        f"✅ Отправлено за час: {backlog['sent_hour']}\n"
+    )
+    if oldest:
+        text += f"🕐 Самое старое в очереди: {oldest:%d.%m %H:%M:%S}\n"
+    if backlog["errors"]:
+        text += "\n<b>Последние ошибки:</b>\n"
+        for status, chat_id, error in backlog["errors"]:
+            text += f"• [{status}] {chat_id}: {html.escape(error[:100])}\n"
+    await safe_edit(callback, text, admin_outbox_kb(backlog["dead"]))
+
+
+@router.callback_query(F.data == "adm:outbox")
+async def admin_outbox(callback: CallbackQuery, session: AsyncSession):
+    if not _admin_check(callback.from_user.id):
+        return
+    await _show_outbox(callback, session)
+    await answer_callback(callback)
+
+
+@router.callback_query(F.data == "adm:outbox:retry")
+async def admin_outbox_retry(callback: CallbackQuery, session: AsyncSession):
+    if not _admin_check(callback.from_user.id):
+        return
+    from src.services.outbox import requeue_dead
+    requeued = await requeue_dead(session)
+    await _show_outbox(callback, session)
+    await answer_callback(callback, f"🔁 Возвращено в очередь: {requeued}")
+
+
 # ═══════════════════════════════════════════════════
 # НАСТРОЙКИ
 # ═══════════════════════════════════════════════════
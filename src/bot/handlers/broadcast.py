@@ -1,18 +1,29 @@
 """Рассылка (массовая и индивидуальная) — inline-only single-message UI"""
-import asyncio
 import logging
+from typing import Optional, Tuple
 
 from aiogram import F, Router
+from aiogram.exceptions import TelegramForbiddenError
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.bot.keyboards import admin_broadcast_kb, cancel_input_kb, noop_kb
+from src.bot.keyboards import (
+    admin_broadcast_kb,
+    back_admin_kb,
+    broadcast_audience_kb,
+    broadcast_categories_kb,
+    broadcast_progress_kb,
+    cancel_input_kb,
+    noop_kb,
+)
 from src.bot.states import BroadcastStates
 from src.bot.utils import answer_callback, safe_edit
 from src.config import settings
-from src.database.models import User
+from src.database.models import Category, Product
+from src.services.audience import ALL, PARAMETERS, SEGMENTS, count_audience, describe_audience, make_audience
+from src.services.broadcast import broadcast_result_text, cancel_broadcast_job, create_broadcast_job
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -49,16 +60,103 @@ async def mass_broadcast_start(callback: CallbackQuery, state: FSMContext):
     if not _is_admin(callback.from_user.id):
         await answer_callback(callback, "⛔ Нет доступа.")
         return
+    await state.clear()
     await state.update_data(_menu_msg_id=callback.message.message_id)
-    await state.set_state(BroadcastStates.waiting_message)
     await safe_edit(
         callback,
-        "📢 <b>Массовая рассылка</b>\n\nВведите текст сообщения для всех пользователей:",
+        "📢 <b>Массовая рассылка</b>\n\nКому отправить?",
+        broadcast_audience_kb(SEGMENTS),
+    )
+    await answer_callback(callback)
+
+
+async def _show_audience(target, session: AsyncSession, state: FSMContext, audience: str, msg_id: int) -> None:
+    """Предпросмотр аудитории (COUNT по сегменту) и запрос текста рассылки."""
+    total = await count_audience(session, audience)
+    title = await describe_audience(session, audience)
+    if not total:
+        await state.set_state(None)
+        await safe_edit(
+            target,
+            f"📢 <b>Массовая рассылка</b>\n\n{title}\n📊 Получателей: 0 — отправлять некому.",
+            back_admin_kb("adm:bcast:mass"),
+            message_id=msg_id,
+        )
+        return
+    await state.update_data(_audience=audience)
+    await state.set_state(BroadcastStates.waiting_message)
+    await safe_edit(
+        target,
+        f"📢 <b>Массовая рассылка</b>\n\n{title}\n📊 Получателей: {total}\n\n"
+        "Отправьте текст сообщения или фото, документ, видео, GIF с подписью:",
         cancel_input_kb("adm:broadcast"),
+        message_id=msg_id,
     )
+
+
+@router.callback_query(F.data.startswith("adm:bcast:aud:"))
+async def mass_broadcast_audience(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+    if not _is_admin(callback.from_user.id):
+        await answer_callback(callback, "⛔ Нет доступа.")
+        return
+    _, _, _, kind, *value = callback.data.split(":")
+    if kind not in SEGMENTS:
+        await answer_callback(callback)
+        return
+    if kind in PARAMETERS and not value:
+        if kind == "category":
+            categories = (await session.execute(
+                select(Category).where(Category.is_active == True).order_by(Category.name)
+            )).scalars().all()
+            await safe_edit(callback, f"📢 <b>Массовая рассылка</b>\n\n{PARAMETERS[kind]}", broadcast_categories_kb(categories))
+        else:
+            await state.update_data(_segment=kind)
+            await state.set_state(BroadcastStates.waiting_segment_value)
+            await safe_edit(callback, f"📢 <b>Массовая рассылка</b>\n\n{PARAMETERS[kind]}", cancel_input_kb("adm:bcast:mass"))
+        await answer_callback(callback)
+        return
+    await _show_audience(callback, session, state, make_audience(kind, *value), callback.message.message_id)
     await answer_callback(callback)
 
 
+@router.message(BroadcastStates.waiting_segment_value)
+async def mass_broadcast_segment_value(message: Message, state: FSMContext, session: AsyncSession):
+    if not _is_admin(message.from_user.id):
+        await state.clear()
+        return
+    data = await state.get_data()
+    msg_id = data.get("_menu_msg_id")
+    kind = data.get("_segment")
+
+    try:
+        audience = make_audience(kind, message.text)
+        if kind == "product" and await session.get(Product, int(message.text)) is None:
+            raise ValueError("товар не найден")
+    except (ValueError, TypeError):
+        await safe_edit(
+            message,
+            f"📢 <b>Массовая рассылка</b>\n\n❌ Неверное значение.\n{PARAMETERS[kind]}",
+            cancel_input_kb("adm:bcast:mass"),
+            message_id=msg_id,
+        )
+        return
+    await _show_audience(message, session, state, audience, msg_id)
+
+
+def _message_media(message: Message) -> Tuple[Optional[str], Optional[str]]:
+    """(тип, file_id) медиа из сообщения администратора или (None, None)."""
+    if message.photo:
+        return "photo", message.photo[-1].file_id
+    # У GIF заполнен и document — проверяем раньше него
+    if message.animation:
+        return "animation", message.animation.file_id
+    if message.video:
+        return "video", message.video.file_id
+    if message.document:
+        return "document", message.document.file_id
+    return None, None
+
+
 @router.message(BroadcastStates.waiting_message)
 async def mass_broadcast_process(message: Message, state: FSMContext, session: AsyncSession):
     if not _is_admin(message.from_user.id):
@@ -69,11 +167,20 @@ async def mass_broadcast_process(message: Message, state: FSMContext, session: A
     msg_id = data.get("_menu_msg_id")
     await state.clear()
 
-    text = (message.text or "").strip()
-    if not text:
+    media_type, media_file_id = _message_media(message)
+    # Форматирование из редактора Telegram переводим в HTML; без него текст
+    # отправляется как есть (HTML-теги можно набрать вручную)
+    entities = message.entities or message.caption_entities
+    text = (message.html_text if entities else message.text or message.caption or "").strip()
+    error = None
+    if media_type is None and message.text is None:
+        error = "❌ Поддерживаются текст, фото, документ, видео и GIF."
+    elif media_type is None and not text:
+        error = "❌ Пустое сообщение."
+    if error:
         try:
             await message.bot.edit_message_text(
-                "❌ Пустое сообщение.",
+                error,
                 chat_id=message.chat.id, message_id=msg_id,
                 reply_markup=cancel_input_kb("adm:broadcast"), parse_mode="HTML",
             )
@@ -81,46 +188,41 @@ async def mass_broadcast_process(message: Message, state: FSMContext, session: A
             pass
         return
 
-    # Отправляем статус
+    job = await create_broadcast_job(
+        session, text, message.from_user.id,
+        status_chat_id=message.chat.id, status_message_id=msg_id,
+        audience=data.get("_audience", ALL),
+        media_type=media_type, media_file_id=media_file_id,
+    )
     try:
         await message.bot.edit_message_text(
-            "📤 Отправка...",
+            f"📤 <b>Рассылка #{job.id} запущена</b>\n\n"
+            f"📊 Получателей: {job.total}\n\n"
+            "Прогресс и итог появятся в этом сообщении.",
             chat_id=message.chat.id, message_id=msg_id,
-            parse_mode="HTML",
+            reply_markup=broadcast_progress_kb(job.id), parse_mode="HTML",
         )
     except Exception:
         pass
 
-    stmt = select(User).where(User.is_blocked == False)
-    result = await session.execute(stmt)
-    users = result.scalars().all()
-
-    sent, failed = 0, 0
-    throttle = settings.BROADCAST_THROTTLE or 25
 
-    for i, user in enumerate(users):
-        try:
-            await message.bot.send_message(user.telegram_id, text, parse_mode="HTML")
-            sent += 1
-        except Exception:
-            failed += 1
-        if (i + 1) % throttle == 0:
-            await asyncio.sleep(1)
-
-    result_text = (
-        f"📢 <b>Рассылка завершена</b>\n\n"
-        f"✅ Отправлено: {sent}\n"
-        f"❌ Ошибки: {failed}\n"
-        f"📊 Всего: {len(users)}"
-    )
-    try:
-        await message.bot.edit_message_text(
-            result_text,
-            chat_id=message.chat.id, message_id=msg_id,
-            reply_markup=noop_kb(), parse_mode="HTML",
-        )
-    except Exception:
-        pass
+@router.callback_query(F.data.startswith("adm:bcast:stop:"))
+async def mass_broadcast_stop(callback: CallbackQuery, session: AsyncSession):
+    if not _is_admin(callback.from_user.id):
+        await answer_callback(callback, "⛔ Нет доступа.")
+        return
+    job_id = int(callback.data.split(":")[3])
+    job = await cancel_broadcast_job(session, job_id)
+    if job is None:
+        await answer_callback(callback, "Рассылка уже завершена.")
+        return
+    if job.started_at is None:
+        # Исполнитель ещё не брал задачу — итог показываем сами
+        await safe_edit(callback, broadcast_result_text(job), noop_kb())
+        await answer_callback(callback, "⛔ Рассылка отменена.")
+        return
+    # Итог покажет исполнитель, когда остановит отправку
+    await answer_callback(callback, "⛔ Рассылка останавливается…")
 
 
 # ═══════════════════════════════════════════════
@@ -195,6 +297,8 @@ async def individual_broadcast_send(message: Message, state: FSMContext):
     try:
         await message.bot.send_message(target_id, text, parse_mode="HTML")
         result = f"✅ Сообщение отправлено пользователю <code>{target_id}</code>."
+    except TelegramForbiddenError:
+        result = f"🚫 Пользователь <code>{target_id}</code> заблокировал бота — сообщение не доставлено."
     except Exception as e:
         logger.error("Individual broadcast error to %s: %s", target_id, e)
         result = f"❌ Не удалось отправить сообщение пользователю <code>{target_id}</code>."
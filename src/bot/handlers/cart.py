@@ -0,0 +1,108 @@
+"""Корзина — inline-only single-message UI"""
+import logging
+
+from aiogram import F, Router
+from aiogram.types import CallbackQuery
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.bot.keyboards import cart_kb, noop_kb, payment_methods_kb
+from src.bot.texts import cart_text
+from src.bot.utils import answer_callback, safe_edit
+from src.database.models import Cart, User
+from src.services.cart_service import (
+    cancel_pending_cart,
+    checkout_cart,
+    clear_cart,
+    get_cart_lines,
+    remove_cart_item,
+)
+
+logger = logging.getLogger(__name__)
+router = Router()
+
+
+async def _get_user(callback: CallbackQuery, session: AsyncSession):
+    stmt = select(User).where(User.telegram_id == callback.from_user.id)
+    return (await session.execute(stmt)).scalar_one_or_none()
+
+
+async def _show_cart(callback: CallbackQuery, session: AsyncSession, user: User) -> None:
+    lines = await get_cart_lines(session, user.id)
+    await safe_edit(callback, cart_text(lines), cart_kb(lines))
+    await answer_callback(callback)
+
+
+@router.callback_query(F.data == "menu:cart")
+async def show_cart(callback: CallbackQuery, session: AsyncSession):
+    user = await _get_user(callback, session)
+    if not user:
+        await answer_callback(callback, "Пользователь не найден")
+        return
+    await _show_cart(callback, session, user)
+
+
+@router.callback_query(F.data.startswith("cart:del:"))
+async def remove_item(callback: CallbackQuery, session: AsyncSession):
+    user = await _get_user(callback, session)
+    if not user:
+        await answer_callback(callback, "Пользователь не найден")
+        return
+    await remove_cart_item(session, user.id, int(callback.data.split(":")[2]))
+    await session.commit()
+    await _show_cart(callback, session, user)
+
+
+@router.callback_query(F.data == "cart:clear")
+async def clear(callback: CallbackQuery, session: AsyncSession):
+    user = await _get_user(callback, session)
+    if not user:
+        await answer_callback(callback, "Пользователь не найден")
+        return
+    await clear_cart(session, user.id)
+    await session.commit()
+    await _show_cart(callback, session, user)
+
+
+@router.callback_query(F.data == "cart:checkout")
+async def checkout(callback: CallbackQuery, session: AsyncSession):
+    user = await _get_user(callback, session)
+    if not user:
+        await answer_callback(callback, "Пользователь не найден")
+        return
+
+    try:
+        cart_id, orders = await checkout_cart(session, user)
+    except ValueError as e:
+        lines = await get_cart_lines(session, user.id)
+        await safe_edit(callback, f"❌ {e}\n\n{cart_text(lines)}", cart_kb(lines))
+        await answer_callback(callback)
+        return
+
+    total = sum(order.total_amount for order in orders)
+    text = f"🛒 <b>Корзина #{cart_id} оформлена</b>\n\n"
+    for order in orders:
+        text += f"• Заказ #{order.id}: {order.quantity} шт. — {order.total_amount:.2f} ₽\n"
+    text += f"\n💰 <b>Итого: {total:.2f} ₽</b>\n\nВыберите способ оплаты:"
+    await safe_edit(callback, text, payment_methods_kb(cart_id, cart=True))
+    await answer_callback(callback)
+
+
+@router.callback_query(F.data.startswith("ccancel:"))
+async def cancel_cart(callback: CallbackQuery, session: AsyncSession):
+    cart_id = int(callback.data.split(":")[1])
+    user = await _get_user(callback, session)
+    cart = await session.get(Cart, cart_id)
+    if not user or not cart or cart.user_id != user.id:
+        await answer_callback(callback, "⛔ Нет доступа.")
+        return
+
+    if not await cancel_pending_cart(session, cart_id):
+        await answer_callback(callback, "Эти заказы нельзя отменить")
+        return
+    await safe_edit(
+        callback,
+        f"❌ <b>Заказы корзины #{cart_id} отменены</b>\n\nТовар возвращён в каталог.",
+        noop_kb(),
+    )
+    await answer_callback(callback)
@@ -1,26 +1,25 @@
 """Каталог — inline-only single-message UI"""
 import logging
-from datetime import datetime, timedelta
 
 from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
-from sqlalchemy import select, update
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.bot.keyboards import (
-    categories_kb, payment_methods_kb, product_detail_kb,
+    cart_kb, categories_kb, payment_methods_kb, product_detail_kb,
     products_kb, quantity_cancel_kb,
 )
 from src.bot.states import OrderStates
-from src.bot.texts import product_detail_text
+from src.bot.texts import cart_text, product_detail_text
 from src.bot.utils import answer_callback, safe_edit
-from src.config import settings
 from src.database.models import (
-    Account, Category, Order, Product, StockNotification, User,
+    Category, Order, Product, StockNotification, User,
 )
-from src.services.account_service import reserve_accounts
-from src.services.discount import calculate_total_price
+from src.services.account_service import count_available
+from src.services.cart_service import get_cart_lines, set_cart_item
+from src.services.order_service import place_order
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -90,27 +89,40 @@ async def show_product(callback: CallbackQuery, session: AsyncSession, state: FS
 
 @router.callback_query(F.data.startswith("buy:"))
 async def start_buy(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
-    prod_id = int(callback.data.split(":")[1])
+    await _ask_quantity(callback, session, state, int(callback.data.split(":")[1]), to_cart=False)
+
+
+@router.callback_query(F.data.startswith("cart:add:"))
+async def start_add_to_cart(callback: CallbackQuery, session: AsyncSession, state: FSMContext):
+    await _ask_quantity(callback, session, state, int(callback.data.split(":")[2]), to_cart=True)
+
+
+async def _ask_quantity(
+    callback: CallbackQuery, session: AsyncSession, state: FSMContext, prod_id: int, to_cart: bool,
+) -> None:
     stmt = select(Product).where(Product.id == prod_id)
     product = (await session.execute(stmt)).scalar_one_or_none()
-    if not product or product.stock_count == 0:
+    available = await count_available(session, prod_id) if product else 0
+    if not available:
         await answer_callback(callback, "Товар недоступен")
         return
 
-    # Проверка лимита заказов
-    user_id = callback.from_user.id
-    stmt_u = select(User).where(User.telegram_id == user_id)
-    user = (await session.execute(stmt_u)).scalar_one_or_none()
-    if user:
-        stmt_o = select(Order).where(Order.user_id == user.id, Order.status == "ОЖИДАЕТ ОПЛАТЫ")
-        pending = (await session.execute(stmt_o)).scalars().all()
-        if len(pending) >= 3:
+    # Проверка лимита заказов (корзина оформляется отдельно)
+    if not to_cart:
+        stmt_o = (
+            select(func.count(Order.id))
+            .join(User, User.id == Order.user_id)
+            .where(User.telegram_id == callback.from_user.id, Order.status == "ОЖИДАЕТ ОПЛАТЫ")
+        )
+        if (await session.execute(stmt_o)).scalar() >= 3:
             await answer_callback(callback, "Слишком много неоплаченных заказов (макс. 3)")
             return
 
     await state.update_data(
         product_id=prod_id,
-        max_quantity=product.stock_count,
+        product_name=product.name,
+        max_quantity=available,
+        to_cart=to_cart,
         _menu_msg_id=callback.message.message_id,
     )
     await state.set_state(OrderStates.waiting_quantity)
@@ -118,8 +130,8 @@ async def start_buy(callback: CallbackQuery, session: AsyncSession, state: FSMCo
         callback,
         f"📦 <b>{product.name}</b>\n\n"
         f"💰 Цена: {product.price:.2f} ₽/шт.\n"
-        f"📊 Доступно: {product.stock_count} шт.\n\n"
-        f"✏️ <b>Введите количество:</b>",
+        f"📊 Доступно: {available} шт.\n\n"
+        f"✏️ <b>Введите количество{' для корзины' if to_cart else ''}:</b>",
         quantity_cancel_kb(prod_id),
     )
     await answer_callback(callback)
@@ -164,22 +176,32 @@ async def process_quantity(message: Message, state: FSMContext, session: AsyncSe
         )
         return
 
-    stmt = select(Product).where(Product.id == prod_id)
-    product = (await session.execute(stmt)).scalar_one_or_none()
-    if not product:
-        await state.clear()
-        return
-
-    stmt_u = select(User).where(User.telegram_id == message.from_user.id)
-    user = (await session.execute(stmt_u)).scalar_one_or_none()
-    if not user:
+    if data.get("to_cart"):
         await state.clear()
+        user = (await session.execute(
+            select(User).where(User.telegram_id == message.from_user.id)
+        )).scalar_one_or_none()
+        if not user:
+            return
+        try:
+            await set_cart_item(session, user.id, prod_id, quantity)
+        except ValueError as e:
+            await session.rollback()
+            await message.bot.edit_message_text(
+                f"❌ {e}", chat_id=message.chat.id, message_id=msg_id,
+                reply_markup=quantity_cancel_kb(prod_id), parse_mode="HTML",
+            )
+            return
+        await session.commit()
+        lines = await get_cart_lines(session, user.id)
+        await message.bot.edit_message_text(
+            cart_text(lines), chat_id=message.chat.id, message_id=msg_id,
+            reply_markup=cart_kb(lines), parse_mode="HTML",
+        )
         return
 
-    discount_percent, total_amount = calculate_total_price(product.price, quantity)
-
     try:
-        reserved = await reserve_accounts(session, prod_id, quantity, None)
+        order = await place_order(session, message.from_user.id, prod_id, quantity)
     except ValueError as e:
         await message.bot.edit_message_text(
             f"❌ {e}",
@@ -188,44 +210,19 @@ async def process_quantity(message: Message, state: FSMContext, session: AsyncSe
         )
         await state.clear()
         return
-
-    order = Order(
-        user_id=user.id,
-        product_id=prod_id,
-        quantity=quantity,
-        price_per_unit=product.price,
-        discount=discount_percent,
-        total_amount=total_amount,
-        status="ОЖИДАЕТ ОПЛАТЫ",
-        reserved_until=datetime.now() + timedelta(minutes=settings.ORDER_RESERVATION_MINUTES),
-    )
-    session.add(order)
-    await session.flush()
-
-    account_ids = [a.id for a in reserved]
-    await session.execute(
-        update(Account).where(Account.id.in_(account_ids)).values(order_id=order.id)
-    )
     await session.commit()
-    await session.refresh(order)
-
-    try:
-        from src.services.notifications import notify_new_order
-        await notify_new_order(session, order, message.bot)
-    except Exception as e:
-        logger.error("Order notification error: %s", e)
 
     await state.clear()
 
     text = (
         f"📦 <b>Заказ #{order.id}</b>\n\n"
-        f"Товар: {product.name}\n"
-        f"Количество: {quantity} шт.\n"
-        f"Цена: {product.price:.2f} ₽/шт.\n"
+        f"Товар: {data.get('product_name', '')}\n"
+        f"Количество: {order.quantity} шт.\n"
+        f"Цена: {order.price_per_unit:.2f} ₽/шт.\n"
     )
-    if discount_percent > 0:
-        text += f"Скидка: {discount_percent}%\n"
-    text += f"💰 <b>Итого: {total_amount:.2f} ₽</b>\n\nВыберите способ оплаты:"
+    if order.discount > 0:
+        text += f"Скидка: {order.discount}%\n"
+    text += f"💰 <b>Итого: {order.total_amount:.2f} ₽</b>\n\nВыберите способ оплаты:"
 
     await message.bot.edit_message_text(
         text,
@@ -7,6 +7,7 @@
 import logging
 
 from aiogram import F, Router
+from aiogram.exceptions import TelegramForbiddenError
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
 from sqlalchemy import select
@@ -178,6 +179,8 @@ async def process_admin_reply(message: Message, state: FSMContext):
     try:
         await message.bot.send_message(target_user_id, user_notification, parse_mode="HTML")
         result = f"✅ Ответ отправлен пользователю {target_user_id}."
+    except TelegramForbiddenError:
+        result = f"🚫 Пользователь {target_user_id} заблокировал бота — сообщение не доставлено."
     except Exception as e:
         logger.error("Cannot send reply to user %s: %s", target_user_id, e)
         result = f"❌ Не удалось отправить ответ пользователю {target_user_id}."
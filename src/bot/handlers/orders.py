@@ -3,14 +3,15 @@ import logging
 
 from aiogram import F, Router
 from aiogram.types import CallbackQuery
-from sqlalchemy import select, update
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.bot.keyboards import order_detail_kb, orders_kb, payment_methods_kb
 from src.bot.texts import order_text
 from src.bot.utils import answer_callback, safe_edit
-from src.database.models import Account, Order, Product, User
+from src.database.models import Order, Product, User
 from src.services.account_service import create_accounts_file, get_accounts_for_order
+from src.services.order_service import cancel_pending_order
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -89,24 +90,14 @@ async def cancel_order(callback: CallbackQuery, session: AsyncSession):
     if order.status != "ОЖИДАЕТ ОПЛАТЫ":
         await answer_callback(callback, "Этот заказ нельзя отменить")
         return
+    if order.cart_id:
+        # По корзине мог уйти общий счёт: отменяется только вся корзина
+        await answer_callback(callback, "Заказ из корзины — отмените корзину целиком")
+        return
 
-    # Возврат аккаунтов
-    stmt_acc = select(Account).where(Account.order_id == order.id)
-    accounts = (await session.execute(stmt_acc)).scalars().all()
-    if accounts:
-        acc_ids = [a.id for a in accounts]
-        await session.execute(
-            update(Account).where(Account.id.in_(acc_ids)).values(is_sold=False, sold_at=None, order_id=None)
-        )
-        await session.execute(
-            update(Product).where(Product.id == order.product_id).values(
-                stock_count=Product.stock_count + order.quantity
-            )
-        )
-
-    order.status = "ОТМЕНЕНО"
-    order.reserved_until = None
-    await session.commit()
+    if not await cancel_pending_order(session, order.id):
+        await answer_callback(callback, "Этот заказ нельзя отменить")
+        return
 
     from src.bot.keyboards import noop_kb
     await safe_edit(
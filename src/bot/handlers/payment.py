@@ -1,60 +1,34 @@
 """Обработка оплаты заказа — inline-only single-message UI"""
 import logging
-from datetime import datetime
 
 from aiogram import F, Router
 from aiogram.types import CallbackQuery, LabeledPrice, PreCheckoutQuery
-from sqlalchemy import select, update
+from sqlalchemy import func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.bot.keyboards import noop_kb, payment_methods_kb
 from src.bot.texts import order_text
 from src.bot.utils import answer_callback, safe_edit
-from src.database.models import Account, Order, Payment, Product, ReferralTransaction, User
+from src.database.models import Account, BalanceLedger, Cart, Order, Payment, Product, User
 from src.services.account_service import get_accounts_for_order, reserve_accounts
+from src.services.cart_service import cart_pending_total, complete_cart, pay_cart_from_balance
+from src.services.order_service import complete_order, pay_order_from_balance
+from src.services.payment_events import apply_payment_success
 from src.services.payment import PaymentService
 
 logger = logging.getLogger(__name__)
 router = Router()
 
 
-async def _complete_order(session: AsyncSession, order: Order, payment_method: str, bot) -> str:
-    """Завершить заказ: зачислить аккаунты, начислить реферальный бонус."""
-    order.status = "ВЫПОЛНЕНО"
-    order.payment_method = payment_method
-    order.paid_at = datetime.now()
-    order.completed_at = datetime.now()
+PAID_TEXT = "✅ Заказ оплачен и выполнен!"
 
-    # Реферальный бонус
-    stmt_user = select(User).where(User.id == order.user_id)
-    user = (await session.execute(stmt_user)).scalar_one_or_none()
-    if user and user.referred_by:
-        from src.config import settings as cfg
-        commission_rate = cfg.REFERRAL_COMMISSION / 100
-        commission = order.total_amount * commission_rate
-        if commission > 0:
-            stmt_ref = select(User).where(User.id == user.referred_by)
-            referrer = (await session.execute(stmt_ref)).scalar_one_or_none()
-            if referrer:
-                referrer.balance += commission
-                session.add(ReferralTransaction(
-                    referrer_id=referrer.id,
-                    referred_id=user.id,
-                    order_id=order.id,
-                    amount=order.total_amount,
-                    commission=commission,
-                ))
-
-    await session.commit()
-
-    # Уведомляем админов
-    try:
-        from src.services.notifications import notify_admins_about_purchase
-        await notify_admins_about_purchase(session, order, bot)
-    except Exception as e:
-        logger.error("Notification error: %s", e)
 
-    return "✅ Заказ оплачен и выполнен!"
+async def _show_payment_result(callback: CallbackQuery, order: Order, completed: bool) -> None:
+    if completed:
+        await safe_edit(callback, f"{PAID_TEXT}\n\n{order_text(order)}", noop_kb())
+    else:
+        await safe_edit(callback, f"ℹ️ Заказ уже {order.status.lower()}.", noop_kb())
+    await answer_callback(callback)
 
 
 @router.callback_query(F.data.startswith("pay:"))
@@ -91,7 +65,9 @@ async def process_payment(callback: CallbackQuery, session: AsyncSession):
 
     # ── Оплата с баланса ──
     if method == "balance":
-        if user.balance < order.total_amount:
+        try:
+            completed = await pay_order_from_balance(session, order, user)
+        except ValueError:
             await safe_edit(
                 callback,
                 f"❌ Недостаточно средств.\n\n"
@@ -102,10 +78,7 @@ async def process_payment(callback: CallbackQuery, session: AsyncSession):
             await answer_callback(callback)
             return
 
-        user.balance -= order.total_amount
-        result_msg = await _complete_order(session, order, "balance", callback.bot)
-        await safe_edit(callback, f"{result_msg}\n\n{order_text(order)}", noop_kb())
-        await answer_callback(callback)
+        await _show_payment_result(callback, order, completed)
         return
 
     # ── Тестовая оплата ──
@@ -115,9 +88,9 @@ async def process_payment(callback: CallbackQuery, session: AsyncSession):
             await answer_callback(callback, "🧪 Тестовая оплата отключена.")
             return
 
-        result_msg = await _complete_order(session, order, "test", callback.bot)
-        await safe_edit(callback, f"{result_msg}\n\n{order_text(order)}", noop_kb())
-        await answer_callback(callback)
+        completed = await complete_order(session, order.id, "test")
+        await session.commit()
+        await _show_payment_result(callback, order, completed)
         return
 
     # ── Telegram Stars ──
@@ -139,52 +112,157 @@ async def process_payment(callback: CallbackQuery, session: AsyncSession):
         return
 
     # ── YooKassa / Heleket / Robokassa / Lava ──
+    await _provider_checkout(
+        callback, session, user, method, order.total_amount,
+        title=f"Оплата заказа #{order.id}",
+        retry_kb=payment_methods_kb(order.id),
+        order=order,
+    )
+
+
+async def _provider_checkout(
+    callback: CallbackQuery,
+    session: AsyncSession,
+    user: User,
+    method: str,
+    amount: float,
+    *,
+    title: str,
+    retry_kb,
+    order: Order = None,
+    cart_id: int = None,
+) -> None:
+    """Создать платёж у провайдера (за заказ или корзину), сохранить его как PENDING и показать ссылку."""
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-    payment_url = None
-    payment_id = None
+    order_id = order.id if order else None
 
     if method == "yookassa":
-        result = await PaymentService.create_yookassa_payment(order.total_amount, order.id, user.telegram_id)
-        if result:
-            payment_url = result.get("payment_url")
-            payment_id = result.get("payment_id")
+        result = await PaymentService.create_yookassa_payment(amount, order_id, user.telegram_id, cart_id)
     elif method == "heleket":
-        result = await PaymentService.create_heleket_payment(order.total_amount, order.id, user.telegram_id)
-        if result:
-            payment_url = result.get("payment_url")
-            payment_id = result.get("payment_id")
+        result = await PaymentService.create_heleket_payment(amount, order_id, user.telegram_id, cart_id)
     else:
-        await safe_edit(callback, f"❌ Метод оплаты «{method}» не поддерживается.", payment_methods_kb(order.id))
+        await safe_edit(callback, f"❌ Метод оплаты «{method}» не поддерживается.", retry_kb)
         await answer_callback(callback)
         return
 
-    if payment_url:
-        if payment_id:
+    payment_url = result.get("payment_url") if result else None
+    payment_id = result.get("payment_id") if result else None
+    if not payment_url:
+        await safe_edit(callback, "❌ Ошибка создания платежа. Попробуйте позже.", retry_kb)
+        await answer_callback(callback)
+        return
+
+    if payment_id:
+        if order:
             order.payment_id = payment_id
             order.payment_method = method
-            payment = Payment(
-                user_id=user.id, amount=order.total_amount,
-                payment_method=method, payment_id=payment_id,
-                order_id=order.id, status="PENDING",
+        session.add(Payment(
+            user_id=user.id, amount=amount,
+            payment_method=method, payment_id=payment_id,
+            order_id=order_id, cart_id=cart_id, status="PENDING",
+        ))
+        await session.commit()
+
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="💳 Оплатить", url=payment_url)],
+        [InlineKeyboardButton(text="◀️ Назад", callback_data="menu:orders")],
+    ])
+    await safe_edit(
+        callback,
+        f"💳 <b>{title}</b>\n\n"
+        f"💰 Сумма: {amount:.2f} ₽\n\n"
+        "Нажмите кнопку для перехода к оплате:",
+        kb,
+    )
+    await answer_callback(callback)
+
+
+# ═══════════════════════════════════════════════
+# Оплата корзины — один платёж на все её заказы
+# ═══════════════════════════════════════════════
+
+@router.callback_query(F.data.startswith("cpay:"))
+async def process_cart_payment(callback: CallbackQuery, session: AsyncSession):
+    parts = callback.data.split(":")
+    try:
+        method, cart_id = parts[1], int(parts[2])
+    except (IndexError, ValueError):
+        await answer_callback(callback, "❌ Ошибка")
+        return
+
+    stmt_user = select(User).where(User.telegram_id == callback.from_user.id)
+    user = (await session.execute(stmt_user)).scalar_one_or_none()
+    cart = await session.get(Cart, cart_id)
+    if not user or not cart or cart.user_id != user.id:
+        await answer_callback(callback, "⛔ Нет доступа.")
+        return
+
+    total, pending = await cart_pending_total(session, cart_id)
+    if not pending:
+        await safe_edit(callback, "ℹ️ Заказы корзины уже оплачены или отменены.", noop_kb())
+        await answer_callback(callback)
+        return
+
+    if method == "balance":
+        try:
+            completed = await pay_cart_from_balance(session, cart_id, user)
+        except ValueError:
+            await safe_edit(
+                callback,
+                f"❌ Недостаточно средств.\n\n"
+                f"💰 Баланс: {user.balance:.2f} ₽\n"
+                f"💳 Нужно: {total:.2f} ₽",
+                payment_methods_kb(cart_id, cart=True),
             )
-            session.add(payment)
-            await session.commit()
-
-        kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="💳 Оплатить", url=payment_url)],
-            [InlineKeyboardButton(text="◀️ Назад", callback_data="menu:orders")],
-        ])
-        await safe_edit(
-            callback,
-            f"💳 <b>Оплата заказа #{order.id}</b>\n\n"
-            f"💰 Сумма: {order.total_amount:.2f} ₽\n\n"
-            "Нажмите кнопку для перехода к оплате:",
-            kb,
-        )
-    else:
-        await safe_edit(callback, "❌ Ошибка создания платежа. Попробуйте позже.", payment_methods_kb(order.id))
+            await answer_callback(callback)
+            return
+        await _show_cart_result(callback, cart_id, completed)
+        return
 
+    if method == "test":
+        from src.config import settings as cfg
+        if not cfg.ENABLE_TEST_PAYMENT:
+            await answer_callback(callback, "🧪 Тестовая оплата отключена.")
+            return
+        completed = bool(await complete_cart(session, cart_id, "test"))
+        await session.commit()
+        await _show_cart_result(callback, cart_id, completed)
+        return
+
+    if method == "stars":
+        try:
+            await callback.message.answer_invoice(
+                title=f"Корзина #{cart_id}",
+                description=f"Оплата {pending} заказов на {total:.2f} ₽",
+                payload=f"cart_{cart_id}",
+                currency="XTR",
+                prices=[LabeledPrice(label="Оплата", amount=max(1, int(total)))],
+            )
+            await safe_edit(callback, "⭐ Счёт на оплату Stars отправлен ниже.", noop_kb())
+        except Exception as e:
+            logger.error("Stars invoice error: %s", e)
+            await safe_edit(callback, "❌ Ошибка создания счёта Stars.", payment_methods_kb(cart_id, cart=True))
+        await answer_callback(callback)
+        return
+
+    await _provider_checkout(
+        callback, session, user, method, total,
+        title=f"Оплата корзины #{cart_id}",
+        retry_kb=payment_methods_kb(cart_id, cart=True),
+        cart_id=cart_id,
+    )
+
+
+async def _show_cart_result(callback: CallbackQuery, cart_id: int, completed: bool) -> None:
+    from src.bot.keyboards import main_menu_kb
+    from src.bot.handlers.start import is_admin
+
+    if completed:
+        text = f"✅ Корзина #{cart_id} оплачена, заказы выполнены!\n\nДанные — в разделе «Заказы»."
+    else:
+        text = "ℹ️ Заказы корзины уже оплачены или отменены."
+    await safe_edit(callback, text, main_menu_kb(is_admin(callback.from_user.id)))
     await answer_callback(callback)
 
 
@@ -195,7 +273,15 @@ async def process_payment(callback: CallbackQuery, session: AsyncSession):
 @router.pre_checkout_query()
 async def stars_pre_checkout(query: PreCheckoutQuery, session: AsyncSession):
     payload = query.invoice_payload or ""
-    if payload.startswith("order_"):
+    if payload.startswith("cart_"):
+        try:
+            _, pending = await cart_pending_total(session, int(payload.split("_")[1]))
+            if pending:
+                await query.answer(ok=True)
+                return
+        except Exception:
+            pass
+    elif payload.startswith("order_"):
         try:
             order_id = int(payload.split("_")[1])
             stmt = select(Order).where(Order.id == order_id, Order.status == "ОЖИДАЕТ ОПЛАТЫ")
@@ -211,6 +297,9 @@ async def stars_pre_checkout(query: PreCheckoutQuery, session: AsyncSession):
 @router.message(F.successful_payment)
 async def stars_successful_payment(message, session: AsyncSession):
     payload = message.successful_payment.invoice_payload or ""
+    if payload.startswith("cart_"):
+        await _stars_cart_paid(message, session, payload)
+        return
     if not payload.startswith("order_"):
         return
 
@@ -221,10 +310,23 @@ async def stars_successful_payment(message, session: AsyncSession):
 
     stmt = select(Order).where(Order.id == order_id)
     order = (await session.execute(stmt)).scalar_one_or_none()
-    if not order or order.status != "ОЖИДАЕТ ОПЛАТЫ":
+    if not order:
         return
 
-    result_msg = await _complete_order(session, order, "stars", message.bot)
+    # Деньги уже списаны Telegram: через общий путь платёжных событий заказ
+    # выполняется ровно один раз, а если бронь успела истечь — на баланс уходит
+    # оплаченная сумма (1 ⭐ = 1 ₽, как в счёте).
+    await apply_payment_success(
+        session, "stars", message.successful_payment.telegram_payment_charge_id,
+        order_id=order.id,
+        telegram_id=message.from_user.id,
+        amount=float(message.successful_payment.total_amount),
+    )
+    await session.refresh(order)
+    if order.status == "ВЫПОЛНЕНО":
+        result_msg = PAID_TEXT
+    else:
+        result_msg = "ℹ️ Бронь заказа истекла — оплата зачислена на баланс."
 
     from src.bot.keyboards import main_menu_kb
     from src.bot.handlers.start import is_admin
@@ -234,3 +336,50 @@ async def stars_successful_payment(message, session: AsyncSession):
         reply_markup=main_menu_kb(is_admin(message.from_user.id)),
         parse_mode="HTML",
     )
+
+
+async def _stars_cart_paid(message, session: AsyncSession, payload: str) -> None:
+    try:
+        cart_id = int(payload.split("_")[1])
+    except (IndexError, ValueError):
+        return
+
+    # Зачисляется ровно оплаченная сумма (1 ⭐ = 1 ₽, как в счёте): если часть
+    # заказов успела отмениться, apply_payment_success вернёт их долю на баланс
+    charge_id = message.successful_payment.telegram_payment_charge_id
+    paid = float(message.successful_payment.total_amount)
+    await apply_payment_success(
+        session, "stars", charge_id,
+        cart_id=cart_id,
+        telegram_id=message.from_user.id,
+        amount=paid,
+    )
+    # Что ушло на баланс, а не на заказы, — по записи журнала этого платежа
+    credited = (await session.execute(
+        select(func.coalesce(func.sum(BalanceLedger.amount), 0.0))
+        .join(User, User.id == BalanceLedger.user_id)
+        .where(
+            User.telegram_id == message.from_user.id,
+            BalanceLedger.reason == "topup",
+            BalanceLedger.ref == f"stars:{charge_id}",
+        )
+    )).scalar()
+
+    from src.bot.keyboards import main_menu_kb
+    from src.bot.handlers.start import is_admin
+
+    if paid - credited < 0.01:
+        text = f"ℹ️ Заказы корзины #{cart_id} уже отменены — оплата {paid:.2f} ₽ зачислена на баланс."
+    elif credited >= 0.01:
+        text = (
+            f"✅ Корзина #{cart_id} оплачена!\n\n"
+            f"Часть заказов была отменена — {credited:.2f} ₽ зачислено на баланс.\n"
+            f"Данные — в разделе «Заказы»."
+        )
+    else:
+        text = f"✅ Корзина #{cart_id} оплачена!\n\nДанные — в разделе «Заказы»."
+    await message.answer(
+        text,
+        reply_markup=main_menu_kb(is_admin(message.from_user.id)),
+        parse_mode="HTML",
+    )
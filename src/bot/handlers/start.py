@@ -37,7 +37,7 @@ def is_developer(user_id: int, user=None) -> bool:
     return user is not None and user.role == "developer"
 
 
-async def get_or_create_user(session: AsyncSession, tg_user, text: str = "", bot=None) -> tuple:
+async def get_or_create_user(session: AsyncSession, tg_user, text: str = "") -> tuple:
     user_id = tg_user.id
     stmt = select(User).where(User.telegram_id == user_id)
     result = await session.execute(stmt)
@@ -88,16 +88,12 @@ async def get_or_create_user(session: AsyncSession, tg_user, text: str = "", bot
         role=user_role,
     )
     session.add(user)
+    await session.flush()
+    from src.services.notifications import notify_user_registration
+    await notify_user_registration(session, user)
     await session.commit()
     await session.refresh(user)
 
-    try:
-        from src.services.notifications import notify_user_registration
-        if bot:
-            await notify_user_registration(session, user, bot)
-    except Exception as e:
-        logger.error("Registration notification error: %s", e)
-
     return user, True
 
 
@@ -124,7 +120,10 @@ async def get_welcome(session: AsyncSession, is_new: bool, name: str = "") -> st
 @router.message(CommandStart(), F.chat.type == ChatType.PRIVATE)
 async def cmd_start(message: Message, session: AsyncSession, state: FSMContext):
     await state.clear()
-    user, is_new = await get_or_create_user(session, message.from_user, message.text or "", bot=message.bot)
+    user, is_new = await get_or_create_user(session, message.from_user, message.text or "")
+    if not is_new:
+        from src.services.bot_blocked import clear_bot_blocked
+        await clear_bot_blocked(session, user)
     text = await get_welcome(session, is_new, message.from_user.first_name or "")
     try:
         await message.delete()
@@ -1,114 +1,63 @@
-"""HTTP-webhook для платёжных систем (YooKassa / Heleket)."""
+"""HTTP-webhook для платёжных систем (YooKassa / Heleket).
+
+Endpoint'ы только проверяют запрос и кладут событие в inbox — обработка идёт
+в фоновых воркерах (src/services/inbox.py).
+"""
+import json
 import logging
-from datetime import datetime
 
 from aiohttp import web
-from sqlalchemy import select
 
-from src.database.database import async_session_maker
-from src.database.models import Order, Payment, User
+from src.config import settings
+from src.services.inbox import store_event
 from src.services.payment import PaymentService
+from src.services.payment_events import heleket_event_id, yookassa_event_id
 
 logger = logging.getLogger(__name__)
 
+SIGNATURE_HEADER = "X-Signature"
+
+_PROVIDERS = {
+    "yookassa": (yookassa_event_id, PaymentService.verify_yookassa_webhook),
+    "heleket": (heleket_event_id, PaymentService.verify_heleket_webhook),
+}
 
-async def yookassa_webhook(request: web.Request) -> web.Response:
-    """Обработка webhook от ЮKassa."""
-    try:
-        data = await request.json()
-        event_type = data.get("event", "")
-        payment_obj = data.get("object", {})
-        payment_id = payment_obj.get("id")
-        status = payment_obj.get("status")
-        metadata = payment_obj.get("metadata", {})
-
-        if event_type != "payment.succeeded" or status != "succeeded":
-            return web.Response(status=200, text="OK")
-
-        order_id = metadata.get("order_id")
-        user_id = metadata.get("user_id")
-
-        if not payment_id:
-            return web.Response(status=200, text="OK")
-
-        async with async_session_maker() as session:
-            # Ищем платёж
-            stmt_pay = select(Payment).where(Payment.payment_id == payment_id)
-            payment = (await session.execute(stmt_pay)).scalar_one_or_none()
-            if payment:
-                payment.status = "COMPLETED"
-                payment.completed_at = datetime.now()
-
-            if order_id:
-                order = (await session.execute(
-                    select(Order).where(Order.id == int(order_id))
-                )).scalar_one_or_none()
-                if order and order.status == "ОЖИДАЕТ ОПЛАТЫ":
-                    order.status = "ВЫПОЛНЕНО"
-                    order.payment_method = "yookassa"
-                    order.paid_at = datetime.now()
-                    order.completed_at = datetime.now()
-            elif user_id:
-                # Пополнение баланса
-                amount = float(payment_obj.get("amount", {}).get("value", 0))
-                if amount > 0:
-                    user = (await session.execute(
-                        select(User).where(User.telegram_id == int(user_id))
-                    )).scalar_one_or_none()
-                    if user:
-                        user.balance += amount
-
-            await session.commit()
 
+async def _accept(request: web.Request, provider: str) -> web.Response:
+    """Проверить запрос и сохранить событие в inbox."""
+    event_id_of, verify = _PROVIDERS[provider]
+    raw = await request.text()
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return web.Response(status=400, text="Bad Request")
+    if not isinstance(data, dict):
+        return web.Response(status=400, text="Bad Request")
+
+    if settings.WEBHOOK_VERIFY_SIGNATURE and not verify(data, request.headers.get(SIGNATURE_HEADER, "")):
+        logger.warning("%s webhook: invalid signature from %s", provider, request.remote)
+        return web.Response(status=403, text="Forbidden")
+
+    event_id = event_id_of(data)
+    if not event_id:
         return web.Response(status=200, text="OK")
+
+    try:
+        await store_event(provider, event_id, raw)
     except Exception as e:
-        logger.error("YooKassa webhook error: %s", e, exc_info=True)
+        logger.error("%s webhook: failed to store event %s: %s", provider, event_id, e, exc_info=True)
         return web.Response(status=500, text="Error")
+    return web.Response(status=200, text="OK")
 
 
-async def heleket_webhook(request: web.Request) -> web.Response:
-    """Обработка webhook от Heleket."""
-    try:
-        data = await request.json()
-        payment_id = data.get("payment_id")
-        status = data.get("status")
-        order_id = data.get("order_id")
-        user_id = data.get("user_id")
-
-        if status != "completed" or not payment_id:
-            return web.Response(status=200, text="OK")
-
-        async with async_session_maker() as session:
-            stmt_pay = select(Payment).where(Payment.payment_id == payment_id)
-            payment = (await session.execute(stmt_pay)).scalar_one_or_none()
-            if payment:
-                payment.status = "COMPLETED"
-                payment.completed_at = datetime.now()
-
-            if order_id and str(order_id) != "0":
-                order = (await session.execute(
-                    select(Order).where(Order.id == int(order_id))
-                )).scalar_one_or_none()
-                if order and order.status == "ОЖИДАЕТ ОПЛАТЫ":
-                    order.status = "ВЫПОЛНЕНО"
-                    order.payment_method = "heleket"
-                    order.paid_at = datetime.now()
-                    order.completed_at = datetime.now()
-            elif user_id:
-                amount = float(data.get("amount", 0))
-                if amount > 0:
-                    user = (await session.execute(
-                        select(User).where(User.telegram_id == int(user_id))
-                    )).scalar_one_or_none()
-                    if user:
-                        user.balance += amount
-
-            await session.commit()
+async def yookassa_webhook(request: web.Request) -> web.Response:
+    """Приём webhook от ЮKassa."""
+    return await _accept(request, "yookassa")
 
-        return web.Response(status=200, text="OK")
-    except Exception as e:
-        logger.error("Heleket webhook error: %s", e, exc_info=True)
-        return web.Response(status=500, text="Error")
+
+async def heleket_webhook(request: web.Request) -> web.Response:
+    """Приём webhook от Heleket."""
+    return await _accept(request, "heleket")
 
 
 def setup_webhook_routes(app: web.Application) -> None:
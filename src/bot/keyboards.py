@@ -35,7 +35,10 @@ def _row(*buttons: InlineKeyboardButton) -> list:
 
 def main_menu_kb(is_admin: bool = False) -> InlineKeyboardMarkup:
     rows = [
-        [InlineKeyboardButton(text="📂 Каталог", callback_data="menu:catalog")],
+        [
+            InlineKeyboardButton(text="📂 Каталог", callback_data="menu:catalog"),
+            InlineKeyboardButton(text="🛒 Корзина", callback_data="menu:cart"),
+        ],
         [
             InlineKeyboardButton(text="💰 Баланс", callback_data="menu:balance"),
             InlineKeyboardButton(text="📦 Заказы", callback_data="menu:orders"),
@@ -82,9 +85,10 @@ def products_kb(products: List, category_id: int) -> InlineKeyboardMarkup:
 def product_detail_kb(product_id: int, has_stock: bool, category_id: int) -> InlineKeyboardMarkup:
     rows = []
     if has_stock:
-        rows.append([InlineKeyboardButton(
-            text="💳 Купить", callback_data=f"buy:{product_id}", style="success",
-        )])
+        rows.append([
+            InlineKeyboardButton(text="💳 Купить", callback_data=f"buy:{product_id}", style="success"),
+            InlineKeyboardButton(text="🛒 В корзину", callback_data=f"cart:add:{product_id}"),
+        ])
     else:
         rows.append([InlineKeyboardButton(
             text="🔔 Уведомить о поступлении", callback_data=f"notify:{product_id}",
@@ -106,22 +110,43 @@ def quantity_cancel_kb(product_id: int) -> InlineKeyboardMarkup:
 # ОПЛАТА
 # ═══════════════════════════════════════════════
 
-def payment_methods_kb(order_id: int) -> InlineKeyboardMarkup:
+def payment_methods_kb(order_id: int, cart: bool = False) -> InlineKeyboardMarkup:
+    """Способы оплаты заказа (или корзины при cart=True, тогда order_id — id корзины)."""
+    pay = "cpay" if cart else "pay"
     rows = [
-        [InlineKeyboardButton(text="💳 С баланса", callback_data=f"pay:balance:{order_id}")],
+        [InlineKeyboardButton(text="💳 С баланса", callback_data=f"{pay}:balance:{order_id}")],
     ]
     if settings.YOOKASSA_SHOP_ID and settings.YOOKASSA_SECRET_KEY:
-        rows.append([InlineKeyboardButton(text="💳 ЮКасса", callback_data=f"pay:yookassa:{order_id}")])
+        rows.append([InlineKeyboardButton(text="💳 ЮКасса", callback_data=f"{pay}:yookassa:{order_id}")])
     if settings.ROBOKASSA_MERCHANT_LOGIN and settings.ROBOKASSA_PASSWORD_1:
-        rows.append([InlineKeyboardButton(text="💳 Robokassa", callback_data=f"pay:robokassa:{order_id}")])
+        rows.append([InlineKeyboardButton(text="💳 Robokassa", callback_data=f"{pay}:robokassa:{order_id}")])
     if settings.LAVA_PROJECT_ID and settings.LAVA_SECRET_KEY:
-        rows.append([InlineKeyboardButton(text="💳 Lava", callback_data=f"pay:lava:{order_id}")])
+        rows.append([InlineKeyboardButton(text="💳 Lava", callback_data=f"{pay}:lava:{order_id}")])
     if settings.HELEKET_API_KEY:
-        rows.append([InlineKeyboardButton(text="💳 Heleket", callback_data=f"pay:heleket:{order_id}")])
-    rows.append([InlineKeyboardButton(text="⭐ Telegram Stars", callback_data=f"pay:stars:{order_id}")])
+        rows.append([InlineKeyboardButton(text="💳 Heleket", callback_data=f"{pay}:heleket:{order_id}")])
+    rows.append([InlineKeyboardButton(text="⭐ Telegram Stars", callback_data=f"{pay}:stars:{order_id}")])
     if settings.ENABLE_TEST_PAYMENT:
-        rows.append([InlineKeyboardButton(text="🧪 Тестовая", callback_data=f"pay:test:{order_id}")])
-    rows.append([InlineKeyboardButton(text="❌ Отменить заказ", callback_data=f"cancel:{order_id}", style="danger")])
+        rows.append([InlineKeyboardButton(text="🧪 Тестовая", callback_data=f"{pay}:test:{order_id}")])
+    if cart:
+        rows.append([InlineKeyboardButton(text="❌ Отменить заказы", callback_data=f"ccancel:{order_id}", style="danger")])
+    else:
+        rows.append([InlineKeyboardButton(text="❌ Отменить заказ", callback_data=f"cancel:{order_id}", style="danger")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+# ═══════════════════════════════════════════════
+# КОРЗИНА
+# ═══════════════════════════════════════════════
+
+def cart_kb(lines: List) -> InlineKeyboardMarkup:
+    rows = [
+        [InlineKeyboardButton(text=f"❌ {line.name} — {line.quantity} шт.", callback_data=f"cart:del:{line.product_id}")]
+        for line in lines
+    ]
+    if lines:
+        rows.append([InlineKeyboardButton(text="✅ Оформить заказ", callback_data="cart:checkout", style="success")])
+        rows.append([InlineKeyboardButton(text="🗑 Очистить", callback_data="cart:clear", style="danger")])
+    rows.append([_back("menu:catalog"), _menu()])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
@@ -254,7 +279,10 @@ def admin_menu_kb() -> InlineKeyboardMarkup:
             InlineKeyboardButton(text="📊 Статистика", callback_data="adm:stats"),
             InlineKeyboardButton(text="📝 Логи ошибок", callback_data="adm:logs"),
         ],
-        [InlineKeyboardButton(text="⚙️ Настройки", callback_data="adm:settings")],
+        [
+            InlineKeyboardButton(text="📤 Уведомления", callback_data="adm:outbox"),
+            InlineKeyboardButton(text="⚙️ Настройки", callback_data="adm:settings"),
+        ],
         _back_menu_row("menu:main"),
     ])
 
@@ -481,6 +509,42 @@ def admin_broadcast_kb() -> InlineKeyboardMarkup:
     ])
 
 
+def broadcast_audience_kb(segments: dict) -> InlineKeyboardMarkup:
+    """Выбор аудитории массовой рассылки: {вид: подпись}."""
+    rows = [[InlineKeyboardButton(text=title, callback_data=f"adm:bcast:aud:{kind}")] for kind, title in segments.items()]
+    rows.append(_back_menu_row("adm:broadcast"))
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def broadcast_categories_kb(categories: List) -> InlineKeyboardMarkup:
+    rows = [
+        [InlineKeyboardButton(text=f"📂 {cat.name}", callback_data=f"adm:bcast:aud:category:{cat.id}")]
+        for cat in categories
+    ]
+    rows.append(_back_menu_row("adm:bcast:mass"))
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def broadcast_progress_kb(job_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⛔ Остановить", callback_data=f"adm:bcast:stop:{job_id}", style="danger")],
+    ])
+
+
+# ═══════════════════════════════════════════════
+# АДМИН — ОЧЕРЕДЬ УВЕДОМЛЕНИЙ
+# ═══════════════════════════════════════════════
+
+def admin_outbox_kb(dead: int) -> InlineKeyboardMarkup:
+    rows = [[InlineKeyboardButton(text="🔄 Обновить", callback_data="adm:outbox")]]
+    if dead:
+        rows.append([
+            InlineKeyboardButton(text=f"🔁 Повторить недоставленные ({dead})", callback_data="adm:outbox:retry"),
+        ])
+    rows.append(_back_menu_row("menu:admin"))
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
 # ═══════════════════════════════════════════════
 # ОБЩИЕ
 # ═══════════════════════════════════════════════
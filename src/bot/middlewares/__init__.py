@@ -1,12 +1,16 @@
 """Middleware бота"""
 from src.bot.middlewares.blocked_user import BlockedUserMiddleware
+from src.bot.middlewares.bot_blocked import BotBlockedMiddleware
 from src.bot.middlewares.database import DatabaseMiddleware
 from src.bot.middlewares.error_handler import ErrorHandlerMiddleware
 from src.bot.middlewares.garbage import GarbageMiddleware
+from src.bot.middlewares.rate_limit import RateLimitMiddleware
 
 __all__ = [
     "BlockedUserMiddleware",
+    "BotBlockedMiddleware",
     "DatabaseMiddleware",
     "ErrorHandlerMiddleware",
     "GarbageMiddleware",
+    "RateLimitMiddleware",
 ]
@@ -1,13 +1,18 @@
 """Middleware для проверки блокировки пользователя (inline-only)"""
+from datetime import datetime, timedelta
 from typing import Any, Awaitable, Callable, Dict
 
 from aiogram import BaseMiddleware
 from aiogram.types import CallbackQuery, Message
-from sqlalchemy import select
+from sqlalchemy import select, update
 
 from src.config import settings
 from src.database.models import User
 
+# users.last_seen_at обновляется не чаще раза в час — это одна запись в час на
+# активного пользователя, а не на каждый апдейт
+LAST_SEEN_RESOLUTION = timedelta(hours=1)
+
 
 class BlockedUserMiddleware(BaseMiddleware):
     """Middleware для проверки блокировки пользователя."""
@@ -48,6 +53,15 @@ class BlockedUserMiddleware(BaseMiddleware):
             result = await session.execute(stmt)
             user = result.scalar_one_or_none()
 
+            now = datetime.now()
+            if user and (user.last_seen_at is None or now - user.last_seen_at >= LAST_SEEN_RESOLUTION):
+                await session.execute(
+                    update(User)
+                    .where(User.id == user.id)
+                    .values(last_seen_at=now, updated_at=User.updated_at)
+                )
+                await session.commit()
+
             if user and user.is_blocked:
                 # Поддержку разрешаем даже заблокированным
                 if is_callback and callback_data and callback_data.startswith("support:"):
@@ -0,0 +1,33 @@
+"""Request-middleware сессии бота: отметка пользователей, заблокировавших бота.
+
+Стоит на bot.session, а не на диспетчере, поэтому видит каждый исходящий
+запрос — рассылки, уведомления, ответы поддержки, фоновые задачи. 403 на
+запрос в личный чат означает, что писать пользователю бесполезно, пока он
+сам не вернётся: чат отмечается в users.bot_blocked_at, ошибка пробрасывается
+дальше как обычно.
+"""
+import logging
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramForbiddenError
+
+from src.services.bot_blocked import mark_bot_blocked
+
+logger = logging.getLogger(__name__)
+
+
+class BotBlockedMiddleware(BaseRequestMiddleware):
+    """Отмечает users.bot_blocked_at при TelegramForbiddenError."""
+
+    async def __call__(self, make_request, bot, method):
+        try:
+            return await make_request(bot, method)
+        except TelegramForbiddenError:
+            chat_id = getattr(method, "chat_id", None)
+            # Положительный chat_id — личный чат, он же telegram_id пользователя
+            if isinstance(chat_id, int) and chat_id > 0:
+                try:
+                    await mark_bot_blocked(chat_id)
+                except Exception as e:
+                    logger.warning("Cannot mark user %s as unreachable: %s", chat_id, e)
+            raise
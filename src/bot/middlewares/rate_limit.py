@@ -0,0 +1,89 @@
+"""Middleware ограничения частоты запросов пользователя.
+
+Стоит раньше DatabaseMiddleware: отклонённый апдейт не открывает сессию и не
+делает ни одного запроса к БД — callback получает короткий ответ, сообщение
+молча игнорируется.
+"""
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message
+
+from src.config import settings
+from src.utils.rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Префикс callback_data → класс действия (у каждого класса своё ведро)
+ACTION_PREFIXES = (
+    ("buy:", "purchase"),
+    ("pay:", "purchase"),
+    ("pay_order:", "purchase"),
+    ("topup:", "purchase"),
+    ("cpay:", "purchase"),
+    ("cart:checkout", "purchase"),
+    ("download:", "download"),
+    ("notify:", "notify"),
+)
+
+THROTTLED_TEXT = "⏳ Слишком часто, подождите немного"
+
+
+def _limits() -> Dict[str, tuple]:
+    return {
+        "default": (settings.RATE_LIMIT_DEFAULT_RATE, settings.RATE_LIMIT_DEFAULT_BURST),
+        "purchase": (settings.RATE_LIMIT_PURCHASE_RATE, settings.RATE_LIMIT_PURCHASE_BURST),
+        "download": (settings.RATE_LIMIT_DOWNLOAD_RATE, settings.RATE_LIMIT_DOWNLOAD_BURST),
+        "notify": (settings.RATE_LIMIT_NOTIFY_RATE, settings.RATE_LIMIT_NOTIFY_BURST),
+        "message": (settings.RATE_LIMIT_MESSAGE_RATE, settings.RATE_LIMIT_MESSAGE_BURST),
+    }
+
+
+def action_of(event: Any) -> Optional[str]:
+    """Класс действия апдейта; None — апдейт не ограничивается.
+
+    Из сообщений ограничиваются только набранные пользователем текст и команды:
+    служебные (successful_payment и т. п.) приходят от Telegram, и их потеря
+    означает, например, списанные деньги без выполненного заказа.
+    """
+    if isinstance(event, Message):
+        return "message" if event.text else None
+    data = event.data or ""
+    for prefix, action in ACTION_PREFIXES:
+        if data.startswith(prefix):
+            return action
+    return "default"
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    """Token bucket на пользователя и класс действия (в памяти процесса)."""
+
+    def __init__(self, limiter: RateLimiter = None):
+        self.limiter = limiter or RateLimiter(_limits())
+        self.throttled = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = getattr(event, "from_user", None)
+        if not settings.RATE_LIMIT_ENABLED or user is None:
+            return await handler(event, data)
+        if user.id in settings.admin_ids_list or user.id in settings.developer_ids_list:
+            return await handler(event, data)
+
+        action = action_of(event)
+        if action is None or self.limiter.allow(user.id, action):
+            return await handler(event, data)
+
+        self.throttled += 1
+        logger.debug("Rate limited user %s (%s)", user.id, action)
+        if isinstance(event, CallbackQuery):
+            try:
+                await event.answer(THROTTLED_TEXT)
+            except Exception:
+                pass
+        return None
@@ -17,6 +17,7 @@ class SupportStates(StatesGroup):
 
 
 class BroadcastStates(StatesGroup):
+    waiting_segment_value = State()
     waiting_message = State()
     waiting_user_id = State()
     waiting_individual_message = State()
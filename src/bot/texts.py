@@ -1,5 +1,6 @@
 """Тексты сообщений"""
 from src.config import settings
+from src.services.discount import calculate_total_price
 
 
 def welcome_text(name: str = "") -> str:
@@ -77,6 +78,22 @@ def order_text(order) -> str:
     return text
 
 
+def cart_text(lines) -> str:
+    if not lines:
+        return "🛒 <b>Корзина</b>\n\nКорзина пуста. Добавьте товары из каталога."
+    text = "🛒 <b>Корзина</b>\n\n"
+    total = 0.0
+    for line in lines:
+        discount, amount = calculate_total_price(line.price, line.quantity)
+        total += amount
+        text += f"• {line.name} — {line.quantity} шт. × {line.price:.2f} ₽"
+        if discount > 0:
+            text += f" (−{discount:g}%)"
+        text += f" = {amount:.2f} ₽\n"
+    text += f"\n💰 <b>Итого: {total:.2f} ₽</b>\n\nНажмите на товар, чтобы убрать его из корзины."
+    return text
+
+
 def product_detail_text(product) -> str:
     has_stock = product.stock_count > 0
     text = (
@@ -33,10 +33,31 @@ class Settings(BaseSettings):
     LAVA_PROJECT_ID: str = ""
     LAVA_SECRET_KEY: str = ""
     HELEKET_API_KEY: str = ""
+    YOOKASSA_API_URL: str = "https://api.yookassa.ru/v3"
+    HELEKET_API_URL: str = "https://api.heleket.com/v1"
+
+    # Payment gateway HTTP client
+    GATEWAY_TIMEOUT: float = 15.0
+    GATEWAY_CONNECT_TIMEOUT: float = 5.0
+    GATEWAY_POOL_LIMIT: int = 20
+    GATEWAY_RETRIES: int = 2
+    GATEWAY_BACKOFF_BASE: float = 0.5
+    GATEWAY_BREAKER_THRESHOLD: int = 5
+    GATEWAY_BREAKER_RESET: float = 30.0
+
+    # Pending payment reconciliation
+    RECONCILE_INTERVAL: int = 120
+    RECONCILE_MIN_AGE: int = 120
+    RECONCILE_MAX_AGE_HOURS: int = 48
+    RECONCILE_BATCH: int = 100
+    RECONCILE_CONCURRENCY: int = 5
 
     # Support
     SUPPORT_CHAT: str = ""
     NOTIFICATIONS_CHAT_ID: str = ""
+    NOTIFY_DIGEST_INTERVAL: float = 60.0
+    NOTIFY_DIGEST_MAX_EVENTS: int = 50
+    NOTIFY_URGENT_AMOUNT: float = 0.0
 
     # Webhook
     WEBHOOK_URL: str = ""
@@ -44,13 +65,70 @@ class Settings(BaseSettings):
     WEBHOOK_SSL_CERT_PATH: str = ""
     WEBHOOK_SSL_KEY_PATH: str = ""
     WEBHOOK_USE_HTTPS: bool = False
+    WEBHOOK_VERIFY_SIGNATURE: bool = False
 
     # Settings
     REFERRAL_COMMISSION: int = 10
     ORDER_RESERVATION_MINUTES: int = 15
-    BROADCAST_THROTTLE: int = 25
+    RESERVATION_SWEEP_INTERVAL: int = 60
+    RESERVATION_SWEEP_BATCH: int = 200
+    STOCK_CACHE_REFRESH_INTERVAL: int = 30
+    STOCK_NOTIFY_INTERVAL: int = 60
+    BOT_SEND_RATE: float = 28.0
+    BROADCAST_RATE: float = 25.0
+    BROADCAST_CONCURRENCY: int = 10
+    BROADCAST_MAX_RETRIES: int = 3
+    BROADCAST_BATCH: int = 500
+    BROADCAST_POLL_INTERVAL: float = 10.0
+    BROADCAST_LEASE_SECONDS: int = 300
+    BROADCAST_PROGRESS_INTERVAL: float = 5.0
     ENABLE_TEST_PAYMENT: bool = False
 
+    # Rate limiting (скорость — действий в секунду, burst — запас подряд)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_DEFAULT_RATE: float = 2.0
+    RATE_LIMIT_DEFAULT_BURST: int = 10
+    RATE_LIMIT_PURCHASE_RATE: float = 0.5
+    RATE_LIMIT_PURCHASE_BURST: int = 4
+    RATE_LIMIT_DOWNLOAD_RATE: float = 0.2
+    RATE_LIMIT_DOWNLOAD_BURST: int = 3
+    RATE_LIMIT_NOTIFY_RATE: float = 0.2
+    RATE_LIMIT_NOTIFY_BURST: int = 3
+    RATE_LIMIT_MESSAGE_RATE: float = 1.0
+    RATE_LIMIT_MESSAGE_BURST: int = 5
+
+    # FSM (memory / postgres / redis)
+    FSM_STORAGE: str = "postgres"
+    FSM_STATE_TTL: int = 86_400
+    REDIS_URL: str = ""
+
+    # Scheduler
+    SCHEDULER_LOCK_KEY: int = 4_250_726
+    SCHEDULER_LEADER_CHECK_INTERVAL: int = 15
+    BACKUP_CRON: str = ""
+    ARCHIVE_CRON: str = "0 4 * * *"
+    ARCHIVE_AFTER_DAYS: int = 30
+    ARCHIVE_BATCH: int = 1000
+
+    # Webhook inbox
+    INBOX_WORKERS: int = 4
+    INBOX_POLL_INTERVAL: float = 2.0
+    INBOX_LEASE_SECONDS: int = 60
+    INBOX_MAX_ATTEMPTS: int = 8
+    INBOX_RETRY_BASE: float = 5.0
+    INBOX_RETRY_MAX: float = 900.0
+    INBOX_RETENTION_DAYS: int = 7
+
+    # Outbox уведомлений
+    OUTBOX_RATE: float = 5.0
+    OUTBOX_POLL_INTERVAL: float = 2.0
+    OUTBOX_BATCH: int = 50
+    OUTBOX_LEASE_SECONDS: int = 60
+    OUTBOX_MAX_ATTEMPTS: int = 10
+    OUTBOX_RETRY_BASE: float = 5.0
+    OUTBOX_RETRY_MAX: float = 900.0
+    OUTBOX_RETENTION_DAYS: int = 7
+
     @property
     def DATABASE_URL(self) -> str:
         """Async PostgreSQL URL"""
@@ -1,6 +1,7 @@
 """Подключение к базе данных"""
 import logging
 
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 
@@ -25,6 +26,56 @@ async_session_maker = async_sessionmaker(
 
 Base = declarative_base()
 
+# Идемпотентные изменения схемы для уже существующих БД:
+# create_all создаёт только недостающие таблицы, но не индексы/колонки в старых.
+SCHEMA_PATCHES = [
+    "CREATE INDEX IF NOT EXISTS idx_accounts_unsold ON accounts (product_id, id) WHERE is_sold = false",
+    "CREATE INDEX IF NOT EXISTS idx_accounts_order ON accounts (order_id)",
+    # Поиск дубликатов при загрузке: account_data — TEXT без ограничения длины,
+    # поэтому индексируется md5 строки, а не она сама
+    "CREATE INDEX IF NOT EXISTS idx_accounts_data_md5 ON accounts (product_id, md5(account_data))",
+    "CREATE INDEX IF NOT EXISTS idx_archive_data_md5 ON accounts_archive (product_id, md5(account_data))",
+    # Дубликаты (payment_method, payment_id) из времён до уникального индекса
+    # помечаются суффиксом «:dup:<id>» (остаётся завершённый или самый ранний;
+    # ожидающие становятся DUPLICATE и не попадают в сверку), иначе индекс не
+    # создастся и бот не запустится. Выполняется один раз — пока индекса нет
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = 'uq_payment_method_payment_id') THEN
+            UPDATE payments p
+            SET payment_id = left(p.payment_id, 200) || ':dup:' || p.id,
+                status = CASE WHEN p.status = 'PENDING' THEN 'DUPLICATE' ELSE p.status END
+            FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY payment_method, payment_id ORDER BY (status = 'COMPLETED') DESC, id
+                ) AS rn
+                FROM payments
+                WHERE payment_id IS NOT NULL
+            ) d
+            WHERE p.id = d.id AND d.rn > 1;
+        END IF;
+    END $$
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_payment_method_payment_id ON payments (payment_method, payment_id)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_pending ON payments (id) WHERE status = 'PENDING'",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_referral_order ON referral_transactions (order_id)",
+    "ALTER TABLE orders ADD COLUMN IF NOT EXISTS cart_id INTEGER REFERENCES carts (id)",
+    "CREATE INDEX IF NOT EXISTS idx_orders_cart ON orders (cart_id) WHERE cart_id IS NOT NULL",
+    "ALTER TABLE payments ADD COLUMN IF NOT EXISTS cart_id INTEGER REFERENCES carts (id)",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS bot_blocked_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS idx_users_reachable ON users (id) WHERE is_blocked = false AND bot_blocked_at IS NULL",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS idx_users_last_seen ON users (last_seen_at)",
+    "CREATE INDEX IF NOT EXISTS idx_users_balance ON users (balance) WHERE balance > 0",
+    "CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users (referred_by) WHERE referred_by IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_orders_done_product ON orders (product_id, user_id) WHERE status = 'ВЫПОЛНЕНО'",
+    "ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS audience VARCHAR(100) NOT NULL DEFAULT 'all'",
+    "ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS media_type VARCHAR(20)",
+    "ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS media_file_id VARCHAR(255)",
+    "CREATE INDEX IF NOT EXISTS idx_stock_pending ON stock_notifications (product_id) WHERE is_notified = false",
+]
+
 
 async def init_db() -> None:
     """Инициализация базы данных — создание всех таблиц."""
@@ -33,6 +84,8 @@ async def init_db() -> None:
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+            for ddl in SCHEMA_PATCHES:
+                await conn.execute(text(ddl))
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error("Database initialization error: %s", e)
@@ -14,8 +14,9 @@ from sqlalchemy import (
     String,
     Text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 from src.database.database import Base
 
@@ -34,12 +35,24 @@ class User(Base):
     referral_code = Column(String(50), unique=True, nullable=True, index=True)
     referred_by = Column(Integer, ForeignKey("users.id"), nullable=True)
     role = Column(String(50), default="user", nullable=False)
+    # Когда Telegram ответил 403 (бот заблокирован, аккаунт удалён); сбрасывается на /start
+    bot_blocked_at = Column(DateTime, nullable=True)
+    # Последнее обращение к боту с точностью до LAST_SEEN_RESOLUTION (сегмент «активные»)
+    last_seen_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=func.now(), nullable=False)
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
 
     orders = relationship("Order", back_populates="user")
     referrals = relationship("User", remote_side=[id], backref="referrer")
 
+    __table_args__ = (
+        Index("idx_users_reachable", "id", postgresql_where=text("is_blocked = false AND bot_blocked_at IS NULL")),
+        # Сегменты рассылок
+        Index("idx_users_last_seen", "last_seen_at"),
+        Index("idx_users_balance", "balance", postgresql_where=text("balance > 0")),
+        Index("idx_users_referred_by", "referred_by", postgresql_where=text("referred_by IS NOT NULL")),
+    )
+
 
 class Category(Base):
     """Категория товаров"""
@@ -65,6 +78,7 @@ class Product(Base):
     description = Column(Text, nullable=True)
     price = Column(Float, nullable=False)
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    # Кэш остатка для отображения; истина — непроданные строки accounts (refresh_stock_counts)
     stock_count = Column(Integer, default=0, nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
     format_info = Column(Text, nullable=True)
@@ -102,7 +116,37 @@ class Account(Base):
     product = relationship("Product", back_populates="accounts")
     order = relationship("Order", back_populates="accounts")
 
-    __table_args__ = (Index("idx_product_sold", "product_id", "is_sold"),)
+    __table_args__ = (
+        Index("idx_product_sold", "product_id", "is_sold"),
+        # Остаток товара считается по этому индексу, а не по Product.stock_count
+        Index("idx_accounts_unsold", "product_id", "id", postgresql_where=text("is_sold = false")),
+        Index("idx_accounts_order", "order_id"),
+        # Поиск дубликатов при загрузке (account_service._find_existing_accounts)
+        Index("idx_accounts_data_md5", "product_id", func.md5(account_data)),
+    )
+
+
+class AccountArchive(Base):
+    """Архив проданных аккаунтов выполненных заказов (перенос из accounts)"""
+
+    __tablename__ = "accounts_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    account_data = Column(Text, nullable=False)
+    sold_at = Column(DateTime, nullable=True)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=True)
+    is_blocked = Column(Boolean, default=False, nullable=False)
+    blocked_at = Column(DateTime, nullable=True)
+    blocked_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("idx_archive_order", "order_id"),
+        Index("idx_archive_product", "product_id"),
+        Index("idx_archive_data_md5", "product_id", func.md5(account_data)),
+    )
 
 
 class Order(Base):
@@ -124,6 +168,8 @@ class Order(Base):
     created_at = Column(DateTime, default=func.now(), nullable=False)
     paid_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
+    # Заказ оформлен из корзины: все строки корзины оплачиваются одним платежом
+    cart_id = Column(Integer, ForeignKey("carts.id"), nullable=True)
 
     user = relationship("User", back_populates="orders")
     product = relationship("Product", back_populates="orders")
@@ -134,6 +180,47 @@ class Order(Base):
         CheckConstraint("total_amount >= 0", name="check_amount_positive"),
         Index("idx_user_status", "user_id", "status"),
         Index("idx_status", "status"),
+        Index("idx_orders_cart", "cart_id", postgresql_where=text("cart_id IS NOT NULL")),
+        # Сегмент рассылки «купившие товар/категорию»
+        Index("idx_orders_done_product", "product_id", "user_id", postgresql_where=text("status = 'ВЫПОЛНЕНО'")),
+    )
+
+
+class Cart(Base):
+    """Корзина: OPEN — собирается, ORDERED — оформлена в заказы"""
+
+    __tablename__ = "carts"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    status = Column(String(20), default="OPEN", nullable=False)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    ordered_at = Column(DateTime, nullable=True)
+
+    items = relationship("CartItem", back_populates="cart")
+
+    __table_args__ = (
+        # Не больше одной открытой корзины на пользователя
+        Index("uq_cart_open_user", "user_id", unique=True, postgresql_where=text("status = 'OPEN'")),
+    )
+
+
+class CartItem(Base):
+    """Строка корзины"""
+
+    __tablename__ = "cart_items"
+
+    id = Column(Integer, primary_key=True)
+    cart_id = Column(Integer, ForeignKey("carts.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+
+    cart = relationship("Cart", back_populates="items")
+
+    __table_args__ = (
+        CheckConstraint("quantity > 0", name="check_cart_quantity_positive"),
+        Index("uq_cart_item_product", "cart_id", "product_id", unique=True),
     )
 
 
@@ -150,7 +237,11 @@ class StockNotification(Base):
 
     product = relationship("Product", back_populates="notifications")
 
-    __table_args__ = (Index("idx_user_product", "user_id", "product_id"),)
+    __table_args__ = (
+        Index("idx_user_product", "user_id", "product_id"),
+        # Ожидающие подписчики товара — рассылка при поступлении
+        Index("idx_stock_pending", "product_id", postgresql_where=text("is_notified = false")),
+    )
 
 
 class Payment(Base):
@@ -165,15 +256,135 @@ class Payment(Base):
     payment_id = Column(String(255), nullable=True)
     status = Column(String(50), default="PENDING", nullable=False)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=True)
+    cart_id = Column(Integer, ForeignKey("carts.id"), nullable=True)
     created_at = Column(DateTime, default=func.now(), nullable=False)
     completed_at = Column(DateTime, nullable=True)
 
     __table_args__ = (
         CheckConstraint("amount > 0", name="check_payment_amount_positive"),
         Index("idx_payment_user_status", "user_id", "status"),
+        # Идемпотентность webhook'ов: один платёж провайдера — одна запись
+        Index("uq_payment_method_payment_id", "payment_method", "payment_id", unique=True),
+        Index("idx_payments_pending", "id", postgresql_where=text("status = 'PENDING'")),
     )
 
 
+class InboxEvent(Base):
+    """Входящее событие платёжной системы (webhook), ожидающее обработки"""
+
+    __tablename__ = "inbox"
+
+    id = Column(BigInteger, primary_key=True)
+    provider = Column(String(50), nullable=False)
+    event_id = Column(String(255), nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(String(20), default="PENDING", nullable=False)  # PENDING / DONE / DEAD
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=func.now(), nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("uq_inbox_provider_event", "provider", "event_id", unique=True),
+        Index(
+            "idx_inbox_pending", "next_attempt_at",
+            postgresql_where=text("status = 'PENDING'"),
+        ),
+    )
+
+
+class NotificationOutbox(Base):
+    """Исходящее уведомление: пишется в транзакции бизнес-операции, отправляется воркером"""
+
+    __tablename__ = "notification_outbox"
+
+    id = Column(BigInteger, primary_key=True)
+    chat_id = Column(String(64), nullable=False)  # telegram_id или @канал
+    kind = Column(String(30), nullable=False)  # order, purchase, registration, topup, reservation
+    message_text = Column(Text, nullable=False)
+    digest = Column(Boolean, default=True, nullable=False)  # можно объединить в сводку
+    product = Column(String(255), nullable=True)
+    quantity = Column(Integer, default=0, nullable=False)
+    amount = Column(Float, default=0.0, nullable=False)
+    status = Column(String(20), default="PENDING", nullable=False)  # PENDING / SENT / DEAD
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=func.now(), nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index(
+            "idx_outbox_pending", "next_attempt_at",
+            postgresql_where=text("status = 'PENDING'"),
+        ),
+    )
+
+
+class JobState(Base):
+    """Состояние фоновой задачи (курсор постраничной обработки)"""
+
+    __tablename__ = "job_state"
+
+    name = Column(String(100), primary_key=True)
+    cursor = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
+
+class FsmState(Base):
+    """Состояние FSM (aiogram) пользователя в чате"""
+
+    __tablename__ = "fsm_states"
+
+    key = Column(String(255), primary_key=True)
+    state = Column(String(255), nullable=True)
+    data = Column(JSONB, default=dict, nullable=False)
+    updated_at = Column(DateTime, default=func.now(), nullable=False)
+
+    __table_args__ = (Index("idx_fsm_states_updated", "updated_at"),)
+
+
+class BroadcastJob(Base):
+    """Массовая рассылка: текст, прогресс и курсор по users.id"""
+
+    __tablename__ = "broadcast_jobs"
+
+    id = Column(Integer, primary_key=True)
+    message_text = Column(Text, nullable=False)  # HTML; у медиа — подпись (может быть пустой)
+    # Медиа-рассылка: file_id уже загруженного в Telegram файла, рассылается без повторной загрузки
+    media_type = Column(String(20), nullable=True)  # photo, document, video, animation
+    media_file_id = Column(String(255), nullable=True)
+    status = Column(String(20), default="PENDING", nullable=False)  # PENDING, RUNNING, DONE, CANCELLED
+    cursor = Column(Integer, default=0, nullable=False)  # users.id последнего взятого получателя
+    total = Column(Integer, default=0, nullable=False)
+    sent = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    created_by = Column(BigInteger, nullable=False)  # telegram_id администратора
+    status_chat_id = Column(BigInteger, nullable=True)
+    status_message_id = Column(Integer, nullable=True)
+    audience = Column(String(100), default="all", nullable=False)  # см. src/services/audience.py
+    lease_until = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("idx_broadcast_jobs_active", "id", postgresql_where=text("status IN ('PENDING', 'RUNNING')")),
+    )
+
+
+class BroadcastDelivery(Base):
+    """Доставка рассылки одному получателю (строка появляется до отправки)"""
+
+    __tablename__ = "broadcast_deliveries"
+
+    job_id = Column(Integer, ForeignKey("broadcast_jobs.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    status = Column(String(10), nullable=False)  # SENDING, SENT, FAILED, UNKNOWN
+    updated_at = Column(DateTime, default=func.now(), nullable=False)
+
+
 class ReferralTransaction(Base):
     """Реферальная транзакция"""
 
@@ -187,6 +398,25 @@ class ReferralTransaction(Base):
     commission = Column(Float, nullable=False)
     created_at = Column(DateTime, default=func.now(), nullable=False)
 
+    # Одно начисление на заказ — повторная оплата или повтор события ничего не удвоит
+    __table_args__ = (Index("uq_referral_order", "order_id", unique=True),)
+
+
+class BalanceLedger(Base):
+    """Журнал изменений баланса"""
+
+    __tablename__ = "balance_ledger"
+
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    amount = Column(Float, nullable=False)
+    balance_after = Column(Float, nullable=False)
+    reason = Column(String(50), nullable=False)
+    ref = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+
+    __table_args__ = (Index("idx_ledger_user", "user_id", "id"),)
+
 
 class Log(Base):
     """Лог ошибок"""
@@ -9,8 +9,8 @@ import sys
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 
+from src.bot.fsm_storage import build_fsm_storage
 from src.config import settings
 from src.database.database import init_db
 
@@ -24,6 +24,7 @@ def _register_routers(dp: Dispatcher) -> None:
     """Подключить все роутеры."""
     from src.bot.handlers.start import router as start_router
     from src.bot.handlers.catalog import router as catalog_router
+    from src.bot.handlers.cart import router as cart_router
     from src.bot.handlers.orders import router as orders_router
     from src.bot.handlers.balance import router as balance_router
     from src.bot.handlers.referral import router as referral_router
@@ -35,6 +36,7 @@ def _register_routers(dp: Dispatcher) -> None:
     dp.include_routers(
         start_router,
         catalog_router,
+        cart_router,
         orders_router,
         balance_router,
         referral_router,
@@ -51,16 +53,22 @@ def _register_middlewares(dp: Dispatcher) -> None:
     from src.bot.middlewares.error_handler import ErrorHandlerMiddleware
     from src.bot.middlewares.blocked_user import BlockedUserMiddleware
     from src.bot.middlewares.garbage import GarbageMiddleware
+    from src.bot.middlewares.rate_limit import RateLimitMiddleware
 
     # --- Middleware на update (самый ранний) ---
     dp.update.outer_middleware(ErrorHandlerMiddleware())
 
+    # Один лимитер на message и callback_query; стоит до DatabaseMiddleware
+    rate_limit = RateLimitMiddleware()
+
     # --- Middleware на message ---
+    dp.message.outer_middleware(rate_limit)
     dp.message.outer_middleware(DatabaseMiddleware())
     dp.message.outer_middleware(BlockedUserMiddleware())
     dp.message.middleware(GarbageMiddleware())      # inner — ПОСЛЕ фильтров
 
     # --- Middleware на callback_query ---
+    dp.callback_query.outer_middleware(rate_limit)
     dp.callback_query.outer_middleware(DatabaseMiddleware())
     dp.callback_query.outer_middleware(BlockedUserMiddleware())
 
@@ -68,17 +76,100 @@ def _register_middlewares(dp: Dispatcher) -> None:
     dp.pre_checkout_query.outer_middleware(DatabaseMiddleware())
 
 
+async def _run_backup() -> None:
+    """Резервное копирование БД (pg_dump в отдельном потоке)."""
+    from scripts.backup_db import backup_database
+
+    if not await asyncio.to_thread(backup_database):
+        raise RuntimeError("pg_dump завершился с ошибкой")
+
+
+def _register_jobs(bot: Bot) -> None:
+    """Зарегистрировать фоновые задачи планировщика."""
+    from functools import partial
+
+    from src.bot.fsm_storage import prune_fsm_states
+    from src.services.account_service import refresh_all_stock_counts
+    from src.services.archive import archive_sold_accounts
+    from src.services.inbox import prune_inbox
+    from src.services.notifications import notify_restocked_products
+    from src.services.outbox import prune_outbox
+    from src.services.reconciler import reconcile_pending_payments
+    from src.services.reservation import release_expired_reservations
+    from src.services.scheduler import scheduler
+
+    scheduler.add_interval_job(
+        "reservation_sweep",
+        release_expired_reservations,
+        settings.RESERVATION_SWEEP_INTERVAL,
+        jitter=5,
+        timeout=300,
+    )
+    scheduler.add_interval_job(
+        "stock_cache_refresh",
+        refresh_all_stock_counts,
+        settings.STOCK_CACHE_REFRESH_INTERVAL,
+        jitter=2,
+        timeout=120,
+    )
+    scheduler.add_interval_job(
+        "stock_notify",
+        partial(notify_restocked_products, bot),
+        settings.STOCK_NOTIFY_INTERVAL,
+        jitter=5,
+        timeout=600,
+    )
+    scheduler.add_interval_job(
+        "payment_reconcile",
+        reconcile_pending_payments,
+        settings.RECONCILE_INTERVAL,
+        jitter=10,
+        timeout=300,
+    )
+    scheduler.add_interval_job("inbox_prune", prune_inbox, 3600, jitter=60, timeout=600)
+    scheduler.add_interval_job("outbox_prune", prune_outbox, 3600, jitter=60, timeout=600)
+    if settings.FSM_STORAGE.lower() == "postgres":
+        scheduler.add_interval_job("fsm_prune", prune_fsm_states, 3600, jitter=60, timeout=600)
+    if settings.ARCHIVE_CRON:
+        scheduler.add_cron_job("accounts_archive", archive_sold_accounts, settings.ARCHIVE_CRON, jitter=60, timeout=3600)
+    if settings.BACKUP_CRON:
+        scheduler.add_cron_job("db_backup", _run_backup, settings.BACKUP_CRON, jitter=60, timeout=3600)
+
+
 async def _on_startup(bot: Bot) -> None:
     """Действия при запуске."""
     logger.info("Инициализация базы данных...")
     await init_db()
     me = await bot.get_me()
+
+    from src.services.broadcast import broadcast_jobs
+    from src.services.gateway import start_gateways
+    from src.services.inbox import inbox_workers
+    from src.services.outbox import outbox_worker
+    from src.services.scheduler import scheduler
+    await start_gateways()
+    _register_jobs(bot)
+    await scheduler.start()
+    await inbox_workers.start()
+    await outbox_worker.start(bot)
+    await broadcast_jobs.start(bot)
+
     logger.info("Bot starting up")
     logger.info("Бот запущен: @%s (ID: %s)", me.username, me.id)
 
 
 async def _on_shutdown(bot: Bot) -> None:
     """Действия при остановке."""
+    from src.services.broadcast import broadcast_jobs
+    from src.services.gateway import close_gateways
+    from src.services.inbox import inbox_workers
+    from src.services.outbox import outbox_worker
+    from src.services.scheduler import scheduler
+    await broadcast_jobs.stop()
+    await inbox_workers.stop()
+    await scheduler.stop()
+    await outbox_worker.stop()
+    await close_gateways()
     logger.info("Бот остановлен.")
 
 
@@ -90,7 +181,9 @@ async def main() -> None:
         token=settings.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
-    dp = Dispatcher(storage=MemoryStorage())
+    from src.bot.middlewares.bot_blocked import BotBlockedMiddleware
+    bot.session.middleware(BotBlockedMiddleware())
+    dp = Dispatcher(storage=build_fsm_storage())
 
     dp.startup.register(_on_startup)
     dp.shutdown.register(_on_shutdown)
@@ -107,6 +200,7 @@ async def main() -> None:
 
         app = web.Application()
         SimpleRequestHandler(dispatcher=dp, bot=bot).register(app, path="/webhook/bot")
+        setup_application(app, dp, bot=bot)
 
         # Подключаем маршруты платёжных webhook
         from src.bot.handlers.webhook import setup_webhook_routes
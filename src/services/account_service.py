@@ -1,31 +1,39 @@
 """Сервис выдачи аккаунтов"""
 import csv
+import hashlib
 import io
 import logging
 from datetime import datetime
 from io import BytesIO
-from typing import List
+from typing import Iterable, List, Optional, Tuple
 
-from sqlalchemy import select, update
+from sqlalchemy import Row, Text, any_, bindparam, func, select, union_all, update
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
-from src.database.models import Account, Product
+from src.database.database import async_session_maker
+from src.database.models import Account, AccountArchive, Product
 
 logger = logging.getLogger(__name__)
 
-
 async def reserve_accounts(
     session: AsyncSession,
     product_id: int,
     quantity: int,
     order_id: int = None,
 ) -> List[Account]:
-    """Резервирование аккаунтов с SELECT FOR UPDATE."""
+    """Резервирование аккаунтов с SELECT FOR UPDATE SKIP LOCKED.
+
+    Строка товара не блокируется: параллельные покупатели забирают разные
+    непроданные аккаунты, а Product.stock_count обновляется фоном.
+    """
     stmt = (
         select(Account)
         .where(Account.product_id == product_id, Account.is_sold == False)
+        .order_by(Account.id)
         .limit(quantity)
-        .with_for_update()
+        .with_for_update(skip_locked=True)
     )
     result = await session.execute(stmt)
     accounts = result.scalars().all()
@@ -35,38 +43,80 @@ async def reserve_accounts(
             f"Недостаточно товара на складе. Доступно: {len(accounts)}, требуется: {quantity}"
         )
 
-    stmt_product = select(Product).where(Product.id == product_id).with_for_update()
-    result_product = await session.execute(stmt_product)
-    product = result_product.scalar_one_or_none()
-
-    if not product:
-        raise ValueError(f"Товар с ID {product_id} не найден")
-    if product.stock_count < quantity:
-        raise ValueError(
-            f"Недостаточно товара на складе. Доступно: {product.stock_count}, требуется: {quantity}"
-        )
-
     account_ids = [acc.id for acc in accounts]
     update_values = {"is_sold": True, "sold_at": datetime.now()}
     if order_id:
         update_values["order_id"] = order_id
 
     await session.execute(update(Account).where(Account.id.in_(account_ids)).values(**update_values))
-    await session.execute(
-        update(Product).where(Product.id == product_id).values(stock_count=Product.stock_count - quantity)
-    )
 
     return accounts
 
 
-async def get_accounts_for_order(session: AsyncSession, order_id: int) -> List[Account]:
-    """Получить аккаунты для заказа."""
-    stmt = select(Account).where(Account.order_id == order_id)
+async def count_available(session: AsyncSession, product_id: int) -> int:
+    """Фактический остаток товара (по частичному индексу непроданных аккаунтов)."""
+    stmt = select(func.count(Account.id)).where(Account.product_id == product_id, Account.is_sold == False)
+    return (await session.execute(stmt)).scalar() or 0
+
+
+async def refresh_stock_counts(
+    session: AsyncSession,
+    product_ids: Optional[Iterable[int]] = None,
+) -> List[Tuple[int, int, int]]:
+    """Синхронизировать кэш Product.stock_count с непроданными аккаунтами.
+
+    Обновляет только разошедшиеся строки. Возвращает [(product_id, было, стало)].
+    Уведомления о поступлении от кэша не зависят — см. notify_restocked_products.
+    """
+    available = select(Account.product_id, func.count(Account.id).label("available")).where(
+        Account.is_sold == False
+    )
+    products = aliased(Product)
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return []
+        available = available.where(Account.product_id.in_(product_ids))
+    available = available.group_by(Account.product_id).subquery()
+
+    counts = select(
+        products.id,
+        products.stock_count.label("old"),
+        func.coalesce(available.c.available, 0).label("available"),
+    ).outerjoin(available, available.c.product_id == products.id)
+    if product_ids is not None:
+        counts = counts.where(products.id.in_(product_ids))
+    counts = counts.subquery()
+
+    result = await session.execute(
+        update(Product)
+        .where(Product.id == counts.c.id, Product.stock_count != counts.c.available)
+        .values(stock_count=counts.c.available)
+        .returning(Product.id, counts.c.old, counts.c.available)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def refresh_all_stock_counts() -> None:
+    """Фоновая синхронизация кэша остатков (задача планировщика)."""
+    async with async_session_maker() as session:
+        changed = await refresh_stock_counts(session)
+        await session.commit()
+    if changed:
+        logger.info("Stock cache refreshed for %s products", len(changed))
+
+
+async def get_accounts_for_order(session: AsyncSession, order_id: int) -> List[Row]:
+    """Получить аккаунты для заказа (из рабочей таблицы и из архива)."""
+    stmt = union_all(
+        select(Account.id, Account.account_data).where(Account.order_id == order_id),
+        select(AccountArchive.id, AccountArchive.account_data).where(AccountArchive.order_id == order_id),
+    ).order_by("id")
     result = await session.execute(stmt)
-    return result.scalars().all()
+    return result.all()
 
 
-async def create_accounts_file(accounts: List[Account]) -> BytesIO:
+async def create_accounts_file(accounts: List[Row]) -> BytesIO:
     """Создать текстовый файл с аккаунтами."""
     file_content = "\n".join([acc.account_data for acc in accounts])
     file_obj = BytesIO(file_content.encode("utf-8"))
@@ -74,6 +124,29 @@ async def create_accounts_file(accounts: List[Account]) -> BytesIO:
     return file_obj
 
 
+async def _find_existing_accounts(session: AsyncSession, product_id: int, candidates: set[str]) -> set[str]:
+    """Какие из строк уже загружены для товара (включая архив проданных).
+
+    Один запрос на весь файл: md5 строк передаётся массивом и ищется по
+    индексам (product_id, md5(account_data)) обеих таблиц. Совпадение md5
+    сверяется с самой строкой.
+    """
+    if not candidates:
+        return set()
+    hashes = bindparam(
+        "hashes", [hashlib.md5(line.encode()).hexdigest() for line in candidates], type_=ARRAY(Text),
+    )
+    stmt = union_all(
+        select(Account.account_data).where(
+            Account.product_id == product_id, func.md5(Account.account_data) == any_(hashes)
+        ),
+        select(AccountArchive.account_data).where(
+            AccountArchive.product_id == product_id, func.md5(AccountArchive.account_data) == any_(hashes)
+        ),
+    )
+    return candidates & set((await session.execute(stmt)).scalars().all())
+
+
 async def upload_accounts_from_file(
     session: AsyncSession,
     product_id: int,
@@ -97,9 +170,7 @@ async def upload_accounts_from_file(
     except Exception:
         lines = [ln.strip() for ln in text.split("\n") if ln.strip()]
 
-    stmt = select(Account.account_data).where(Account.product_id == product_id)
-    result = await session.execute(stmt)
-    existing_accounts = set(result.scalars().all())
+    existing_accounts = await _find_existing_accounts(session, product_id, set(lines))
 
     unique_accounts: set[str] = set()
     duplicates = 0
@@ -113,8 +184,4 @@ async def upload_accounts_from_file(
         session.add(Account(product_id=product_id, account_data=normalized, is_sold=False))
         loaded += 1
 
-    await session.execute(
-        update(Product).where(Product.id == product_id).values(stock_count=Product.stock_count + loaded)
-    )
-
     return loaded, duplicates
@@ -0,0 +1,90 @@
+"""Архивация проданных аккаунтов"""
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, false, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.database.database import async_session_maker
+from src.database.models import Account, AccountArchive, Order
+
+logger = logging.getLogger(__name__)
+
+_ARCHIVE_COLUMNS = (
+    "id", "product_id", "account_data", "sold_at", "order_id",
+    "is_blocked", "blocked_at", "blocked_by", "created_at",
+)
+
+
+async def _archive_batch(batch_size: int, cutoff: datetime) -> int:
+    """Перенести одну пачку аккаунтов в архив одной транзакцией (DELETE ... RETURNING → INSERT)."""
+    async with async_session_maker() as session:
+        batch = (
+            select(Account.id)
+            .join(Order, Order.id == Account.order_id)
+            .where(
+                Account.is_sold == True,
+                Order.status == "ВЫПОЛНЕНО",
+                Order.completed_at < cutoff,
+            )
+            .limit(batch_size)
+            .with_for_update(of=Account, skip_locked=True)
+        )
+        moved = (
+            delete(Account)
+            .where(Account.id.in_(batch))
+            .returning(*(getattr(Account, name) for name in _ARCHIVE_COLUMNS))
+            .cte("moved")
+        )
+        result = await session.execute(
+            insert(AccountArchive).from_select(
+                list(_ARCHIVE_COLUMNS),
+                select(*(moved.c[name] for name in _ARCHIVE_COLUMNS)),
+            )
+        )
+        await session.commit()
+        return result.rowcount
+
+
+async def archive_sold_accounts(batch_size: int = None, older_than_days: int = None) -> int:
+    """Перенести проданные аккаунты старых выполненных заказов в accounts_archive."""
+    batch_size = batch_size or settings.ARCHIVE_BATCH
+    older_than_days = older_than_days if older_than_days is not None else settings.ARCHIVE_AFTER_DAYS
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+
+    total = 0
+    while True:
+        moved = await _archive_batch(batch_size, cutoff)
+        total += moved
+        if moved < batch_size:
+            break
+
+    if total:
+        logger.info("Archived %s sold accounts (orders completed before %s)", total, cutoff)
+    return total
+
+
+async def restore_archived_accounts(session: AsyncSession, order_id: int) -> int:
+    """Вернуть аккаунты заказа из архива на склад (непроданными). Возвращает количество."""
+    moved = (
+        delete(AccountArchive)
+        .where(AccountArchive.order_id == order_id)
+        .returning(
+            AccountArchive.id,
+            AccountArchive.product_id,
+            AccountArchive.account_data,
+            AccountArchive.created_at,
+        )
+        .cte("restored")
+    )
+    result = await session.execute(
+        insert(Account).from_select(
+            ["id", "product_id", "account_data", "created_at", "is_sold", "is_blocked"],
+            select(
+                moved.c.id, moved.c.product_id, moved.c.account_data, moved.c.created_at,
+                false(), false(),
+            ),
+        )
+    )
+    return result.rowcount
@@ -0,0 +1,101 @@
+"""Аудитории рассылок — сегменты пользователей, вычисляемые в SQL.
+
+Аудитория хранится в задаче рассылки строкой «вид» или «вид:значение»
+(product:5, balance:1000, active:30). audience_condition() превращает её в
+условие над users — EXISTS по индексированным таблицам, поэтому исполнитель
+рассылки по-прежнему читает получателей пачками по users.id > cursor, а
+предпросмотр — один COUNT по тому же условию.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import exists, func, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from src.database.models import Category, Order, Product, StockNotification, User
+from src.services.bot_blocked import reachable_users
+
+ALL = "all"
+
+SEGMENTS = {
+    "all": "👥 Все пользователи",
+    "product": "📦 Купившие товар",
+    "category": "📂 Купившие в категории",
+    "balance": "💰 С балансом больше N ₽",
+    "active": "🕒 Активные за N дней",
+    "referrers": "🤝 Пригласившие друзей",
+    "subscribers": "🔔 Ждущие поступления товара",
+}
+
+# Сегменты с параметром: вид → вопрос администратору
+PARAMETERS = {
+    "product": "Введите ID товара:",
+    "category": "Выберите категорию:",
+    "balance": "Введите сумму в ₽ — получат пользователи с балансом больше неё:",
+    "active": "Введите число дней — получат пользователи, писавшие боту за этот срок:",
+}
+
+COMPLETED = "ВЫПОЛНЕНО"
+
+
+def make_audience(kind: str, value: Optional[str] = None) -> str:
+    """Собрать строку аудитории; ValueError — неизвестный сегмент или плохое значение."""
+    if kind not in SEGMENTS:
+        raise ValueError(f"Неизвестный сегмент: {kind}")
+    if kind not in PARAMETERS:
+        return kind
+    value = (value or "").strip().replace(",", ".")
+    number = float(value) if kind == "balance" else int(value)
+    if number < 0 or (kind != "balance" and number == 0):
+        raise ValueError(f"Недопустимое значение: {value}")
+    return f"{kind}:{value}"
+
+
+def audience_condition(audience: str):
+    """Условие WHERE над users для аудитории (без проверки достижимости)."""
+    kind, _, value = audience.partition(":")
+    if kind == "all":
+        return true()
+    if kind == "product":
+        return exists().where(
+            Order.user_id == User.id, Order.product_id == int(value), Order.status == COMPLETED,
+        )
+    if kind == "category":
+        return exists().where(
+            Order.user_id == User.id, Order.status == COMPLETED,
+            Order.product_id.in_(select(Product.id).where(Product.category_id == int(value))),
+        )
+    if kind == "balance":
+        return User.balance > float(value)
+    if kind == "active":
+        return User.last_seen_at >= datetime.now() - timedelta(days=int(value))
+    if kind == "referrers":
+        referral = aliased(User)
+        return exists().where(referral.referred_by == User.id)
+    if kind == "subscribers":
+        return exists().where(StockNotification.user_id == User.id, StockNotification.is_notified == False)
+    raise ValueError(f"Неизвестный сегмент: {kind}")
+
+
+async def count_audience(session: AsyncSession, audience: str) -> int:
+    """Сколько достижимых пользователей в аудитории — предпросмотр перед отправкой."""
+    return (await session.execute(
+        select(func.count(User.id)).where(reachable_users(), audience_condition(audience))
+    )).scalar()
+
+
+async def describe_audience(session: AsyncSession, audience: str) -> str:
+    """Подпись аудитории для администратора."""
+    kind, _, value = audience.partition(":")
+    if kind == "product":
+        name = (await session.execute(select(Product.name).where(Product.id == int(value)))).scalar()
+        return f"📦 Купившие «{name or f'#{value}'}»"
+    if kind == "category":
+        name = (await session.execute(select(Category.name).where(Category.id == int(value)))).scalar()
+        return f"📂 Купившие в категории «{name or f'#{value}'}»"
+    if kind == "balance":
+        return f"💰 С балансом больше {float(value):.2f} ₽"
+    if kind == "active":
+        return f"🕒 Активные за {value} дн."
+    return SEGMENTS.get(kind, audience)
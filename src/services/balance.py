@@ -0,0 +1,66 @@
+"""Операции с балансом пользователя.
+
+users.balance — материализованный текущий баланс (чтение за O(1)),
+balance_ledger — журнал всех изменений с балансом после операции. Каждое
+изменение — один SQL-оператор: CTE с условным UPDATE users ... RETURNING и
+INSERT в журнал. Баланс не читается в Python и не пересчитывается между
+await'ами, поэтому параллельные операции не теряют обновления, а списание
+не уводит баланс в минус. Транзакцией управляет вызывающий код.
+"""
+from typing import Optional
+
+from sqlalchemy import func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import BalanceLedger, User
+
+
+class InsufficientFunds(ValueError):
+    """На балансе меньше, чем нужно списать."""
+
+
+async def _apply(
+    session: AsyncSession,
+    user_id: int,
+    amount: float,
+    reason: str,
+    ref: Optional[str],
+    guard: bool,
+) -> Optional[float]:
+    changed = update(User).where(User.id == user_id)
+    if guard:
+        changed = changed.where(User.balance >= -amount)
+    changed = (
+        changed.values(balance=User.balance + amount)
+        .returning(User.id, User.balance)
+        .cte("changed")
+    )
+    result = await session.execute(
+        insert(BalanceLedger)
+        .from_select(
+            ["user_id", "amount", "balance_after", "reason", "ref", "created_at"],
+            select(changed.c.id, literal(amount), changed.c.balance, literal(reason), literal(ref), func.now()),
+        )
+        .returning(BalanceLedger.balance_after)
+    )
+    return result.scalar_one_or_none()
+
+
+async def credit_balance(
+    session: AsyncSession, user_id: int, amount: float, reason: str, ref: Optional[str] = None
+) -> Optional[float]:
+    """Зачислить сумму. Возвращает новый баланс (None — пользователь не найден)."""
+    return await _apply(session, user_id, amount, reason, ref, guard=False)
+
+
+async def debit_balance(
+    session: AsyncSession, user_id: int, amount: float, reason: str, ref: Optional[str] = None
+) -> float:
+    """Списать сумму, если хватает средств. Возвращает новый баланс.
+
+    Бросает InsufficientFunds; транзакцию в этом случае откатывает вызывающий код.
+    """
+    new_balance = await _apply(session, user_id, -amount, reason, ref, guard=True)
+    if new_balance is None:
+        raise InsufficientFunds("Недостаточно средств")
+    return new_balance
@@ -0,0 +1,46 @@
+"""Пользователи, заблокировавшие бота.
+
+Любой запрос к Bot API, получивший 403 (бот заблокирован, аккаунт удалён,
+диалог не начат), отмечает пользователя в users.bot_blocked_at — это делает
+BotBlockedMiddleware на сессии бота. Рассылки и уведомления выбирают только
+достижимых пользователей (reachable_users, частичный индекс
+idx_users_reachable), поэтому мёртвые чаты больше не тратят запросы к API.
+Отметка снимается, когда пользователь снова пишет /start.
+"""
+import logging
+
+from sqlalchemy import func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.database import async_session_maker
+from src.database.models import User
+
+logger = logging.getLogger(__name__)
+
+
+def reachable_users():
+    """Условие WHERE: пользователь не заблокирован админом и не заблокировал бота."""
+    return (User.is_blocked == False) & User.bot_blocked_at.is_(None)
+
+
+async def mark_bot_blocked(telegram_id: int) -> bool:
+    """Отметить, что чат пользователя недоступен. True — если отметка новая."""
+    async with async_session_maker() as session:
+        result = await session.execute(
+            update(User)
+            .where(User.telegram_id == telegram_id, User.bot_blocked_at.is_(None))
+            .values(bot_blocked_at=func.now())
+        )
+        await session.commit()
+    if result.rowcount:
+        logger.info("User %s blocked the bot", telegram_id)
+    return bool(result.rowcount)
+
+
+async def clear_bot_blocked(session: AsyncSession, user: User) -> None:
+    """Снять отметку: пользователь снова пишет боту."""
+    if user.bot_blocked_at is None:
+        return
+    user.bot_blocked_at = None
+    await session.commit()
+    logger.info("User %s unblocked the bot", user.telegram_id)
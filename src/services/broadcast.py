@@ -0,0 +1,647 @@
+"""Движок рассылки: общий лимит скорости и пул параллельных отправителей.
+
+Отправители берут получателей из ограниченной очереди и перед каждым
+запросом ждут токен token bucket — BROADCAST_RATE сообщений в секунду на всю
+рассылку, и токен общего лимита бота (bot_throttle, BOT_SEND_RATE), который
+делят все отправители: параллельные рассылки и outbox вместе не превысят
+лимит Telegram. Параллельность скрывает сетевую задержку, темп задают только
+лимитеры.
+
+TelegramRetryAfter приостанавливает на retry_after секунд все отправки бота,
+снижает общий темп и повторяет сообщение. Сетевые ошибки и 5xx повторяются с
+экспоненциальной задержкой до BROADCAST_MAX_RETRIES раз. Остальные ошибки
+(бот заблокирован, чат не найден и т. п.) окончательные; заблокировавших
+бота отмечает BotBlockedMiddleware, и в следующие рассылки они не попадут.
+
+Массовая рассылка — задача в broadcast_jobs, её исполняет BroadcastJobRunner
+в фоне. Получатели — аудитория задачи (services/audience.py), они берутся
+пачками по users.id > cursor; перед отправкой пачка «занимается» строками
+broadcast_deliveries (PK job_id + user_id), поэтому одному пользователю сообщение не уйдёт дважды ни после перезапуска, ни при
+двух исполнителях. После падения занятые, но не подтверждённые доставки
+помечаются UNKNOWN и не повторяются; при штатной остановке неотправленный
+хвост пачки освобождается, а курсор откатывается к нему.
+
+Фото, документы, видео и GIF рассылаются по file_id: файл уже загружен в
+Telegram сообщением администратора, поэтому каждому получателю уходит
+короткий запрос со ссылкой на него, а не повторная загрузка.
+
+Пока задача идёт, исполнитель раз в BROADCAST_PROGRESS_INTERVAL секунд
+обновляет сообщение-статус администратора (отправлено, ошибки, скорость,
+оценка оставшегося времени) и проверяет, не отменена ли задача кнопкой
+«⛔ Остановить»: отменённая задача останавливается, как при штатной остановке.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Union
+
+from aiogram.exceptions import (
+    TelegramEntityTooLarge,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.database.database import async_session_maker
+from src.database.models import BroadcastDelivery, BroadcastJob, User
+from src.services.audience import ALL, audience_condition, count_audience
+from src.services.bot_blocked import reachable_users
+from src.utils.rate_limit import Throttle, bot_throttle
+
+logger = logging.getLogger(__name__)
+
+SendFunc = Callable[[int], Awaitable[Any]]
+ResultFunc = Callable[[int, bool], Any]
+Recipients = Union[Iterable[int], AsyncIterable[int]]
+
+RETRY_AFTER_SLOWDOWN = 0.8
+
+# Тип медиа задачи → метод Bot, принимающий file_id вторым аргументом
+MEDIA_SENDERS = {
+    "photo": "send_photo",
+    "document": "send_document",
+    "video": "send_video",
+    "animation": "send_animation",
+}
+
+
+class BroadcastStats:
+    """Счётчики рассылки; доступны и во время отправки."""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def rate(self) -> float:
+        """Фактическая скорость: доставленных сообщений в секунду."""
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def is_transient(error: Exception) -> bool:
+    """Ошибка, которую имеет смысл повторить: сеть, 5xx, таймаут."""
+    if isinstance(error, TelegramEntityTooLarge):
+        return False
+    return isinstance(error, (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError))
+
+
+class Broadcaster:
+    """Рассылка одного сообщения списку чатов: send(chat_id) для каждого получателя."""
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        retry_base: float = 1.0,
+    ):
+        self.rate = rate or settings.BROADCAST_RATE
+        self.concurrency = concurrency or settings.BROADCAST_CONCURRENCY
+        self.max_retries = max_retries if max_retries is not None else settings.BROADCAST_MAX_RETRIES
+        self.retry_base = retry_base
+        self.throttle = Throttle(self.rate, parent=bot_throttle())
+        self.stats = BroadcastStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._producer: Optional[asyncio.Task] = None
+        self._stopped = False
+
+    async def run(
+        self, recipients: Recipients, send: SendFunc, on_result: Optional[ResultFunc] = None,
+    ) -> BroadcastStats:
+        """Разослать всем получателям; on_result(chat_id, доставлено) — после каждого."""
+        queue = self._queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        self.stats = BroadcastStats()
+        self._stopped = False
+        producer = self._producer = asyncio.create_task(self._produce(recipients, queue))
+        workers = [
+            asyncio.create_task(self._worker(queue, send, on_result)) for _ in range(self.concurrency)
+        ]
+        try:
+            await asyncio.gather(*workers)
+            if not self._stopped:
+                await producer  # ошибка источника получателей
+        finally:
+            for task in (producer, *workers):
+                task.cancel()
+            self.stats.finished_at = time.monotonic()
+        logger.debug(
+            "Broadcast finished: sent=%s failed=%s retries=%s flood_waits=%s in %.1fs (%.1f msg/s)",
+            self.stats.sent, self.stats.failed, self.stats.retries, self.stats.flood_waits,
+            self.stats.elapsed, self.stats.rate,
+        )
+        return self.stats
+
+    def stop(self) -> None:
+        """Штатно прервать run(): новых отправок нет, начатые доводятся до конца."""
+        if self._producer is None or self._producer.done() or self._stopped:
+            return
+        self._stopped = True
+        self._producer.cancel()
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        for _ in range(self.concurrency):
+            self._queue.put_nowait(None)
+
+    async def _produce(self, recipients: Recipients, queue: asyncio.Queue) -> None:
+        try:
+            if hasattr(recipients, "__aiter__"):
+                async for chat_id in recipients:
+                    await queue.put(chat_id)
+            else:
+                for chat_id in recipients:
+                    await queue.put(chat_id)
+        finally:
+            # Маркеры конца и при ошибке источника; после stop() их уже положил он
+            if not self._stopped:
+                for _ in range(self.concurrency):
+                    await queue.put(None)
+
+    async def _worker(self, queue: asyncio.Queue, send: SendFunc, on_result: Optional[ResultFunc]) -> None:
+        while (chat_id := await queue.get()) is not None:
+            delivered = await self.deliver(chat_id, send)
+            if delivered:
+                self.stats.sent += 1
+            else:
+                self.stats.failed += 1
+            if on_result is not None:
+                on_result(chat_id, delivered)
+
+    async def deliver(self, chat_id: int, send: SendFunc) -> bool:
+        """Отправить одно сообщение с учётом лимита и повторов. True — доставлено."""
+        attempt = 0
+        while True:
+            await self.throttle.acquire()
+            try:
+                await send(chat_id)
+                return True
+            except TelegramRetryAfter as e:
+                # Flood control — на весь бот: ждут все отправители, попытка не тратится.
+                # Раз лимит оказался ниже заданного темпа, темп снижается
+                self.stats.flood_waits += 1
+                if self.throttle.flood_wait(e.retry_after, RETRY_AFTER_SLOWDOWN):
+                    logger.warning(
+                        "Broadcast: flood control, pausing for %ss, bot rate lowered to %.1f/s",
+                        e.retry_after, self.throttle.root.rate,
+                    )
+            except Exception as e:
+                if not is_transient(e) or attempt >= self.max_retries:
+                    logger.debug("Broadcast to %s failed: %s", chat_id, e)
+                    return False
+                await asyncio.sleep(self.retry_base * 2 ** attempt)
+                attempt += 1
+            self.stats.retries += 1
+
+
+async def create_broadcast_job(
+    session: AsyncSession,
+    text: str,
+    created_by: int,
+    status_chat_id: Optional[int] = None,
+    status_message_id: Optional[int] = None,
+    audience: str = ALL,
+    media_type: Optional[str] = None,
+    media_file_id: Optional[str] = None,
+) -> BroadcastJob:
+    """Поставить рассылку аудитории (см. services/audience.py) в очередь и закоммитить.
+
+    Для медиа-рассылки text — подпись, media_file_id — file_id файла, который
+    уже лежит на серверах Telegram (например, из сообщения администратора).
+    """
+    if media_type is not None and media_type not in MEDIA_SENDERS:
+        raise ValueError(f"Неподдерживаемый тип медиа: {media_type}")
+    job = BroadcastJob(
+        message_text=text,
+        media_type=media_type,
+        media_file_id=media_file_id,
+        audience=audience,
+        total=await count_audience(session, audience),
+        created_by=created_by,
+        status_chat_id=status_chat_id,
+        status_message_id=status_message_id,
+    )
+    session.add(job)
+    await session.commit()
+    broadcast_jobs.wake()
+    return job
+
+
+async def cancel_broadcast_job(session: AsyncSession, job_id: int) -> Optional[BroadcastJob]:
+    """Отменить ожидающую или идущую рассылку. None — она уже завершена."""
+    job = (await session.execute(
+        update(BroadcastJob)
+        .where(BroadcastJob.id == job_id, BroadcastJob.status.in_(("PENDING", "RUNNING")))
+        .values(status="CANCELLED", finished_at=datetime.now(), lease_until=None)
+        .returning(BroadcastJob)
+    )).scalar_one_or_none()
+    await session.commit()
+    if job is not None:
+        logger.info("Broadcast #%s cancelled", job_id)
+        broadcast_jobs.cancel(job_id)
+    return job
+
+
+def _duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours} ч {minutes} мин"
+    if minutes:
+        return f"{minutes} мин {seconds} с"
+    return f"{seconds} с"
+
+
+def broadcast_progress_text(job: BroadcastJob, sent: int, failed: int, rate: float) -> str:
+    processed = min(sent + failed, job.total)
+    percent = processed * 100 // job.total if job.total else 100
+    text = (
+        f"📤 <b>Рассылка #{job.id} идёт</b>\n\n"
+        f"✅ Отправлено: {sent}\n"
+        f"❌ Ошибки: {failed}\n"
+        f"📊 Прогресс: {processed} / {job.total} ({percent}%)\n"
+        f"⚡ Скорость: {rate:.1f} сообщ./с"
+    )
+    if rate > 0 and processed < job.total:
+        text += f"\n⏱ Осталось: ~{_duration((job.total - processed) / rate)}"
+    return text
+
+
+async def send_broadcast_message(bot, job: BroadcastJob, chat_id: int) -> Any:
+    """Отправить сообщение задачи одному получателю: текст или медиа по file_id."""
+    if job.media_type is None:
+        return await bot.send_message(chat_id, job.message_text, parse_mode="HTML")
+    send = getattr(bot, MEDIA_SENDERS[job.media_type])
+    return await send(chat_id, job.media_file_id, caption=job.message_text or None, parse_mode="HTML")
+
+
+def broadcast_result_text(job: BroadcastJob) -> str:
+    title = "Рассылка завершена" if job.status == "DONE" else "Рассылка остановлена"
+    text = (
+        f"📢 <b>{title}</b>\n\n"
+        f"✅ Отправлено: {job.sent}\n"
+        f"❌ Ошибки: {job.failed}\n"
+        f"📊 Всего: {job.total}"
+    )
+    if job.started_at and job.finished_at and job.finished_at > job.started_at:
+        rate = job.sent / (job.finished_at - job.started_at).total_seconds()
+        text += f"\n⚡ Скорость: {rate:.1f} сообщ./с"
+    return text
+
+
+class _Batch:
+    """Занятая пачка получателей задачи: {telegram_id: users.id} и ответы по ним."""
+
+    __slots__ = ("recipients", "attempted", "results")
+
+    def __init__(self, recipients: Dict[int, int]):
+        self.recipients = recipients
+        self.attempted: Set[int] = set()
+        self.results: Dict[int, bool] = {}
+
+
+class BroadcastJobRunner:
+    """Фоновый исполнитель задач из broadcast_jobs (по одной за раз)."""
+
+    def __init__(self, poll_interval: float, lease_seconds: int, batch_size: int):
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.batch_size = batch_size
+        self.bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._broadcaster: Optional[Broadcaster] = None
+        self._job_id: Optional[int] = None
+
+    def wake(self) -> None:
+        """Разбудить исполнителя сразу после создания задачи."""
+        self._wakeup.set()
+
+    def cancel(self, job_id: int) -> None:
+        """Прервать задачу, если она идёт в этом процессе (статус CANCELLED уже записан).
+
+        Другие реплики заметят отмену при следующей проверке прогресса.
+        """
+        if self._job_id == job_id and self._broadcaster is not None:
+            self._broadcaster.stop()
+
+    async def start(self, bot) -> None:
+        if self._task:
+            return
+        self.bot = bot
+        self._task = asyncio.create_task(self._loop(), name="broadcast_jobs")
+        logger.info("Broadcast job runner started")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Дать начатым отправкам завершиться и записать итоги; по таймауту — прервать."""
+        if self._task is None:
+            return
+        self._stopping = True
+        if self._broadcaster is not None:
+            self._broadcaster.stop()
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        except Exception:
+            pass
+        self._task = None
+        self._stopping = False
+        logger.info("Broadcast job runner stopped")
+
+    async def _loop(self) -> None:
+        while not self._stopping:
+            try:
+                job = await self._claim_job()
+                if job is not None:
+                    await self.run_job(job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Broadcast job runner error: %s", e, exc_info=True)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _lease(self) -> datetime:
+        return datetime.now() + timedelta(seconds=self.lease_seconds)
+
+    async def _claim_job(self) -> Optional[BroadcastJob]:
+        """Арендовать незавершённую задачу: новую или брошенную упавшей репликой."""
+        now = datetime.now()
+        async with async_session_maker() as session:
+            ready = (
+                select(BroadcastJob.id)
+                .where(
+                    BroadcastJob.status.in_(("PENDING", "RUNNING")),
+                    or_(BroadcastJob.lease_until.is_(None), BroadcastJob.lease_until < now),
+                )
+                .order_by(BroadcastJob.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            job = (await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id.in_(ready))
+                .values(
+                    status="RUNNING",
+                    lease_until=self._lease(),
+                    started_at=func.coalesce(BroadcastJob.started_at, now),
+                )
+                .returning(BroadcastJob)
+            )).scalar_one_or_none()
+            if job is None:
+                return None
+
+            # Доставки, занятые до падения: неизвестно, ушли ли они, — не повторяем
+            lost = (await session.execute(
+                update(BroadcastDelivery)
+                .where(BroadcastDelivery.job_id == job.id, BroadcastDelivery.status == "SENDING")
+                .values(status="UNKNOWN", updated_at=now)
+            )).rowcount
+            if lost:
+                await session.execute(
+                    update(BroadcastJob).where(BroadcastJob.id == job.id).values(failed=BroadcastJob.failed + lost)
+                )
+                job.failed += lost
+                logger.warning("Broadcast #%s resumed: %s deliveries with unknown outcome", job.id, lost)
+            await session.commit()
+        logger.info("Broadcast #%s: running from users.id > %s", job.id, job.cursor)
+        return job
+
+    async def _claim_batch(self, job_id: int) -> Optional[Dict[int, int]]:
+        """Занять следующую пачку получателей (keyset по users.id) в короткой сессии.
+
+        None — получатели кончились или задача остановлена. Возвращает
+        {telegram_id: users.id}; пачка может оказаться пустой, если все её
+        получатели уже были заняты раньше.
+        """
+        async with async_session_maker() as session:
+            status, cursor, audience = (await session.execute(
+                select(BroadcastJob.status, BroadcastJob.cursor, BroadcastJob.audience)
+                .where(BroadcastJob.id == job_id)
+                .with_for_update()
+            )).one()
+            if status != "RUNNING":
+                return None
+
+            rows = (await session.execute(
+                select(User.id, User.telegram_id)
+                .where(User.id > cursor, reachable_users(), audience_condition(audience))
+                .order_by(User.id)
+                .limit(self.batch_size)
+            )).all()
+            if not rows:
+                return None
+
+            claimed = set((await session.execute(
+                insert(BroadcastDelivery)
+                .values([{"job_id": job_id, "user_id": row.id, "status": "SENDING"} for row in rows])
+                .on_conflict_do_nothing()
+                .returning(BroadcastDelivery.user_id)
+            )).scalars())
+            await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id)
+                .values(cursor=rows[-1].id, lease_until=self._lease())
+            )
+            await session.commit()
+        return {row.telegram_id: row.id for row in rows if row.id in claimed}
+
+    async def run_job(self, job: BroadcastJob) -> None:
+        """Разослать задачу одним потоком получателей.
+
+        Пачки занимаются по мере того, как отправители выбирают очередь, и
+        записываются, как только по всем получателям пачки есть ответ, — пул
+        не простаивает на границах пачек, а в памяти не больше пары пачек.
+        """
+        broadcaster = self._broadcaster = Broadcaster()
+        self._job_id = job.id
+        open_batches: List[_Batch] = []
+        batch_of: Dict[int, _Batch] = {}
+        writes: Set[asyncio.Task] = set()
+
+        async def recipients():
+            while not self._stopping and (claimed := await self._claim_batch(job.id)) is not None:
+                if not claimed:
+                    continue
+                batch = _Batch(claimed)
+                open_batches.append(batch)
+                for chat_id in claimed:
+                    batch_of[chat_id] = batch
+                    yield chat_id
+
+        async def send(chat_id: int) -> None:
+            batch_of[chat_id].attempted.add(chat_id)
+            await send_broadcast_message(self.bot, job, chat_id)
+
+        def on_result(chat_id: int, delivered: bool) -> None:
+            batch = batch_of.pop(chat_id)
+            batch.results[chat_id] = delivered
+            if len(batch.results) == len(batch.recipients):
+                open_batches.remove(batch)
+                task = asyncio.create_task(self._record(job.id, batch))
+                writes.add(task)
+                task.add_done_callback(writes.discard)
+
+        watcher = asyncio.create_task(self._watch(job, broadcaster))
+        try:
+            await broadcaster.run(recipients(), send, on_result)
+        finally:
+            # На любом выходе, включая отмену и ошибку источника получателей:
+            # завершённые пачки дописываются, занятые — освобождаются
+            watcher.cancel()
+            await self._flush(job.id, open_batches, writes)
+            self._broadcaster = None
+            self._job_id = None
+        if not self._stopping:
+            await self._complete(job.id)
+            await self._report(job.id)
+
+    async def _watch(self, job: BroadcastJob, broadcaster: Broadcaster) -> None:
+        """Продление аренды, проверка отмены и прогресс в сообщении-статусе.
+
+        Аренда продлевается по таймеру, а не только при занятии пачки: пачка,
+        застрявшая в долгих паузах retry_after, не должна отдать задачу другой
+        реплике. Прогресс обновляется раз в BROADCAST_PROGRESS_INTERVAL.
+        """
+        from src.bot.keyboards import broadcast_progress_kb
+
+        tick = min(settings.BROADCAST_PROGRESS_INTERVAL, self.lease_seconds / 3)
+        shown = None
+        shown_at = time.monotonic()
+        while True:
+            await asyncio.sleep(tick)
+            try:
+                async with async_session_maker() as session:
+                    running = (await session.execute(
+                        update(BroadcastJob)
+                        .where(BroadcastJob.id == job.id, BroadcastJob.status == "RUNNING")
+                        .values(lease_until=self._lease())
+                        .returning(BroadcastJob.id)
+                    )).scalar_one_or_none()
+                    await session.commit()
+                if running is None:
+                    logger.info("Broadcast #%s is no longer running, stopping", job.id)
+                    broadcaster.stop()
+                    return
+                if not job.status_chat_id or not job.status_message_id:
+                    continue
+                if time.monotonic() - shown_at < settings.BROADCAST_PROGRESS_INTERVAL:
+                    continue
+                shown_at = time.monotonic()
+                stats = broadcaster.stats
+                text = broadcast_progress_text(
+                    job, job.sent + stats.sent, job.failed + stats.failed,
+                    stats.processed / stats.elapsed if stats.elapsed > 0 else 0.0,
+                )
+                if text == shown:
+                    continue
+                await self.bot.edit_message_text(
+                    text,
+                    chat_id=job.status_chat_id, message_id=job.status_message_id,
+                    reply_markup=broadcast_progress_kb(job.id), parse_mode="HTML",
+                )
+                shown = text
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Broadcast #%s: failed to update progress: %s", job.id, e)
+
+    async def _flush(self, job_id: int, open_batches: List["_Batch"], writes: Set[asyncio.Task]) -> None:
+        """Дождаться записи завершённых пачек и записать прерванные."""
+        for result in await asyncio.gather(*writes, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error("Broadcast #%s: failed to record a batch: %s", job_id, result)
+        for batch in open_batches:
+            await self._record(job_id, batch, interrupted=True)
+        open_batches.clear()
+
+    async def _record(self, job_id: int, batch: "_Batch", interrupted: bool = False) -> None:
+        """Записать итоги пачки. При остановке неначатые получатели освобождаются.
+
+        Начатые, но не завершённые отправки (только при прерывании по
+        таймауту) остаются SENDING и при возобновлении станут UNKNOWN.
+        """
+        now = datetime.now()
+        sent = [batch.recipients[chat_id] for chat_id, ok in batch.results.items() if ok]
+        failed = [batch.recipients[chat_id] for chat_id, ok in batch.results.items() if not ok]
+        untouched = [user_id for chat_id, user_id in batch.recipients.items() if chat_id not in batch.attempted]
+        async with async_session_maker() as session:
+            for status, user_ids in (("SENT", sent), ("FAILED", failed)):
+                if user_ids:
+                    await session.execute(
+                        update(BroadcastDelivery)
+                        .where(BroadcastDelivery.job_id == job_id, BroadcastDelivery.user_id.in_(user_ids))
+                        .values(status=status, updated_at=now)
+                    )
+            values = {
+                "sent": BroadcastJob.sent + len(sent),
+                "failed": BroadcastJob.failed + len(failed),
+                "lease_until": None if interrupted else self._lease(),
+            }
+            if interrupted and untouched:
+                await session.execute(
+                    delete(BroadcastDelivery)
+                    .where(BroadcastDelivery.job_id == job_id, BroadcastDelivery.user_id.in_(untouched))
+                )
+                values["cursor"] = func.least(BroadcastJob.cursor, min(untouched) - 1)
+            await session.execute(update(BroadcastJob).where(BroadcastJob.id == job_id).values(**values))
+            await session.commit()
+
+    @staticmethod
+    async def _complete(job_id: int) -> None:
+        async with async_session_maker() as session:
+            await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id, BroadcastJob.status == "RUNNING")
+                .values(status="DONE", finished_at=datetime.now(), lease_until=None)
+            )
+            await session.commit()
+
+    async def _report(self, job_id: int) -> None:
+        """Показать итог в сообщении-статусе администратора."""
+        from src.bot.keyboards import noop_kb
+
+        async with async_session_maker() as session:
+            job = await session.get(BroadcastJob, job_id)
+        logger.info("Broadcast #%s %s: sent=%s failed=%s total=%s", job.id, job.status, job.sent, job.failed, job.total)
+        if not job.status_chat_id or not job.status_message_id:
+            return
+        try:
+            await self.bot.edit_message_text(
+                broadcast_result_text(job),
+                chat_id=job.status_chat_id, message_id=job.status_message_id,
+                reply_markup=noop_kb(), parse_mode="HTML",
+            )
+        except Exception as e:
+            logger.warning("Broadcast #%s: failed to update status message: %s", job.id, e)
+
+
+broadcast_jobs = BroadcastJobRunner(
+    poll_interval=settings.BROADCAST_POLL_INTERVAL,
+    lease_seconds=settings.BROADCAST_LEASE_SECONDS,
+    batch_size=settings.BROADCAST_BATCH,
+)
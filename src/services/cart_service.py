@@ -0,0 +1,203 @@
+"""Корзина: несколько товаров — одна бронь и один платёж.
+
+Оформление корзины создаёт по заказу на строку (Order по-прежнему хранит
+один товар), все в одной транзакции и с общим orders.cart_id. Строки
+обрабатываются по возрастанию product_id — единый порядок захвата блокировок
+для всех покупателей. Платёж провайдера создаётся один на корзину
+(payments.cart_id) и при успехе выполняет все её неоплаченные заказы.
+"""
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Row, delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from src.database.models import Account, Cart, CartItem, Order, Product, User
+from src.services.balance import InsufficientFunds, debit_balance
+from src.services.notifications import notify_admins_about_purchases
+from src.services.order_service import pay_referral_commissions, place_order
+
+logger = logging.getLogger(__name__)
+
+MAX_CART_ITEMS = 20
+# Неоплаченных корзин на пользователя: вместе с MAX_CART_ITEMS ограничивает
+# бронь одного покупателя, как лимит неоплаченных заказов при покупке сразу
+MAX_PENDING_CARTS = 1
+
+
+async def _open_cart_id(session: AsyncSession, user_id: int, create: bool = False) -> Optional[int]:
+    if create:
+        await session.execute(
+            insert(Cart)
+            .values(user_id=user_id, status="OPEN")
+            .on_conflict_do_nothing(index_elements=["user_id"], index_where=text("status = 'OPEN'"))
+        )
+    return (await session.execute(
+        select(Cart.id).where(Cart.user_id == user_id, Cart.status == "OPEN")
+    )).scalar_one_or_none()
+
+
+async def set_cart_item(session: AsyncSession, user_id: int, product_id: int, quantity: int) -> None:
+    """Положить товар в корзину (или заменить количество). Коммит — на вызывающей стороне."""
+    cart_id = await _open_cart_id(session, user_id, create=True)
+    lines = (await session.execute(
+        select(func.count(CartItem.id)).where(CartItem.cart_id == cart_id, CartItem.product_id != product_id)
+    )).scalar()
+    if lines >= MAX_CART_ITEMS:
+        raise ValueError(f"В корзине не больше {MAX_CART_ITEMS} товаров")
+    await session.execute(
+        insert(CartItem)
+        .values(cart_id=cart_id, product_id=product_id, quantity=quantity)
+        .on_conflict_do_update(index_elements=["cart_id", "product_id"], set_={"quantity": quantity})
+    )
+
+
+async def remove_cart_item(session: AsyncSession, user_id: int, product_id: int) -> None:
+    cart_id = await _open_cart_id(session, user_id)
+    if cart_id:
+        await session.execute(
+            delete(CartItem).where(CartItem.cart_id == cart_id, CartItem.product_id == product_id)
+        )
+
+
+async def clear_cart(session: AsyncSession, user_id: int) -> None:
+    cart_id = await _open_cart_id(session, user_id)
+    if cart_id:
+        await session.execute(delete(CartItem).where(CartItem.cart_id == cart_id))
+
+
+async def get_cart_lines(session: AsyncSession, user_id: int) -> List[Row]:
+    """Строки открытой корзины: (product_id, name, price, quantity)."""
+    return (await session.execute(
+        select(Product.id.label("product_id"), Product.name, Product.price, CartItem.quantity)
+        .join(CartItem, CartItem.product_id == Product.id)
+        .join(Cart, Cart.id == CartItem.cart_id)
+        .where(Cart.user_id == user_id, Cart.status == "OPEN")
+        .order_by(CartItem.id)
+    )).all()
+
+
+async def checkout_cart(session: AsyncSession, user: User) -> Tuple[int, List[Order]]:
+    """Оформить открытую корзину в заказы «ОЖИДАЕТ ОПЛАТЫ» и закоммитить.
+
+    Всё или ничего: если какого-то товара не хватает, транзакция откатывается
+    и бросается ValueError с названием товара. Возвращает (cart_id, заказы).
+    """
+    cart_id = (await session.execute(
+        select(Cart.id).where(Cart.user_id == user.id, Cart.status == "OPEN").with_for_update()
+    )).scalar_one_or_none()
+    items = []
+    if cart_id:
+        items = (await session.execute(
+            select(CartItem.product_id, CartItem.quantity, Product.name)
+            .join(Product, Product.id == CartItem.product_id)
+            .where(CartItem.cart_id == cart_id)
+            .order_by(CartItem.product_id)
+        )).all()
+    if not items:
+        await _abort(session, user)
+        raise ValueError("Корзина пуста")
+
+    # Открытая корзина у пользователя одна, её блокировка выше упорядочивает
+    # параллельные оформления — счётчик не гоняется сам с собой
+    pending_carts = (await session.execute(
+        select(func.count(func.distinct(Order.cart_id)))
+        .where(Order.user_id == user.id, Order.cart_id.is_not(None), Order.status == "ОЖИДАЕТ ОПЛАТЫ")
+    )).scalar()
+    if pending_carts >= MAX_PENDING_CARTS:
+        await _abort(session, user)
+        raise ValueError("Сначала оплатите или отмените уже оформленную корзину")
+
+    orders = []
+    for item in items:
+        try:
+            orders.append(await place_order(
+                session, user.telegram_id, item.product_id, item.quantity, cart_id=cart_id,
+            ))
+        except ValueError as e:
+            await _abort(session, user)
+            raise ValueError(f"{item.name}: {e}") from e
+
+    await session.execute(
+        update(Cart).where(Cart.id == cart_id).values(status="ORDERED", ordered_at=datetime.now())
+    )
+    await session.commit()
+    return cart_id, orders
+
+
+async def cart_pending_total(session: AsyncSession, cart_id: int) -> Tuple[float, int]:
+    """(сумма, число) заказов корзины, ещё ожидающих оплаты."""
+    total, count = (await session.execute(
+        select(func.coalesce(func.sum(Order.total_amount), 0.0), func.count(Order.id))
+        .where(Order.cart_id == cart_id, Order.status == "ОЖИДАЕТ ОПЛАТЫ")
+    )).one()
+    return total, count
+
+
+async def complete_cart(session: AsyncSession, cart_id: int, payment_method: str) -> List[Row]:
+    """Выполнить все ожидающие оплаты заказы корзины. Возвращает [(id, total_amount)].
+
+    Как complete_order: условный UPDATE, реферальные начисления и уведомления
+    (outbox) — в этой же транзакции. Коммит — на вызывающей стороне.
+    """
+    now = datetime.now()
+    completed = (await session.execute(
+        update(Order)
+        .where(Order.cart_id == cart_id, Order.status == "ОЖИДАЕТ ОПЛАТЫ")
+        .values(status="ВЫПОЛНЕНО", payment_method=payment_method, paid_at=now, completed_at=now)
+        .returning(Order.id, Order.total_amount)
+        .execution_options(synchronize_session="fetch")
+    )).all()
+    order_ids = [row.id for row in completed]
+    await pay_referral_commissions(session, order_ids)
+    await notify_admins_about_purchases(session, order_ids)
+    return completed
+
+
+async def pay_cart_from_balance(session: AsyncSession, cart_id: int, user: User) -> bool:
+    """Оплатить корзину с баланса одним списанием и закоммитить.
+
+    False — в корзине не осталось неоплаченных заказов. Бросает
+    InsufficientFunds (ValueError), если средств недостаточно.
+    """
+    completed = await complete_cart(session, cart_id, "balance")
+    if not completed:
+        await _abort(session, user)
+        return False
+
+    total = sum(row.total_amount for row in completed)
+    try:
+        new_balance = await debit_balance(session, user.id, total, "order", f"cart:{cart_id}")
+    except InsufficientFunds:
+        await _abort(session, user)
+        raise
+    set_committed_value(user, "balance", new_balance)
+    await session.commit()
+    return True
+
+
+async def _abort(session: AsyncSession, user: User) -> None:
+    """Откатить транзакцию; пользователь нужен вызывающему коду и дальше."""
+    await session.rollback()
+    await session.refresh(user)
+
+
+async def cancel_pending_cart(session: AsyncSession, cart_id: int) -> int:
+    """Отменить неоплаченные заказы корзины и вернуть аккаунты на склад. Возвращает число заказов."""
+    cancelled = (await session.execute(
+        update(Order)
+        .where(Order.cart_id == cart_id, Order.status == "ОЖИДАЕТ ОПЛАТЫ")
+        .values(status="ОТМЕНЕНО", reserved_until=None)
+        .returning(Order.id)
+    )).scalars().all()
+    if cancelled:
+        await session.execute(
+            update(Account)
+            .where(Account.order_id.in_(cancelled))
+            .values(is_sold=False, sold_at=None, order_id=None)
+        )
+    await session.commit()
+    return len(cancelled)
@@ -0,0 +1,250 @@
+"""HTTP-клиенты платёжных шлюзов.
+
+Один долгоживущий ClientSession на провайдера: keep-alive соединения
+переиспользуются между оплатами (без нового TCP+TLS handshake на каждый
+checkout). Таймауты на каждый запрос, повторы с экспоненциальной задержкой и
+jitter — только для идемпотентных вызовов, circuit breaker отсекает запросы к
+лежащему провайдеру, задержки копятся по каждому endpoint'у.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class GatewayError(Exception):
+    """Запрос к платёжному шлюзу не удался."""
+
+
+class GatewayUnavailable(GatewayError):
+    """Circuit breaker разомкнут — провайдер временно считается недоступным."""
+
+
+class CircuitBreaker:
+    """Размыкается после `failure_threshold` ошибок подряд на `reset_timeout` секунд.
+
+    По истечении паузы пропускает один пробный запрос (half-open): успех
+    замыкает цепь, ошибка — размыкает снова.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """Снять пробный запрос без исхода (отменён) — следующий запрос станет пробным."""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Учесть ошибку. True — цепь только что разомкнулась."""
+        was_closed = self.opened_at is None
+        self.failures += 1
+        self._probe_in_flight = False
+        if not was_closed or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        return was_closed and self.opened_at is not None
+
+
+class EndpointMetrics:
+    """Счётчики и задержки запросов к одному endpoint'у."""
+
+    def __init__(self, window: int = 500):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self._latencies: deque = deque(maxlen=window)
+
+    def observe(self, latency: float, ok: bool) -> None:
+        self.requests += 1
+        if not ok:
+            self.errors += 1
+        self._latencies.append(latency)
+
+    def as_dict(self) -> dict:
+        ordered = sorted(self._latencies)
+
+        def pct(p: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "p50": pct(50),
+            "p99": pct(99),
+            "max": ordered[-1] if ordered else None,
+        }
+
+
+class GatewayClient:
+    """Клиент одного платёжного провайдера."""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        *,
+        timeout: float,
+        connect_timeout: float,
+        pool_limit: int,
+        retries: int,
+        backoff_base: float,
+        breaker: CircuitBreaker,
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = ClientTimeout(total=timeout, connect=connect_timeout)
+        self.pool_limit = pool_limit
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.breaker = breaker
+        self._session: Optional[ClientSession] = None
+        self._metrics: Dict[str, EndpointMetrics] = {}
+
+    async def start(self) -> None:
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                timeout=self.timeout,
+                connector=TCPConnector(limit=self.pool_limit, keepalive_timeout=60, ttl_dns_cache=300),
+            )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def metrics(self) -> Dict[str, dict]:
+        return {endpoint: m.as_dict() for endpoint, m in self._metrics.items()}
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        endpoint: str,
+        idempotent: bool = False,
+        **kwargs: Any,
+    ) -> Tuple[int, Any]:
+        """Выполнить запрос. Возвращает (HTTP-статус, JSON-ответ или None).
+
+        Неидемпотентные вызовы не повторяются: повтор мог бы создать второй платёж.
+        """
+        probe = self.breaker.state == "half-open"
+        if not self.breaker.allow():
+            raise GatewayUnavailable(f"{self.name}: circuit open")
+        try:
+            await self.start()
+            metrics = self._metrics.setdefault(endpoint, EndpointMetrics())
+            attempts = 1 + (self.retries if idempotent else 0)
+
+            for attempt in range(1, attempts + 1):
+                started = time.monotonic()
+                try:
+                    async with self._session.request(method, f"{self.base_url}{path}", **kwargs) as resp:
+                        status = resp.status
+                        data = _decode(await resp.read())
+                except (ClientError, asyncio.TimeoutError) as e:
+                    metrics.observe(time.monotonic() - started, ok=False)
+                    error = GatewayError(f"{self.name} {endpoint}: {type(e).__name__}: {e}")
+                else:
+                    ok = status not in RETRY_STATUSES
+                    metrics.observe(time.monotonic() - started, ok=ok)
+                    if ok:
+                        self.breaker.record_success()
+                        return status, data
+                    error = GatewayError(f"{self.name} {endpoint}: HTTP {status}")
+
+                if attempt == attempts:
+                    if self.breaker.record_failure():
+                        logger.warning("%s: circuit open after %s failures", self.name, self.breaker.failures)
+                    raise error
+                metrics.retries += 1
+                delay = self.backoff_base * 2 ** (attempt - 1)
+                await asyncio.sleep(random.uniform(0, delay))
+            raise AssertionError("unreachable")
+        finally:
+            # Отменённый пробный запрос (таймаут хендлера, остановка) не должен
+            # навсегда оставить цепь разомкнутой
+            if probe:
+                self.breaker.release_probe()
+
+
+def _decode(body: bytes) -> Any:
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def _make_client(name: str, base_url: str) -> GatewayClient:
+    return GatewayClient(
+        name,
+        base_url,
+        timeout=settings.GATEWAY_TIMEOUT,
+        connect_timeout=settings.GATEWAY_CONNECT_TIMEOUT,
+        pool_limit=settings.GATEWAY_POOL_LIMIT,
+        retries=settings.GATEWAY_RETRIES,
+        backoff_base=settings.GATEWAY_BACKOFF_BASE,
+        breaker=CircuitBreaker(settings.GATEWAY_BREAKER_THRESHOLD, settings.GATEWAY_BREAKER_RESET),
+    )
+
+
+yookassa_gateway = _make_client("yookassa", settings.YOOKASSA_API_URL)
+heleket_gateway = _make_client("heleket", settings.HELEKET_API_URL)
+
+GATEWAYS = (yookassa_gateway, heleket_gateway)
+
+
+async def start_gateways() -> None:
+    for gateway in GATEWAYS:
+        await gateway.start()
+
+
+async def close_gateways() -> None:
+    for gateway in GATEWAYS:
+        await gateway.close()
+
+
+def gateway_metrics() -> Dict[str, Dict[str, dict]]:
+    """Метрики всех шлюзов: {провайдер: {endpoint: {...}}}."""
+    return {gateway.name: gateway.metrics() for gateway in GATEWAYS}
@@ -0,0 +1,192 @@
+"""Входящая очередь платёжных webhook'ов.
+
+Webhook только проверяет запрос, сохраняет сырое событие в таблицу inbox и сразу
+отвечает 200 — провайдер не ждёт работы с заказами и не шлёт повторы под
+нагрузкой. Пул воркеров разбирает очередь: событие «арендуется» UPDATE'ом с
+FOR UPDATE SKIP LOCKED (next_attempt_at сдвигается на время аренды), затем
+обрабатывается в отдельной транзакции. Ошибки повторяются с экспоненциальной
+задержкой, после INBOX_MAX_ATTEMPTS событие помечается DEAD. Если воркер упал
+посреди обработки, событие вернётся в работу по истечении аренды — обработчики
+идемпотентны (см. payment_events).
+"""
+import asyncio
+import json
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.database.database import async_session_maker
+from src.database.models import InboxEvent
+from src.services.payment_events import apply_heleket_event, apply_yookassa_event
+
+logger = logging.getLogger(__name__)
+
+EventHandler = Callable[[AsyncSession, dict], Awaitable[object]]
+
+HANDLERS: Dict[str, EventHandler] = {
+    "yookassa": apply_yookassa_event,
+    "heleket": apply_heleket_event,
+}
+
+
+async def store_event(provider: str, event_id: str, payload: str) -> bool:
+    """Сохранить событие в очередь. False — такое событие уже было получено."""
+    async with async_session_maker() as session:
+        result = await session.execute(
+            insert(InboxEvent)
+            .values(provider=provider, event_id=event_id, payload=payload, next_attempt_at=datetime.now())
+            .on_conflict_do_nothing(index_elements=["provider", "event_id"])
+            .returning(InboxEvent.id)
+        )
+        stored = result.scalar_one_or_none() is not None
+        await session.commit()
+    if stored:
+        inbox_workers.wake()
+    return stored
+
+
+async def prune_inbox(retention_days: int = None) -> int:
+    """Удалить обработанные события старше срока хранения (DEAD остаются для разбора)."""
+    retention_days = retention_days if retention_days is not None else settings.INBOX_RETENTION_DAYS
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    async with async_session_maker() as session:
+        result = await session.execute(
+            delete(InboxEvent).where(InboxEvent.status == "DONE", InboxEvent.processed_at < cutoff)
+        )
+        await session.commit()
+    if result.rowcount:
+        logger.info("Inbox: pruned %s processed events", result.rowcount)
+    return result.rowcount
+
+
+class InboxWorkerPool:
+    """Пул asyncio-воркеров, разбирающих таблицу inbox."""
+
+    def __init__(
+        self,
+        workers: int,
+        poll_interval: float,
+        lease_seconds: int,
+        max_attempts: int,
+        retry_base: float,
+        retry_max: float,
+    ):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    def wake(self) -> None:
+        """Разбудить воркеров сразу после записи нового события."""
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        for n in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker_loop(), name=f"inbox:{n}"))
+        logger.info("Inbox workers started: %s", self.workers)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        logger.info("Inbox workers stopped")
+
+    async def _worker_loop(self) -> None:
+        while True:
+            try:
+                processed = await self.process_one()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Inbox worker error: %s", e, exc_info=True)
+                processed = False
+            if processed:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self) -> Optional[InboxEvent]:
+        """Арендовать одно готовое к обработке событие."""
+        now = datetime.now()
+        async with async_session_maker() as session:
+            ready = (
+                select(InboxEvent.id)
+                .where(InboxEvent.status == "PENDING", InboxEvent.next_attempt_at <= now)
+                .order_by(InboxEvent.next_attempt_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            event = (await session.execute(
+                update(InboxEvent)
+                .where(InboxEvent.id.in_(ready))
+                .values(
+                    attempts=InboxEvent.attempts + 1,
+                    next_attempt_at=now + timedelta(seconds=self.lease_seconds),
+                )
+                .returning(InboxEvent)
+            )).scalar_one_or_none()
+            await session.commit()
+            return event
+
+    async def process_one(self) -> bool:
+        """Обработать одно событие. False — очередь пуста."""
+        event = await self._claim()
+        if event is None:
+            return False
+
+        try:
+            handler = HANDLERS[event.provider]
+            async with async_session_maker() as session:
+                await handler(session, json.loads(event.payload))
+        except Exception as e:
+            await self._fail(event, e)
+        else:
+            await self._finish(event.id, status="DONE", processed_at=datetime.now(), last_error=None)
+        return True
+
+    async def _fail(self, event: InboxEvent, error: Exception) -> None:
+        if event.attempts >= self.max_attempts:
+            logger.error("Inbox event #%s (%s) is dead after %s attempts: %s",
+                         event.id, event.provider, event.attempts, error)
+            await self._finish(event.id, status="DEAD", processed_at=datetime.now(), last_error=str(error))
+            return
+
+        delay = min(self.retry_max, self.retry_base * 2 ** (event.attempts - 1))
+        delay += random.uniform(0, delay / 2)
+        logger.warning("Inbox event #%s (%s) failed, attempt %s, retry in %.0fs: %s",
+                       event.id, event.provider, event.attempts, delay, error)
+        await self._finish(
+            event.id, next_attempt_at=datetime.now() + timedelta(seconds=delay), last_error=str(error),
+        )
+
+    @staticmethod
+    async def _finish(event_id: int, **values) -> None:
+        async with async_session_maker() as session:
+            await session.execute(update(InboxEvent).where(InboxEvent.id == event_id).values(**values))
+            await session.commit()
+
+
+inbox_workers = InboxWorkerPool(
+    workers=settings.INBOX_WORKERS,
+    poll_interval=settings.INBOX_POLL_INTERVAL,
+    lease_seconds=settings.INBOX_LEASE_SECONDS,
+    max_attempts=settings.INBOX_MAX_ATTEMPTS,
+    retry_base=settings.INBOX_RETRY_BASE,
+    retry_max=settings.INBOX_RETRY_MAX,
+)
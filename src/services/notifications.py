@@ -1,210 +1,280 @@
-"""Сервис уведомлений"""
-import logging
+"""Сервис уведомлений.
 
-from aiogram.types import InlineKeyboardMarkup
+Уведомления администраторам и пользователям не отправляются из хендлера:
+notify_* ставят их в notification_outbox в транзакции вызывающего
+(services/outbox.py), отправит фоновый воркер. Коммит — на вызывающей стороне.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
 
-from sqlalchemy import select
+from sqlalchemy import Row, event, exists, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
 from src.config import settings
-from src.database.models import Product, User
+from src.database.database import async_session_maker
+from src.database.models import Account, Order, Product, StockNotification, User
+from src.services.account_service import count_available
+from src.services.bot_blocked import reachable_users
+from src.services.broadcast import Broadcaster
+from src.services.outbox import enqueue_notification
+from src.services.scheduler import scheduler
 
 logger = logging.getLogger(__name__)
 
-
-def _close_notification_kb() -> InlineKeyboardMarkup:
-    """Кнопка «Закрыть» для уведомлений (inline-импорт без циркулярных зависимостей)."""
-    from aiogram.types import InlineKeyboardButton
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="❌ Закрыть", callback_data="close_notification", style="danger")],
-    ])
-
-
-async def send_notification_to_chat(bot, message: str, parse_mode: str = "HTML", reply_markup=None) -> None:
-    """Отправить уведомление в канал/чат поддержки."""
-    kb = reply_markup or _close_notification_kb()
-    try:
-        chat_id = settings.NOTIFICATIONS_CHAT_ID
-        if not chat_id:
-            for admin_id in settings.admin_ids_list:
-                try:
-                    await bot.send_message(admin_id, message, parse_mode=parse_mode, reply_markup=kb)
-                except Exception as e:
-                    logger.error("Error sending notification to admin %s: %s", admin_id, e)
-            return
-
-        try:
-            target = int(chat_id) if chat_id.lstrip("-").isdigit() else chat_id
-            await bot.send_message(target, message, parse_mode=parse_mode, reply_markup=kb)
-        except Exception as e:
-            logger.error("Error sending notification to chat %s: %s", chat_id, e)
-            for admin_id in settings.admin_ids_list:
-                try:
-                    await bot.send_message(admin_id, message, parse_mode=parse_mode, reply_markup=kb)
-                except Exception:
-                    pass
-    except Exception as e:
-        logger.error("Error in send_notification_to_chat: %s", e)
-
-
-async def notify_stock_available(session: AsyncSession, product_id: int, bot, check_stock_was_zero: bool = False) -> None:
-    """Уведомить пользователей о поступлении товара."""
-    from src.database.models import Account, StockNotification
-
-    try:
-        stmt_product = select(Product).where(Product.id == product_id)
-        result_product = await session.execute(stmt_product)
-        product = result_product.scalar_one_or_none()
-        if not product:
-            return
-
-        if check_stock_was_zero:
-            from sqlalchemy import func, update
-
-            stmt_count = select(func.count(Account.id)).where(
-                Account.product_id == product_id, Account.is_sold == False
+_STOCK_WAKE_KEY = "stock_notify_wake"
+
+
+def _is_urgent(order, left: int) -> bool:
+    """Важное событие: крупный заказ или проданная последняя единица товара."""
+    threshold = settings.NOTIFY_URGENT_AMOUNT
+    return left <= 0 or (threshold > 0 and order.total_amount >= threshold)
+
+
+async def _order_context(session: AsyncSession, order) -> Optional[Row]:
+    """(User, Product) заказа одним запросом."""
+    return (await session.execute(
+        select(User, Product)
+        .join(Product, Product.id == order.product_id)
+        .where(User.id == order.user_id)
+    )).first()
+
+
+async def notify_stock_available(bot, product_id: int, broadcaster: Optional[Broadcaster] = None) -> int:
+    """Уведомить подписчиков о поступлении товара (из задачи stock_notify).
+
+    Подписки достижимых пользователей занимаются одним UPDATE ... RETURNING
+    (is_notified = true, сразу с telegram_id) — два запуска подряд не уведомят
+    никого дважды. Сообщения уходят через Broadcaster: общий лимит скорости,
+    параллельные отправители, повторы при сетевых ошибках. Задача планировщика
+    передаёт один broadcaster на все товары — бюджет скорости и замедление
+    после 429 не сбрасываются между товарами. Недоставленные подписки одним
+    UPDATE возвращаются в ожидание до следующего поступления.
+    Возвращает число доставленных уведомлений.
+    """
+    async with async_session_maker() as session:
+        product = await session.get(Product, product_id)
+        available = await count_available(session, product_id) if product else 0
+        if product is None or not product.is_active or available <= 0:
+            return 0
+        claimed = (await session.execute(
+            update(StockNotification)
+            .where(
+                StockNotification.product_id == product_id,
+                StockNotification.is_notified == False,
+                StockNotification.user_id == User.id,
+                reachable_users(),
             )
-            result_count = await session.execute(stmt_count)
-            actual = result_count.scalar() or 0
-
-            if product.stock_count != actual:
-                await session.execute(
-                    update(Product).where(Product.id == product_id).values(stock_count=actual)
-                )
-                await session.commit()
-                result_product = await session.execute(stmt_product)
-                product = result_product.scalar_one_or_none()
-
-            if product.stock_count <= 0:
-                return
-
-        stmt = select(StockNotification).where(
-            StockNotification.product_id == product_id, StockNotification.is_notified == False
-        )
-        result = await session.execute(stmt)
-        notifications = result.scalars().all()
-        if not notifications:
-            return
-
-        for notification in notifications:
-            try:
-                stmt_user = select(User).where(User.id == notification.user_id)
-                result_user = await session.execute(stmt_user)
-                user = result_user.scalar_one_or_none()
-                if user and not user.is_blocked:
-                    await bot.send_message(
-                        user.telegram_id,
-                        f"🔔 <b>Товар поступил в продажу!</b>\n\n"
-                        f"📦 {product.name}\n"
-                        f"💰 Цена: {product.price:.2f} ₽\n"
-                        f"📊 В наличии: {product.stock_count} шт.\n\n"
-                        f"Используйте меню 'Каталог' для покупки.",
-                        parse_mode="HTML",
-                    )
-                    notification.is_notified = True
-            except Exception as e:
-                logger.error("Error notifying user %s: %s", notification.user_id, e)
-
+            .values(is_notified=True)
+            .returning(StockNotification.id, User.telegram_id)
+        )).all()
         await session.commit()
-    except Exception as e:
-        logger.error("Error in notify_stock_available: %s", e)
-
-
-async def notify_admins_about_purchase(session: AsyncSession, order, bot) -> None:
+    if not claimed:
+        return 0
+
+    subscriptions: Dict[int, List[int]] = {}
+    for subscription_id, telegram_id in claimed:
+        subscriptions.setdefault(telegram_id, []).append(subscription_id)
+    text = (
+        f"🔔 <b>Товар поступил в продажу!</b>\n\n"
+        f"📦 {product.name}\n"
+        f"💰 Цена: {product.price:.2f} ₽\n"
+        f"📊 В наличии: {available} шт.\n\n"
+        f"Используйте меню 'Каталог' для покупки."
+    )
+    undelivered: List[int] = []
+
+    def on_result(telegram_id: int, delivered: bool) -> None:
+        if not delivered:
+            undelivered.extend(subscriptions[telegram_id])
+
+    stats = await (broadcaster or Broadcaster()).run(
+        list(subscriptions),
+        lambda telegram_id: bot.send_message(telegram_id, text, parse_mode="HTML"),
+        on_result,
+    )
+    if undelivered:
+        async with async_session_maker() as session:
+            await session.execute(
+                update(StockNotification).where(StockNotification.id.in_(undelivered)).values(is_notified=False)
+            )
+            await session.commit()
+    logger.info(
+        "Stock notifications for product %s: sent=%s failed=%s in %.1fs",
+        product_id, stats.sent, stats.failed, stats.elapsed,
+    )
+    return stats.sent
+
+
+def wake_stock_notify(session: AsyncSession) -> None:
+    """После коммита сессии запустить задачу stock_notify, не дожидаясь интервала.
+
+    Если реплика не лидер планировщика, поступление разошлёт лидер в своём
+    ближайшем запуске.
+    """
+    session.sync_session.info[_STOCK_WAKE_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session: Session) -> None:
+    if session.info.pop(_STOCK_WAKE_KEY, False):
+        scheduler.wake("stock_notify")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_wake(session: Session) -> None:
+    session.info.pop(_STOCK_WAKE_KEY, None)
+
+
+async def notify_restocked_products(bot) -> int:
+    """Уведомить подписчиков всех товаров, которые фактически есть в наличии.
+
+    Задача планировщика. Очередь — сами неуведомлённые подписки
+    (idx_stock_pending), а не переход кэша stock_count через ноль: поступление
+    не теряется ни при перезапуске, ни если товар распродан и пополнен между
+    обновлениями кэша, ни если аккаунты вернулись с отменённых заказов.
+    Возвращает число доставленных уведомлений.
+    """
+    async with async_session_maker() as session:
+        product_ids = (await session.execute(
+            select(StockNotification.product_id)
+            .join(User, User.id == StockNotification.user_id)
+            .join(Product, Product.id == StockNotification.product_id)
+            .where(
+                StockNotification.is_notified == False,
+                reachable_users(),
+                Product.is_active == True,
+                exists().where(Account.product_id == StockNotification.product_id, Account.is_sold == False),
+            )
+            .distinct()
+        )).scalars().all()
+    if not product_ids:
+        return 0
+    broadcaster = Broadcaster()
+    sent = 0
+    for product_id in product_ids:
+        sent += await notify_stock_available(bot, product_id, broadcaster)
+    return sent
+
+
+def notify_reservation_expired(session: AsyncSession, telegram_id: int, order_id: int) -> None:
+    """Уведомить пользователя об отмене заказа по истечении брони."""
+    enqueue_notification(
+        session, "reservation",
+        f"⌛ <b>Бронь заказа #{order_id} истекла</b>\n\n"
+        f"Заказ не был оплачен за {settings.ORDER_RESERVATION_MINUTES} мин. и отменён.\n"
+        f"Товар возвращён в каталог.",
+        chat_ids=[telegram_id], digest=False,
+    )
+
+
+async def notify_admins_about_purchase(session: AsyncSession, order) -> None:
     """Уведомить администраторов о покупке."""
-    try:
-        stmt_user = select(User).where(User.id == order.user_id)
-        result_user = await session.execute(stmt_user)
-        user = result_user.scalar_one_or_none()
-
-        stmt_product = select(Product).where(Product.id == order.product_id)
-        result_product = await session.execute(stmt_product)
-        product = result_product.scalar_one_or_none()
-
-        if not user or not product:
-            return
-
-        text = (
-            f"🛒 <b>Новая покупка</b>\n\n"
-            f"👤 Пользователь: @{user.username or user.first_name or 'Без имени'} "
-            f"(ID: {user.telegram_id})\n"
-            f"📦 Товар: {product.name}\n"
-            f"📊 Количество: {order.quantity} шт.\n"
-            f"💰 Сумма: {order.total_amount:.2f} ₽\n"
-            f"💳 Способ оплаты: {order.payment_method or 'Не указан'}\n"
-            f"📋 Остаток на складе: {product.stock_count} шт.\n"
-            f"🆔 Заказ: #{order.id}\n"
-        )
-        await send_notification_to_chat(bot, text)
-    except Exception as e:
-        logger.error("Error in notify_admins_about_purchase: %s", e)
-
-
-async def notify_user_registration(session: AsyncSession, user: User, bot) -> None:
+    context = await _order_context(session, order)
+    if context is None:
+        return
+    user, product = context
+    # Фактический остаток: Product.stock_count — кэш, обновляемый в фоне
+    _enqueue_purchase(session, order, user, product, await count_available(session, product.id))
+
+
+async def notify_admins_about_purchases(session: AsyncSession, order_ids: Sequence[int]) -> None:
+    """Уведомить о покупке нескольких заказов (завершение заказа или корзины).
+
+    Заказы с пользователями и товарами читаются одним запросом поверх
+    загруженных в сессию объектов (populate_existing — статус и способ оплаты
+    после UPDATE), остатки — вторым, независимо от числа заказов.
+    """
+    if not order_ids:
+        return
+    rows = (await session.execute(
+        select(Order, User, Product)
+        .join(User, User.id == Order.user_id)
+        .join(Product, Product.id == Order.product_id)
+        .where(Order.id.in_(order_ids))
+        .order_by(Order.id)
+        .execution_options(populate_existing=True)
+    )).all()
+    left = dict((await session.execute(
+        select(Account.product_id, func.count(Account.id))
+        .where(Account.product_id.in_({row.Product.id for row in rows}), Account.is_sold == False)
+        .group_by(Account.product_id)
+    )).all())
+    for order, user, product in rows:
+        _enqueue_purchase(session, order, user, product, left.get(product.id, 0))
+
+
+def _enqueue_purchase(session: AsyncSession, order, user: User, product: Product, left: int) -> None:
+    text = (
+        f"🛒 <b>Новая покупка</b>\n\n"
+        f"👤 Пользователь: @{user.username or user.first_name or 'Без имени'} "
+        f"(ID: {user.telegram_id})\n"
+        f"📦 Товар: {product.name}\n"
+        f"📊 Количество: {order.quantity} шт.\n"
+        f"💰 Сумма: {order.total_amount:.2f} ₽\n"
+        f"💳 Способ оплаты: {order.payment_method or 'Не указан'}\n"
+        f"📋 Остаток на складе: {left} шт.\n"
+        f"🆔 Заказ: #{order.id}\n"
+    )
+    if left <= 0:
+        text += "\n⚠️ <b>Товар закончился</b>\n"
+    enqueue_notification(
+        session, "purchase", text, digest=not _is_urgent(order, left),
+        product=product.name, quantity=order.quantity, amount=order.total_amount,
+    )
+
+
+async def notify_user_registration(session: AsyncSession, user: User) -> None:
     """Уведомить о регистрации нового пользователя."""
-    try:
-        text = (
-            f"👤 <b>Новая регистрация</b>\n\n"
-            f"👤 Пользователь: @{user.username or user.first_name or 'Без имени'} "
-            f"(ID: {user.telegram_id})\n"
-            f"📅 Дата: {user.created_at:%d.%m.%Y %H:%M}\n"
-            f"🔗 Реферальный код: {user.referral_code or 'Нет'}\n"
-        )
-
-        if user.referred_by:
-            stmt_ref = select(User).where(User.id == user.referred_by)
-            result_ref = await session.execute(stmt_ref)
-            referrer = result_ref.scalar_one_or_none()
-            if referrer:
-                text += (
-                    f"👥 Приглашен пользователем: @{referrer.username or referrer.first_name or 'N/A'} "
-                    f"(ID: {referrer.telegram_id})\n"
-                )
-
-        await send_notification_to_chat(bot, text)
-    except Exception as e:
-        logger.error("Error in notify_user_registration: %s", e)
-
-
-async def notify_balance_topup(session: AsyncSession, user: User, amount: float, bot) -> None:
+    text = (
+        f"👤 <b>Новая регистрация</b>\n\n"
+        f"👤 Пользователь: @{user.username or user.first_name or 'Без имени'} "
+        f"(ID: {user.telegram_id})\n"
+        f"📅 Дата: {datetime.now():%d.%m.%Y %H:%M}\n"
+        f"🔗 Реферальный код: {user.referral_code or 'Нет'}\n"
+    )
+
+    if user.referred_by:
+        referrer = await session.get(User, user.referred_by)
+        if referrer:
+            text += (
+                f"👥 Приглашен пользователем: @{referrer.username or referrer.first_name or 'N/A'} "
+                f"(ID: {referrer.telegram_id})\n"
+            )
+
+    enqueue_notification(session, "registration", text)
+
+
+def notify_balance_topup(session: AsyncSession, user: User, amount: float, balance: float) -> None:
     """Уведомить о пополнении баланса."""
-    try:
-        text = (
-            f"💰 <b>Пополнение баланса</b>\n\n"
-            f"👤 Пользователь: @{user.username or user.first_name or 'Без имени'} "
-            f"(ID: {user.telegram_id})\n"
-            f"💵 Сумма: {amount:.2f} ₽\n"
-            f"💳 Новый баланс: {user.balance:.2f} ₽\n"
-        )
-        await send_notification_to_chat(bot, text)
-    except Exception as e:
-        logger.error("Error in notify_balance_topup: %s", e)
-
-
-async def notify_new_order(session: AsyncSession, order, bot) -> None:
+    text = (
+        f"💰 <b>Пополнение баланса</b>\n\n"
+        f"👤 Пользователь: @{user.username or user.first_name or 'Без имени'} "
+        f"(ID: {user.telegram_id})\n"
+        f"💵 Сумма: {amount:.2f} ₽\n"
+        f"💳 Новый баланс: {balance:.2f} ₽\n"
+    )
+    enqueue_notification(session, "topup", text, amount=amount)
+
+
+async def notify_new_order(session: AsyncSession, order) -> None:
     """Уведомить о создании нового заказа."""
-    try:
-        stmt_user = select(User).where(User.id == order.user_id)
-        result_user = await session.execute(stmt_user)
-        user = result_user.scalar_one_or_none()
-
-        stmt_product = select(Product).where(Product.id == order.product_id)
-        result_product = await session.execute(stmt_product)
-        product = result_product.scalar_one_or_none()
-
-        if not user or not product:
-            return
-
-        text = (
-            f"📦 <b>Новый заказ</b>\n\n"
-            f"👤 Пользователь: @{user.username or user.first_name or 'Без имени'} "
-            f"(ID: {user.telegram_id})\n"
-            f"📦 Товар: {product.name}\n"
-            f"📊 Количество: {order.quantity} шт.\n"
-            f"💰 Сумма: {order.total_amount:.2f} ₽\n"
-            f"⏳ Статус: {order.status}\n"
-            f"🆔 Заказ: #{order.id}\n"
-        )
-        await send_notification_to_chat(bot, text)
-    except Exception as e:
-        logger.error("Error in notify_new_order: %s", e)
+    context = await _order_context(session, order)
+    if context is None:
+        return
+    user, product = context
+
+    text = (
+        f"📦 <b>Новый заказ</b>\n\n"
+        f"👤 Пользователь: @{user.username or user.first_name or 'Без имени'} "
+        f"(ID: {user.telegram_id})\n"
+        f"📦 Товар: {product.name}\n"
+        f"📊 Количество: {order.quantity} шт.\n"
+        f"💰 Сумма: {order.total_amount:.2f} ₽\n"
+        f"⏳ Статус: {order.status}\n"
+        f"🆔 Заказ: #{order.id}\n"
+    )
+    enqueue_notification(
+        session, "order", text, product=product.name, quantity=order.quantity, amount=order.total_amount,
+    )
@@ -0,0 +1,198 @@
+"""Сервис заказов: создание, отмена, оплата и завершение"""
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Sequence
+
+from sqlalchemy import Integer, exists, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from src.config import settings
+from src.database.models import Account, Order, Product, ReferralTransaction, User
+from src.services.account_service import count_available
+from src.services.balance import InsufficientFunds, credit_balance, debit_balance
+from src.services.discount import calculate_discount
+from src.services.notifications import notify_admins_about_purchases, notify_new_order
+
+logger = logging.getLogger(__name__)
+
+
+async def place_order(
+    session: AsyncSession,
+    telegram_id: int,
+    product_id: int,
+    quantity: int,
+    cart_id: Optional[int] = None,
+) -> Order:
+    """Зарезервировать аккаунты и создать заказ «ОЖИДАЕТ ОПЛАТЫ» одним запросом.
+
+    Один оператор с CTE: выбрать непроданные аккаунты (FOR UPDATE SKIP LOCKED),
+    вставить заказ по цене товара, только если набралось `quantity` штук, и
+    пометить аккаунты проданными с order_id. Уведомление о заказе ставится в
+    outbox в той же транзакции. Бросает ValueError, если товара недостаточно.
+    Коммит — на вызывающей стороне.
+    """
+    discount_percent = calculate_discount(quantity)
+    now = datetime.now()
+
+    picked = (
+        select(Account.id)
+        .where(Account.product_id == product_id, Account.is_sold == False)
+        .order_by(Account.id)
+        .limit(quantity)
+        .with_for_update(skip_locked=True)
+        .cte("picked")
+        .prefix_with("MATERIALIZED")
+    )
+    subtotal = Product.price * quantity
+    new_order = (
+        insert(Order)
+        .from_select(
+            [
+                "user_id", "product_id", "quantity", "price_per_unit", "discount",
+                "total_amount", "status", "reserved_until", "created_at", "cart_id",
+            ],
+            select(
+                User.id,
+                Product.id,
+                literal(quantity),
+                Product.price,
+                literal(discount_percent),
+                subtotal - subtotal * (discount_percent / 100),
+                literal("ОЖИДАЕТ ОПЛАТЫ"),
+                literal(now + timedelta(minutes=settings.ORDER_RESERVATION_MINUTES)),
+                literal(now),
+                literal(cart_id, Integer),
+            )
+            .select_from(User)
+            .join(Product, Product.id == product_id)
+            .where(
+                User.telegram_id == telegram_id,
+                select(func.count()).select_from(picked).scalar_subquery() == quantity,
+            ),
+        )
+        .returning(*Order.__table__.c)
+        .cte("new_order")
+    )
+    sold = (
+        update(Account)
+        .where(Account.id.in_(select(picked.c.id).where(exists(select(new_order.c.id)))))
+        .values(is_sold=True, sold_at=now, order_id=select(new_order.c.id).scalar_subquery())
+        .returning(Account.id)
+        .cte("sold")
+    )
+    order = (await session.execute(
+        select(Order).from_statement(select(new_order).add_cte(sold))
+    )).scalar_one_or_none()
+
+    if order is None:
+        available = await count_available(session, product_id)
+        if available >= quantity:
+            # Аккаунты заняты параллельными покупателями (или товар/пользователь удалены)
+            raise ValueError("Не удалось зарезервировать товар, попробуйте ещё раз")
+        raise ValueError(
+            f"Недостаточно товара на складе. Доступно: {available}, требуется: {quantity}"
+        )
+    await notify_new_order(session, order)
+    return order
+
+
+async def cancel_pending_order(session: AsyncSession, order_id: int) -> bool:
+    """Отменить неоплаченный заказ и вернуть аккаунты на склад.
+
+    Статус меняется условным UPDATE, поэтому параллельная отмена (пользователь,
+    чистка просроченных броней) освобождает аккаунты ровно один раз.
+    """
+    result = await session.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.status == "ОЖИДАЕТ ОПЛАТЫ")
+        .values(status="ОТМЕНЕНО", reserved_until=None)
+        .returning(Order.id)
+    )
+    if result.scalar_one_or_none() is None:
+        return False
+
+    await session.execute(
+        update(Account).where(Account.order_id == order_id).values(is_sold=False, sold_at=None, order_id=None)
+    )
+    await session.commit()
+    return True
+
+
+async def complete_order(session: AsyncSession, order_id: int, payment_method: str) -> bool:
+    """Перевести заказ «ОЖИДАЕТ ОПЛАТЫ» → «ВЫПОЛНЕНО». False — заказ уже не ожидает оплаты.
+
+    Единая точка завершения заказа для всех способов оплаты. Статус меняется
+    условным UPDATE (загруженный в сессию Order обновляется автоматически).
+    Реферальное начисление и уведомление админов (outbox) пишутся в этой же
+    транзакции. Коммит — на вызывающей стороне.
+    """
+    now = datetime.now()
+    completed = (await session.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.status == "ОЖИДАЕТ ОПЛАТЫ")
+        .values(status="ВЫПОЛНЕНО", payment_method=payment_method, paid_at=now, completed_at=now)
+        .returning(Order.id)
+        .execution_options(synchronize_session="fetch")
+    )).scalar_one_or_none()
+    if completed is None:
+        return False
+
+    await pay_referral_commissions(session, [order_id])
+    await notify_admins_about_purchases(session, [order_id])
+    return True
+
+
+async def pay_order_from_balance(session: AsyncSession, order: Order, user: User) -> bool:
+    """Оплатить заказ с баланса и закоммитить. False — заказ уже не ожидает оплаты.
+
+    Бросает InsufficientFunds (ValueError), если средств недостаточно.
+    """
+    if not await complete_order(session, order.id, "balance"):
+        await _rollback(session, order, user)
+        return False
+
+    try:
+        new_balance = await debit_balance(session, user.id, order.total_amount, "order", f"order:{order.id}")
+    except InsufficientFunds:
+        await _rollback(session, order, user)
+        raise
+    set_committed_value(user, "balance", new_balance)
+    await session.commit()
+    return True
+
+
+async def _rollback(session: AsyncSession, *objects) -> None:
+    """Откатить транзакцию и перечитать объекты, которые вызывающий код ещё покажет."""
+    await session.rollback()
+    for obj in objects:
+        await session.refresh(obj)
+
+
+# ── Фоновые эффекты выполненного заказа ──
+
+async def pay_referral_commissions(session: AsyncSession, order_ids: Sequence[int]) -> None:
+    """Начислить реферальные бонусы за выполненные заказы в транзакции оплаты.
+
+    Это деньги, поэтому они не уходят в фоновую очередь в памяти: начисление
+    коммитится вместе с заказом. Повтор безопасен — uq_referral_order.
+    Коммит — на вызывающей стороне.
+    """
+    if settings.REFERRAL_COMMISSION <= 0 or not order_ids:
+        return
+    commission = Order.total_amount * (settings.REFERRAL_COMMISSION / 100)
+    credited = (await session.execute(
+        insert(ReferralTransaction)
+        .from_select(
+            ["referrer_id", "referred_id", "order_id", "amount", "commission"],
+            select(User.referred_by, User.id, Order.id, Order.total_amount, commission)
+            .join(User, User.id == Order.user_id)
+            .where(Order.id.in_(order_ids), Order.status == "ВЫПОЛНЕНО", User.referred_by.isnot(None)),
+        )
+        .on_conflict_do_nothing(index_elements=["order_id"])
+        .returning(ReferralTransaction.order_id, ReferralTransaction.referrer_id, ReferralTransaction.commission)
+    )).all()
+    for row in credited:
+        if row.commission > 0:
+            await credit_balance(session, row.referrer_id, row.commission, "referral", f"order:{row.order_id}")
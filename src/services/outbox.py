@@ -0,0 +1,378 @@
+"""Исходящая очередь уведомлений (transactional outbox).
+
+Уведомление записывается строкой notification_outbox в той же транзакции,
+что и бизнес-изменение (заказ, оплата, регистрация): откат транзакции
+отменяет и уведомление, а коммит гарантирует, что оно будет отправлено, даже
+если Telegram сейчас недоступен или бот перезапустится. Хендлер только ставит
+строку в очередь и не ждёт Bot API.
+
+Воркер разбирает очередь как inbox: строки «арендуются» UPDATE'ом с
+FOR UPDATE SKIP LOCKED (next_attempt_at сдвигается на время аренды), отправка
+идёт не быстрее OUTBOX_RATE сообщений в секунду и берёт токены общего лимита
+бота (bot_throttle) вместе с рассылками. 429 приостанавливает все отправки
+бота на retry_after и снижает общий темп. Сетевые ошибки и 5xx
+повторяются с экспоненциальной задержкой, после OUTBOX_MAX_ATTEMPTS строка
+помечается DEAD; окончательные ошибки (чат не найден, бот удалён из чата) —
+сразу DEAD. Если реплика упала между отправкой и отметкой SENT, уведомление
+уйдёт повторно после аренды: доставка «хотя бы один раз».
+
+Рядовые события (digest = true) объединяются в сводку: строки одного чата
+ждут NOTIFY_DIGEST_INTERVAL секунд с момента первой или набора
+NOTIFY_DIGEST_MAX_EVENTS и уходят одним сообщением с итогами по товарам.
+Одно событие за окно отправляется своим обычным текстом.
+"""
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Union
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from sqlalchemy import delete, event, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src.bot.keyboards import close_notification_kb
+from src.config import settings
+from src.database.database import async_session_maker
+from src.database.models import NotificationOutbox
+from src.services.broadcast import RETRY_AFTER_SLOWDOWN, is_transient
+from src.utils.rate_limit import Throttle, bot_throttle
+
+logger = logging.getLogger(__name__)
+
+_WAKE_KEY = "outbox_wake"
+
+DIGEST_TOP_PRODUCTS = 15
+
+
+def notification_targets() -> List[Union[int, str]]:
+    """Куда уходят уведомления администраторам: NOTIFICATIONS_CHAT_ID или каждому админу."""
+    if settings.NOTIFICATIONS_CHAT_ID:
+        return [settings.NOTIFICATIONS_CHAT_ID]
+    return settings.admin_ids_list
+
+
+def enqueue_notification(
+    session: AsyncSession,
+    kind: str,
+    text: str,
+    chat_ids: Optional[Iterable[Union[int, str]]] = None,
+    digest: bool = True,
+    product: Optional[str] = None,
+    quantity: int = 0,
+    amount: float = 0.0,
+) -> None:
+    """Поставить уведомление в очередь в транзакции сессии. Коммит — на вызывающей стороне.
+
+    chat_ids=None — администраторам (notification_targets()). digest=False —
+    отправить без ожидания сводки.
+    """
+    targets = notification_targets() if chat_ids is None else chat_ids
+    session.add_all([
+        NotificationOutbox(
+            chat_id=str(chat_id), kind=kind, message_text=text, digest=digest,
+            product=product, quantity=quantity, amount=amount,
+        )
+        for chat_id in targets
+    ])
+    session.sync_session.info[_WAKE_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session: Session) -> None:
+    if session.info.pop(_WAKE_KEY, False):
+        outbox_worker.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_wake(session: Session) -> None:
+    session.info.pop(_WAKE_KEY, None)
+
+
+def digest_text(rows: List[NotificationOutbox], elapsed: float) -> str:
+    """Сводка событий: итоги покупок и заказов по товарам, регистрации, пополнения."""
+    totals: Dict[str, List[float]] = {}
+    products: Dict[str, Dict[str, List[float]]] = {}
+    for row in rows:
+        total = totals.setdefault(row.kind, [0, 0.0])
+        total[0] += 1
+        total[1] += row.amount
+        if row.product:
+            product = products.setdefault(row.kind, {}).setdefault(row.product, [0, 0, 0.0])
+            product[0] += 1
+            product[1] += row.quantity
+            product[2] += row.amount
+
+    lines = [f"📊 <b>Сводка уведомлений</b> — {len(rows)} событий за {max(1, round(elapsed))} с\n"]
+    for kind, title in (("purchase", "🛒 Покупки"), ("order", "📦 Новые заказы")):
+        if kind not in totals:
+            continue
+        count, amount = totals[kind]
+        lines.append(f"{title}: {count} на {amount:.2f} ₽")
+        ranked = sorted(products.get(kind, {}).items(), key=lambda item: -item[1][2])
+        for name, (orders, quantity, subtotal) in ranked[:DIGEST_TOP_PRODUCTS]:
+            lines.append(f"  • {name}: {orders} зак., {quantity} шт., {subtotal:.2f} ₽")
+        if len(ranked) > DIGEST_TOP_PRODUCTS:
+            lines.append(f"  • … ещё товаров: {len(ranked) - DIGEST_TOP_PRODUCTS}")
+    if "registration" in totals:
+        lines.append(f"👤 Регистрации: {totals['registration'][0]}")
+    if "topup" in totals:
+        count, amount = totals["topup"]
+        lines.append(f"💰 Пополнения баланса: {count} на {amount:.2f} ₽")
+    return "\n".join(lines)
+
+
+async def outbox_backlog(session: AsyncSession) -> dict:
+    """Состояние очереди для админ-панели."""
+    pending, retrying, dead, oldest = (await session.execute(
+        select(
+            func.count().filter(NotificationOutbox.status == "PENDING"),
+            func.count().filter(NotificationOutbox.status == "PENDING", NotificationOutbox.attempts > 0),
+            func.count().filter(NotificationOutbox.status == "DEAD"),
+            func.min(NotificationOutbox.created_at).filter(NotificationOutbox.status == "PENDING"),
+        ).where(NotificationOutbox.status != "SENT")
+    )).one()
+    sent_hour = (await session.execute(
+        select(func.count()).where(
+            NotificationOutbox.status == "SENT",
+            NotificationOutbox.sent_at >= datetime.now() - timedelta(hours=1),
+        )
+    )).scalar()
+    errors = (await session.execute(
+        select(NotificationOutbox.status, NotificationOutbox.chat_id, NotificationOutbox.last_error)
+        .where(NotificationOutbox.status != "SENT", NotificationOutbox.last_error.isnot(None))
+        .order_by(NotificationOutbox.next_attempt_at.desc())
+        .limit(5)
+    )).all()
+    return {
+        "pending": pending, "retrying": retrying, "dead": dead,
+        "oldest": oldest, "sent_hour": sent_hour, "errors": errors,
+    }
+
+
+async def requeue_dead(session: AsyncSession) -> int:
+    """Вернуть DEAD-уведомления в очередь (после исправления настроек чата). Коммитит."""
+    result = await session.execute(
+        update(NotificationOutbox)
+        .where(NotificationOutbox.status == "DEAD")
+        .values(status="PENDING", attempts=0, next_attempt_at=datetime.now(), last_error=None)
+    )
+    await session.commit()
+    if result.rowcount:
+        outbox_worker.wake()
+    return result.rowcount
+
+
+async def prune_outbox(retention_days: int = None) -> int:
+    """Удалить отправленные уведомления старше срока хранения (DEAD остаются для разбора)."""
+    retention_days = retention_days if retention_days is not None else settings.OUTBOX_RETENTION_DAYS
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    async with async_session_maker() as session:
+        result = await session.execute(
+            delete(NotificationOutbox).where(NotificationOutbox.status == "SENT", NotificationOutbox.sent_at < cutoff)
+        )
+        await session.commit()
+    if result.rowcount:
+        logger.info("Outbox: pruned %s sent notifications", result.rowcount)
+    return result.rowcount
+
+
+class OutboxWorker:
+    """Фоновая отправка уведомлений из notification_outbox."""
+
+    def __init__(
+        self,
+        poll_interval: float,
+        rate: float,
+        batch_size: int,
+        lease_seconds: int,
+        max_attempts: int,
+        retry_base: float,
+        retry_max: float,
+        digest_interval: float,
+        digest_max_events: int,
+    ):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.digest_interval = digest_interval
+        self.digest_max_events = digest_max_events
+        self.rate = rate
+        self.throttle = Throttle(rate, parent=bot_throttle())
+        self.bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self.sent = 0
+        self.failed = 0
+
+    def wake(self) -> None:
+        """Разбудить воркер сразу после коммита с новыми уведомлениями."""
+        self._wakeup.set()
+
+    async def start(self, bot) -> None:
+        if self._task is not None:
+            return
+        self.bot = bot
+        self._task = asyncio.create_task(self._loop(), name="outbox")
+        logger.info("Outbox worker started: %.1f msg/s", self.rate)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logger.info("Outbox worker stopped")
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                busy = await self.process()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Outbox worker error: %s", e, exc_info=True)
+                busy = False
+            if busy:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def process(self) -> bool:
+        """Один проход: отправить готовые уведомления и созревшие сводки. False — отправлять нечего."""
+        now = datetime.now()
+        messages = [([row], row.message_text) for row in await self._claim_direct(now)]
+        for rows in await self._claim_digests(now):
+            if len(rows) == 1:
+                messages.append((rows, rows[0].message_text))
+            else:
+                elapsed = (now - min(row.created_at for row in rows)).total_seconds()
+                messages.append((rows, digest_text(rows, elapsed)))
+        for rows, text in messages:
+            await self._deliver(rows, text)
+        return bool(messages)
+
+    def _lease(self, ready):
+        return (
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(ready))
+            .values(
+                attempts=NotificationOutbox.attempts + 1,
+                next_attempt_at=datetime.now() + timedelta(seconds=self.lease_seconds),
+            )
+            .returning(NotificationOutbox)
+        )
+
+    async def _claim_direct(self, now: datetime) -> List[NotificationOutbox]:
+        """Арендовать уведомления, которые не ждут сводки."""
+        ready = (
+            select(NotificationOutbox.id)
+            .where(NotificationOutbox.status == "PENDING", NotificationOutbox.next_attempt_at <= now)
+            .order_by(NotificationOutbox.next_attempt_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        if self.digest_interval > 0:
+            ready = ready.where(NotificationOutbox.digest == False)
+        async with async_session_maker() as session:
+            rows = (await session.execute(self._lease(ready))).scalars().all()
+            await session.commit()
+        return rows
+
+    async def _claim_digests(self, now: datetime) -> List[List[NotificationOutbox]]:
+        """Арендовать созревшие сводки: по списку строк на чат."""
+        if self.digest_interval <= 0:
+            return []
+        pending = (
+            NotificationOutbox.status == "PENDING",
+            NotificationOutbox.digest == True,
+            NotificationOutbox.next_attempt_at <= now,
+        )
+        digests = []
+        async with async_session_maker() as session:
+            chats = (await session.execute(
+                select(NotificationOutbox.chat_id)
+                .where(*pending)
+                .group_by(NotificationOutbox.chat_id)
+                .having(or_(
+                    func.min(NotificationOutbox.created_at) <= now - timedelta(seconds=self.digest_interval),
+                    func.count() >= self.digest_max_events,
+                ))
+            )).scalars().all()
+            for chat_id in chats:
+                ready = (
+                    select(NotificationOutbox.id)
+                    .where(*pending, NotificationOutbox.chat_id == chat_id)
+                    .order_by(NotificationOutbox.created_at, NotificationOutbox.id)
+                    .limit(self.digest_max_events)
+                    .with_for_update(skip_locked=True)
+                )
+                rows = (await session.execute(self._lease(ready))).scalars().all()
+                if rows:
+                    digests.append(rows)
+            await session.commit()
+        return digests
+
+    async def _deliver(self, rows: List[NotificationOutbox], text: str) -> None:
+        chat_id = rows[0].chat_id
+        target = int(chat_id) if chat_id.lstrip("-").isdigit() else chat_id
+        ids = [row.id for row in rows]
+        await self.throttle.acquire()
+        try:
+            await self.bot.send_message(target, text, parse_mode="HTML", reply_markup=close_notification_kb())
+        except TelegramRetryAfter as e:
+            # Flood control — на весь бот: пауза для всех отправок, попытка не тратится,
+            # общий темп снижается, как в Broadcaster
+            if self.throttle.flood_wait(e.retry_after, RETRY_AFTER_SLOWDOWN):
+                logger.warning("Outbox: flood control, pausing for %ss, bot rate lowered to %.1f/s",
+                               e.retry_after, self.throttle.root.rate)
+            await self._finish(
+                ids, attempts=NotificationOutbox.attempts - 1,
+                next_attempt_at=datetime.now() + timedelta(seconds=e.retry_after), last_error=str(e),
+            )
+        except Exception as e:
+            self.failed += 1
+            await self._fail(ids, max(row.attempts for row in rows), chat_id, e)
+        else:
+            self.sent += len(rows)
+            await self._finish(ids, status="SENT", sent_at=datetime.now(), last_error=None)
+
+    async def _fail(self, ids: List[int], attempts: int, chat_id: str, error: Exception) -> None:
+        if not is_transient(error) or attempts >= self.max_attempts:
+            logger.error("Outbox: %s notifications to %s are dead after %s attempts: %s",
+                         len(ids), chat_id, attempts, error)
+            await self._finish(ids, status="DEAD", last_error=str(error))
+            return
+
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+        delay += random.uniform(0, delay / 2)
+        logger.warning("Outbox: sending to %s failed, attempt %s, retry in %.0fs: %s",
+                       chat_id, attempts, delay, error)
+        await self._finish(ids, next_attempt_at=datetime.now() + timedelta(seconds=delay), last_error=str(error))
+
+    @staticmethod
+    async def _finish(ids: List[int], **values) -> None:
+        async with async_session_maker() as session:
+            await session.execute(update(NotificationOutbox).where(NotificationOutbox.id.in_(ids)).values(**values))
+            await session.commit()
+
+
+outbox_worker = OutboxWorker(
+    poll_interval=settings.OUTBOX_POLL_INTERVAL,
+    rate=settings.OUTBOX_RATE,
+    batch_size=settings.OUTBOX_BATCH,
+    lease_seconds=settings.OUTBOX_LEASE_SECONDS,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+    retry_base=settings.OUTBOX_RETRY_BASE,
+    retry_max=settings.OUTBOX_RETRY_MAX,
+    digest_interval=settings.NOTIFY_DIGEST_INTERVAL,
+    digest_max_events=settings.NOTIFY_DIGEST_MAX_EVENTS,
+)
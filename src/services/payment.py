@@ -4,11 +4,11 @@ import hashlib
 import hmac
 import json
 import logging
+import uuid
 from typing import Any, Dict, Optional
 
-from aiohttp import ClientSession
-
 from src.config import settings
+from src.services.gateway import GatewayError, heleket_gateway, yookassa_gateway
 
 logger = logging.getLogger(__name__)
 
@@ -17,46 +17,67 @@ class PaymentService:
     """Сервис для работы с платежными системами."""
 
     @staticmethod
-    async def create_yookassa_payment(amount: float, order_id: int, user_id: int) -> Optional[Dict]:
+    def _yookassa_headers() -> Dict[str, str]:
+        auth_string = f"{settings.YOOKASSA_SHOP_ID}:{settings.YOOKASSA_SECRET_KEY}"
+        return {"Authorization": f"Basic {base64.b64encode(auth_string.encode()).decode()}"}
+
+    @staticmethod
+    def _heleket_headers() -> Dict[str, str]:
+        return {"Authorization": f"Bearer {settings.HELEKET_API_KEY}"}
+
+    @staticmethod
+    async def create_yookassa_payment(
+        amount: float, order_id: int, user_id: int, cart_id: Optional[int] = None,
+    ) -> Optional[Dict]:
         if not settings.YOOKASSA_SHOP_ID or not settings.YOOKASSA_SECRET_KEY:
             return None
+        if cart_id:
+            description = f"Корзина #{cart_id}"
+        else:
+            description = f"Заказ #{order_id}" if order_id else "Пополнение баланса"
+        payload = {
+            "amount": {"value": f"{amount:.2f}", "currency": "RUB"},
+            "confirmation": {"type": "redirect", "return_url": f"https://t.me/{settings.BOT_NAME}"},
+            "description": description,
+            "metadata": {"order_id": order_id or 0, "cart_id": cart_id or 0, "user_id": user_id},
+        }
+        # Один Idempotence-Key на все повторы — ЮKassa не создаст второй платёж
+        headers = {**PaymentService._yookassa_headers(), "Idempotence-Key": str(uuid.uuid4())}
         try:
-            auth_string = f"{settings.YOOKASSA_SHOP_ID}:{settings.YOOKASSA_SECRET_KEY}"
-            auth_header = base64.b64encode(auth_string.encode()).decode()
-
-            async with ClientSession() as session:
-                payload = {
-                    "amount": {"value": f"{amount:.2f}", "currency": "RUB"},
-                    "confirmation": {"type": "redirect", "return_url": f"https://t.me/{settings.BOT_NAME}"},
-                    "description": f"Заказ #{order_id}" if order_id else "Пополнение баланса",
-                    "metadata": {"order_id": order_id or 0, "user_id": user_id},
-                }
-                headers = {"Authorization": f"Basic {auth_header}", "Content-Type": "application/json"}
-                async with session.post("https://api.yookassa.ru/v3/payments", json=payload, headers=headers) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        return {
-                            "payment_id": data.get("id"),
-                            "payment_url": data.get("confirmation", {}).get("confirmation_url"),
-                        }
-        except Exception as e:
+            status, data = await yookassa_gateway.request(
+                "POST", "/payments", endpoint="create_payment", idempotent=True, json=payload, headers=headers,
+            )
+        except GatewayError as e:
             logger.error("YooKassa payment creation error: %s", e)
+            return None
+        if status == 200 and data:
+            return {
+                "payment_id": data.get("id"),
+                "payment_url": data.get("confirmation", {}).get("confirmation_url"),
+            }
+        logger.error("YooKassa payment creation failed: HTTP %s %s", status, data)
         return None
 
     @staticmethod
-    async def create_heleket_payment(amount: float, order_id: int, user_id: int) -> Optional[Dict]:
+    async def create_heleket_payment(
+        amount: float, order_id: int, user_id: int, cart_id: Optional[int] = None,
+    ) -> Optional[Dict]:
         if not settings.HELEKET_API_KEY:
             return None
+        payload = {"amount": amount, "order_id": str(order_id) if order_id else "0", "user_id": user_id}
+        if cart_id:
+            payload["cart_id"] = cart_id
         try:
-            async with ClientSession() as session:
-                headers = {"Authorization": f"Bearer {settings.HELEKET_API_KEY}", "Content-Type": "application/json"}
-                payload = {"amount": amount, "order_id": str(order_id) if order_id else "0", "user_id": user_id}
-                async with session.post("https://api.heleket.com/v1/payments/create", json=payload, headers=headers) as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        return {"payment_id": data.get("payment_id"), "payment_url": data.get("payment_url")}
-        except Exception as e:
+            status, data = await heleket_gateway.request(
+                "POST", "/payments/create", endpoint="create_payment",
+                json=payload, headers=PaymentService._heleket_headers(),
+            )
+        except GatewayError as e:
             logger.error("Heleket payment creation error: %s", e)
+            return None
+        if status == 200 and data:
+            return {"payment_id": data.get("payment_id"), "payment_url": data.get("payment_url")}
+        logger.error("Heleket payment creation failed: HTTP %s %s", status, data)
         return None
 
     @staticmethod
@@ -90,27 +111,25 @@ class PaymentService:
         if not settings.YOOKASSA_SHOP_ID or not settings.YOOKASSA_SECRET_KEY:
             return None
         try:
-            auth_string = f"{settings.YOOKASSA_SHOP_ID}:{settings.YOOKASSA_SECRET_KEY}"
-            auth_header = base64.b64encode(auth_string.encode()).decode()
-            async with ClientSession() as session:
-                headers = {"Authorization": f"Basic {auth_header}", "Content-Type": "application/json"}
-                async with session.get(f"https://api.yookassa.ru/v3/payments/{payment_id}", headers=headers) as resp:
-                    if resp.status == 200:
-                        return await resp.json()
-        except Exception as e:
+            status, data = await yookassa_gateway.request(
+                "GET", f"/payments/{payment_id}", endpoint="get_payment", idempotent=True,
+                headers=PaymentService._yookassa_headers(),
+            )
+        except GatewayError as e:
             logger.error("YooKassa payment status error: %s", e)
-        return None
+            return None
+        return data if status == 200 else None
 
     @staticmethod
     async def get_heleket_payment_status(payment_id: str) -> Optional[Dict]:
         if not settings.HELEKET_API_KEY:
             return None
         try:
-            async with ClientSession() as session:
-                headers = {"Authorization": f"Bearer {settings.HELEKET_API_KEY}", "Content-Type": "application/json"}
-                async with session.get(f"https://api.heleket.com/v1/payments/{payment_id}", headers=headers) as resp:
-                    if resp.status == 200:
-                        return await resp.json()
-        except Exception as e:
+            status, data = await heleket_gateway.request(
+                "GET", f"/payments/{payment_id}", endpoint="get_payment", idempotent=True,
+                headers=PaymentService._heleket_headers(),
+            )
+        except GatewayError as e:
             logger.error("Heleket payment status error: %s", e)
-        return None
+            return None
+        return data if status == 200 else None
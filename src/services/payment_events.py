@@ -0,0 +1,184 @@
+"""Применение событий об успешной оплате от платёжных систем.
+
+Провайдеры повторяют webhook'и и могут доставить одно событие параллельно,
+поэтому обработка идемпотентна: платёж «захватывается» условным UPDATE
+(status = 'PENDING' → 'COMPLETED') или INSERT ... ON CONFLICT DO NOTHING по
+уникальному (payment_method, payment_id). Эффект (выполнение заказа или
+зачисление на баланс) выполняется в той же транзакции только захватившим
+событие обработчиком; повторы — дешёвый no-op.
+"""
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import Payment, User
+from src.services.balance import credit_balance
+from src.services.cart_service import complete_cart
+from src.services.order_service import complete_order
+
+logger = logging.getLogger(__name__)
+
+
+async def _claim_payment(
+    session: AsyncSession,
+    method: str,
+    payment_id: str,
+    order_id: Optional[int],
+    cart_id: Optional[int],
+    telegram_id: Optional[int],
+    amount: float,
+    register_unknown: bool,
+):
+    """Перевести платёж в COMPLETED. Возвращает (user_id, order_id, cart_id, amount) или None, если уже обработан."""
+    now = datetime.now()
+    claimed = (await session.execute(
+        update(Payment)
+        .where(
+            Payment.payment_method == method,
+            Payment.payment_id == payment_id,
+            Payment.status == "PENDING",
+        )
+        .values(status="COMPLETED", completed_at=now)
+        .returning(Payment.user_id, Payment.order_id, Payment.cart_id, Payment.amount)
+    )).first()
+    if claimed:
+        return claimed
+
+    # Платежа нет в БД (Stars: запись не создаётся до оплаты) — регистрируем
+    # его сразу завершённым; дубликат упрётся в уникальный индекс.
+    if not register_unknown or not telegram_id or amount <= 0:
+        return None
+    user_id = (await session.execute(
+        select(User.id).where(User.telegram_id == telegram_id)
+    )).scalar_one_or_none()
+    if user_id is None:
+        return None
+    return (await session.execute(
+        insert(Payment)
+        .values(
+            user_id=user_id,
+            amount=amount,
+            payment_method=method,
+            payment_id=payment_id,
+            order_id=order_id,
+            cart_id=cart_id,
+            status="COMPLETED",
+            created_at=now,
+            completed_at=now,
+        )
+        .on_conflict_do_nothing(index_elements=["payment_method", "payment_id"])
+        .returning(Payment.user_id, Payment.order_id, Payment.cart_id, Payment.amount)
+    )).first()
+
+
+async def apply_payment_success(
+    session: AsyncSession,
+    method: str,
+    payment_id: str,
+    *,
+    order_id: Optional[int] = None,
+    cart_id: Optional[int] = None,
+    telegram_id: Optional[int] = None,
+    amount: float = 0.0,
+    register_unknown: bool = True,
+) -> bool:
+    """Применить успешную оплату ровно один раз. Возвращает False для повторов.
+
+    order_id/cart_id/telegram_id/amount из события используются, только если
+    платёж не найден в БД; иначе берутся сохранённые при создании значения.
+    register_unknown=False — платёж должен быть в БД: события провайдеров
+    приходят по HTTP, и сумма из поддельного события не зачисляется.
+    """
+    claimed = await _claim_payment(
+        session, method, payment_id, order_id, cart_id, telegram_id, amount, register_unknown,
+    )
+    if claimed is None:
+        await session.rollback()
+        logger.info("Payment %s/%s already processed or unknown, skipping", method, payment_id)
+        return False
+
+    user_id, order_id, cart_id, amount = claimed
+    if cart_id:
+        # Оплачиваются заказы корзины, ещё ожидающие оплаты; за отменённые
+        # (истекла бронь, отменены вручную) остаток уходит на баланс
+        paid = sum(row.total_amount for row in await complete_cart(session, cart_id, method))
+        if amount - paid >= 0.01:
+            logger.warning(
+                "Payment %s/%s for cart #%s exceeds its pending orders by %.2f; crediting balance",
+                method, payment_id, cart_id, amount - paid,
+            )
+            await credit_balance(session, user_id, amount - paid, "topup", f"{method}:{payment_id}")
+    elif order_id:
+        if not await complete_order(session, order_id, method):
+            # Заказ уже отменён (истекла бронь) — деньги не теряем, зачисляем на баланс
+            logger.warning(
+                "Payment %s/%s for order #%s arrived after the order left pending; crediting balance",
+                method, payment_id, order_id,
+            )
+            await credit_balance(session, user_id, amount, "topup", f"{method}:{payment_id}")
+    else:
+        await credit_balance(session, user_id, amount, "topup", f"{method}:{payment_id}")
+
+    await session.commit()
+    logger.info(
+        "Payment %s/%s applied (order=%s, cart=%s, amount=%.2f)", method, payment_id, order_id, cart_id, amount,
+    )
+    return True
+
+
+# ── События провайдеров ──
+
+def yookassa_event_id(data: dict) -> Optional[str]:
+    """Ключ дедупликации события ЮKassa."""
+    payment_id = data.get("object", {}).get("id")
+    return f"{data.get('event', '')}:{payment_id}" if payment_id else None
+
+
+def heleket_event_id(data: dict) -> Optional[str]:
+    """Ключ дедупликации события Heleket."""
+    payment_id = data.get("payment_id")
+    return f"{data.get('status', '')}:{payment_id}" if payment_id else None
+
+
+async def apply_yookassa_event(session: AsyncSession, data: dict) -> bool:
+    """Обработать событие ЮKassa. Неинтересные события игнорируются."""
+    payment_obj = data.get("object", {})
+    payment_id = payment_obj.get("id")
+    if data.get("event") != "payment.succeeded" or payment_obj.get("status") != "succeeded" or not payment_id:
+        return False
+
+    metadata = payment_obj.get("metadata", {})
+    order_id = metadata.get("order_id")
+    cart_id = metadata.get("cart_id")
+    user_id = metadata.get("user_id")
+    return await apply_payment_success(
+        session, "yookassa", payment_id,
+        order_id=int(order_id) if order_id else None,
+        cart_id=int(cart_id) if cart_id else None,
+        telegram_id=int(user_id) if user_id else None,
+        amount=float(payment_obj.get("amount", {}).get("value", 0)),
+        register_unknown=False,
+    )
+
+
+async def apply_heleket_event(session: AsyncSession, data: dict) -> bool:
+    """Обработать событие Heleket. Неинтересные события игнорируются."""
+    payment_id = data.get("payment_id")
+    if data.get("status") != "completed" or not payment_id:
+        return False
+
+    order_id = data.get("order_id")
+    cart_id = data.get("cart_id")
+    user_id = data.get("user_id")
+    return await apply_payment_success(
+        session, "heleket", str(payment_id),
+        order_id=int(order_id) if order_id and str(order_id) != "0" else None,
+        cart_id=int(cart_id) if cart_id else None,
+        telegram_id=int(user_id) if user_id else None,
+        amount=float(data.get("amount", 0)),
+        register_unknown=False,
+    )
@@ -0,0 +1,114 @@
+"""Сверка зависших платежей с платёжными системами.
+
+Если webhook потерялся, платёж остаётся PENDING, а заказ — «ОЖИДАЕТ ОПЛАТЫ»
+с замороженным товаром. Задача постранично (курсор по payments.id в job_state)
+проходит PENDING-платежи в окне возраста, параллельно (не больше
+RECONCILE_CONCURRENCY запросов) спрашивает статус у провайдера и применяет
+успешные оплаты той же логикой, что и webhook'и.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from src.config import settings
+from src.database.database import async_session_maker
+from src.database.models import Payment
+from src.services.payment import PaymentService
+from src.services.payment_events import apply_payment_success
+from src.services.scheduler import get_job_cursor, set_job_cursor
+
+logger = logging.getLogger(__name__)
+
+CURSOR_NAME = "payment_reconcile"
+
+StatusFetcher = Callable[[str], Awaitable[Optional[dict]]]
+
+# Провайдер → (запрос статуса, статусы успешной оплаты, статусы отмены)
+PROVIDERS: Dict[str, Tuple[StatusFetcher, frozenset, frozenset]] = {
+    "yookassa": (
+        PaymentService.get_yookassa_payment_status,
+        frozenset({"succeeded"}),
+        frozenset({"canceled"}),
+    ),
+    "heleket": (
+        PaymentService.get_heleket_payment_status,
+        frozenset({"completed", "paid"}),
+        frozenset({"failed", "cancelled", "canceled", "expired"}),
+    ),
+}
+
+
+async def _reconcile_one(method: str, payment_id: str) -> Optional[str]:
+    """Сверить один платёж. Возвращает применённый исход: 'paid', 'cancelled' или None."""
+    fetch, paid, cancelled = PROVIDERS[method]
+    data = await fetch(payment_id)
+    if not data:
+        return None
+    status = str(data.get("status", "")).lower()
+
+    async with async_session_maker() as session:
+        if status in paid:
+            if await apply_payment_success(session, method, payment_id):
+                return "paid"
+        elif status in cancelled:
+            result = await session.execute(
+                update(Payment)
+                .where(
+                    Payment.payment_method == method,
+                    Payment.payment_id == payment_id,
+                    Payment.status == "PENDING",
+                )
+                .values(status="CANCELLED", completed_at=datetime.now())
+            )
+            await session.commit()
+            if result.rowcount:
+                return "cancelled"
+    return None
+
+
+async def reconcile_pending_payments(batch_size: int = None, concurrency: int = None) -> dict:
+    """Сверить одну страницу PENDING-платежей, продвинуть курсор."""
+    batch_size = batch_size or settings.RECONCILE_BATCH
+    concurrency = concurrency or settings.RECONCILE_CONCURRENCY
+    now = datetime.now()
+
+    async with async_session_maker() as session:
+        cursor = await get_job_cursor(session, CURSOR_NAME)
+        rows = (await session.execute(
+            select(Payment.id, Payment.payment_method, Payment.payment_id)
+            .where(
+                Payment.status == "PENDING",
+                Payment.id > cursor,
+                Payment.payment_id.isnot(None),
+                Payment.payment_method.in_(PROVIDERS),
+                Payment.created_at <= now - timedelta(seconds=settings.RECONCILE_MIN_AGE),
+                Payment.created_at >= now - timedelta(hours=settings.RECONCILE_MAX_AGE_HOURS),
+            )
+            .order_by(Payment.id)
+            .limit(batch_size)
+        )).all()
+        # Неполная страница — дошли до конца, следующий запуск начнёт сначала
+        await set_job_cursor(session, CURSOR_NAME, rows[-1].id if len(rows) == batch_size else 0)
+        await session.commit()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"checked": len(rows), "paid": 0, "cancelled": 0, "errors": 0}
+
+    async def check(row) -> None:
+        async with semaphore:
+            try:
+                outcome = await _reconcile_one(row.payment_method, row.payment_id)
+            except Exception as e:
+                stats["errors"] += 1
+                logger.error("Reconcile %s/%s failed: %s", row.payment_method, row.payment_id, e)
+                return
+            if outcome:
+                stats[outcome] += 1
+
+    await asyncio.gather(*(check(row) for row in rows))
+    if stats["paid"] or stats["cancelled"] or stats["errors"]:
+        logger.info("Payment reconcile: %s", stats)
+    return stats
@@ -0,0 +1,70 @@
+"""Освобождение просроченных бронирований"""
+import logging
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import select, update
+
+from src.config import settings
+from src.database.database import async_session_maker
+from src.database.models import Account, Order, User
+from src.services.notifications import notify_reservation_expired
+
+logger = logging.getLogger(__name__)
+
+
+async def _release_batch(batch_size: int) -> List:
+    """Отменить одну пачку просроченных заказов в отдельной транзакции.
+
+    Уведомления покупателям ставятся в outbox той же транзакцией.
+    Возвращает строки (order_id, telegram_id) отменённых заказов.
+    """
+    async with async_session_maker() as session:
+        expired = (
+            select(Order.id)
+            .where(Order.status == "ОЖИДАЕТ ОПЛАТЫ", Order.reserved_until < datetime.now())
+            .order_by(Order.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = await session.execute(
+            update(Order)
+            .where(Order.id.in_(expired), Order.user_id == User.id)
+            .values(status="ОТМЕНЕНО", reserved_until=None)
+            .returning(Order.id, User.telegram_id)
+        )
+        orders = result.all()
+        if not orders:
+            return []
+
+        result = await session.execute(
+            update(Account)
+            .where(Account.order_id.in_([row.id for row in orders]))
+            .values(is_sold=False, sold_at=None, order_id=None)
+        )
+        released = result.rowcount
+
+        for row in orders:
+            notify_reservation_expired(session, row.telegram_id, row.id)
+        await session.commit()
+        logger.info(
+            "Reservation sweep batch: %s orders cancelled, %s accounts released",
+            len(orders), released,
+        )
+        return orders
+
+
+async def release_expired_reservations(batch_size: int = None) -> int:
+    """Отменить все заказы с истёкшей бронью и вернуть аккаунты на склад."""
+    batch_size = batch_size or settings.RESERVATION_SWEEP_BATCH
+    total = 0
+    while True:
+        orders = await _release_batch(batch_size)
+        total += len(orders)
+        if len(orders) < batch_size:
+            break
+
+    if total:
+        logger.info("Reservation sweep finished: %s orders released", total)
+    return total
+
@@ -0,0 +1,342 @@
+"""Планировщик фоновых задач.
+
+Задачи бывают интервальные и cron-подобные. Выполняются только на реплике-лидере:
+лидер выбирается через pg_try_advisory_lock на отдельном соединении, поэтому при
+нескольких запущенных ботах каждая задача отрабатывает ровно на одном из них.
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from src.config import settings
+from src.database.database import engine
+from src.database.models import JobState
+
+logger = logging.getLogger(__name__)
+
+JobFunc = Callable[[], Awaitable[object]]
+
+
+class CronSchedule:
+    """Расписание в формате cron: «минута час день месяц день_недели»."""
+
+    _RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron-выражение должно содержать 5 полей: {expression!r}")
+        self.expression = expression
+        self._dom_any = fields[2] == "*"
+        self._dow_any = fields[4] == "*"
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self._RANGES)
+        )
+        # В cron воскресенье — и 0, и 7
+        self.weekdays = frozenset(d % 7 for d in weekdays)
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> frozenset:
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_str = part.split("/", 1)
+                step = int(step_str)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(v) for v in part.split("-", 1))
+            else:
+                start = end = int(part)
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"Недопустимое значение в cron-поле: {field!r}")
+            values.update(range(start, end + 1, step))
+        return frozenset(values)
+
+    def _day_matches(self, dt: datetime) -> bool:
+        if dt.month not in self.months:
+            return False
+        dom = dt.day in self.days
+        dow = (dt.isoweekday() % 7) in self.weekdays
+        if self._dom_any or self._dow_any:
+            return dom and dow
+        return dom or dow
+
+    def next_after(self, dt: datetime) -> datetime:
+        """Ближайший момент срабатывания строго после dt."""
+        candidate = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 4)
+        while candidate < limit:
+            if not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+            return candidate
+        raise ValueError(f"Cron-выражение никогда не срабатывает: {self.expression!r}")
+
+
+class JobMetrics:
+    """Счётчики выполнения задачи."""
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.total_duration = 0.0
+        self.last_duration: Optional[float] = None
+        self.last_started_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "skipped": self.skipped,
+            "avg_duration": self.total_duration / self.runs if self.runs else None,
+            "last_duration": self.last_duration,
+            "last_started_at": self.last_started_at,
+            "last_error": self.last_error,
+        }
+
+
+class Job:
+    """Зарегистрированная фоновая задача."""
+
+    def __init__(
+        self,
+        name: str,
+        func: JobFunc,
+        *,
+        interval: Optional[float] = None,
+        cron: Optional[CronSchedule] = None,
+        jitter: float = 0.0,
+        timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cron = cron
+        self.jitter = jitter
+        self.timeout = timeout
+        self.metrics = JobMetrics()
+        self.wakeup = asyncio.Event()
+
+    def next_delay(self) -> float:
+        """Сколько секунд ждать до следующего запуска (с учётом jitter)."""
+        if self.cron:
+            now = datetime.now()
+            delay = (self.cron.next_after(now) - now).total_seconds()
+        else:
+            delay = self.interval
+        if self.jitter:
+            delay += random.uniform(0, self.jitter)
+        return max(0.0, delay)
+
+
+class Scheduler:
+    """Asyncio-планировщик с выбором лидера через advisory lock PostgreSQL."""
+
+    def __init__(self, lock_key: int, leader_check_interval: float = 15.0):
+        self.lock_key = lock_key
+        self.leader_check_interval = leader_check_interval
+        self._jobs: Dict[str, Job] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._lock_conn: Optional[AsyncConnection] = None
+        self._is_leader = False
+
+    @property
+    def is_leader(self) -> bool:
+        return self._is_leader
+
+    def add_interval_job(
+        self,
+        name: str,
+        func: JobFunc,
+        seconds: float,
+        *,
+        jitter: float = 0.0,
+        timeout: Optional[float] = None,
+    ) -> Job:
+        """Задача, запускаемая каждые `seconds` секунд."""
+        if seconds <= 0:
+            raise ValueError("Интервал задачи должен быть положительным")
+        return self._add(Job(name, func, interval=seconds, jitter=jitter, timeout=timeout))
+
+    def add_cron_job(
+        self,
+        name: str,
+        func: JobFunc,
+        expression: str,
+        *,
+        jitter: float = 0.0,
+        timeout: Optional[float] = None,
+    ) -> Job:
+        """Задача по cron-расписанию («*/5 * * * *», «0 3 * * *» и т.п.)."""
+        return self._add(Job(name, func, cron=CronSchedule(expression), jitter=jitter, timeout=timeout))
+
+    def _add(self, job: Job) -> Job:
+        if job.name in self._jobs:
+            raise ValueError(f"Задача {job.name!r} уже зарегистрирована")
+        self._jobs[job.name] = job
+        return job
+
+    def wake(self, name: str) -> None:
+        """Запустить задачу, не дожидаясь интервала (на лидере; на остальных — без эффекта)."""
+        job = self._jobs.get(name)
+        if job is not None:
+            job.wakeup.set()
+
+    def metrics(self) -> Dict[str, dict]:
+        """Снимок метрик всех задач."""
+        return {name: job.metrics.as_dict() for name, job in self._jobs.items()}
+
+    async def start(self) -> None:
+        """Запустить выбор лидера и циклы задач."""
+        if self._tasks:
+            return
+        self._tasks.append(asyncio.create_task(self._leader_loop(), name="scheduler:leader"))
+        for job in self._jobs.values():
+            self._tasks.append(asyncio.create_task(self._job_loop(job), name=f"scheduler:{job.name}"))
+        logger.info("Scheduler started with %s jobs", len(self._jobs))
+
+    async def stop(self) -> None:
+        """Остановить задачи и отпустить advisory lock."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        await self._release_leadership()
+        logger.info("Scheduler stopped")
+
+    # ── Лидерство ──
+
+    async def _leader_loop(self) -> None:
+        while True:
+            try:
+                if self._lock_conn is None:
+                    await self._try_acquire()
+                else:
+                    await self._lock_conn.execute(text("SELECT 1"))
+                    await self._lock_conn.commit()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Scheduler leader check failed: %s", e)
+                await self._drop_connection()
+            await asyncio.sleep(self.leader_check_interval)
+
+    async def _try_acquire(self) -> None:
+        conn = await engine.connect()
+        try:
+            acquired = (await conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key}
+            )).scalar()
+            await conn.commit()
+        except BaseException:
+            await conn.close()
+            raise
+        if acquired:
+            self._lock_conn = conn
+            self._is_leader = True
+            logger.info("Scheduler: this replica is the leader")
+        else:
+            await conn.close()
+
+    async def _drop_connection(self) -> None:
+        """Соединение с блокировкой потеряно — отказываемся от лидерства."""
+        if self._is_leader:
+            logger.warning("Scheduler: leadership lost")
+        self._is_leader = False
+        conn, self._lock_conn = self._lock_conn, None
+        if conn is not None:
+            try:
+                await conn.invalidate()
+                await conn.close()
+            except Exception:
+                pass
+
+    async def _release_leadership(self) -> None:
+        conn, self._lock_conn = self._lock_conn, None
+        self._is_leader = False
+        if conn is None:
+            return
+        try:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key})
+            await conn.commit()
+            await conn.close()
+        except Exception as e:
+            logger.warning("Scheduler: failed to release advisory lock: %s", e)
+            await conn.invalidate()
+
+    # ── Выполнение задач ──
+
+    async def _job_loop(self, job: Job) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(job.wakeup.wait(), timeout=job.next_delay())
+            except asyncio.TimeoutError:
+                pass
+            job.wakeup.clear()
+            if not self._is_leader:
+                job.metrics.skipped += 1
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Job) -> None:
+        metrics = job.metrics
+        metrics.last_started_at = datetime.now()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(job.func(), timeout=job.timeout)
+        except asyncio.TimeoutError:
+            metrics.timeouts += 1
+            metrics.last_error = f"timeout after {job.timeout}s"
+            logger.error("Job %s timed out after %ss", job.name, job.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            metrics.failures += 1
+            metrics.last_error = str(e)
+            logger.error("Job %s failed: %s", job.name, e, exc_info=True)
+        finally:
+            duration = time.monotonic() - started
+            metrics.runs += 1
+            metrics.total_duration += duration
+            metrics.last_duration = duration
+            logger.debug("Job %s finished in %.3fs", job.name, duration)
+
+
+async def get_job_cursor(session: AsyncSession, name: str) -> int:
+    """Курсор задачи, обрабатывающей данные постранично (0 — с начала)."""
+    cursor = (await session.execute(select(JobState.cursor).where(JobState.name == name))).scalar_one_or_none()
+    return cursor or 0
+
+
+async def set_job_cursor(session: AsyncSession, name: str, cursor: int) -> None:
+    """Сохранить курсор задачи (коммит — на вызывающей стороне)."""
+    await session.execute(
+        insert(JobState)
+        .values(name=name, cursor=cursor, updated_at=datetime.now())
+        .on_conflict_do_update(index_elements=["name"], set_={"cursor": cursor, "updated_at": datetime.now()})
+    )
+
+
+scheduler = Scheduler(
+    lock_key=settings.SCHEDULER_LOCK_KEY,
+    leader_check_interval=settings.SCHEDULER_LEADER_CHECK_INTERVAL,
+)
@@ -0,0 +1,143 @@
+"""Ограничение частоты действий в памяти процесса (token bucket)."""
+import asyncio
+import time
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class TokenBucket:
+    """Ведро на `capacity` токенов, пополняется со скоростью `rate` токенов в секунду."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float, now: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic() if now is None else now
+
+    def consume(self, now: Optional[float] = None, tokens: float = 1.0) -> bool:
+        """Забрать токены. False — ведро пусто, действие нужно отклонить."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated_at) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """Набор вёдер по ключу (пользователь, класс действия).
+
+    limits: {класс действия: (скорость в секунду, ёмкость)}. Полные вёдра
+    ничем не отличаются от новых, поэтому периодически выбрасываются — память
+    ограничена числом недавно активных пользователей.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], sweep_interval: float = 60.0):
+        self.limits = limits
+        self.sweep_interval = sweep_interval
+        self._buckets: Dict[Tuple[Hashable, str], TokenBucket] = {}
+        self._swept_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def allow(self, key: Hashable, action: str) -> bool:
+        now = time.monotonic()
+        if now - self._swept_at >= self.sweep_interval:
+            self._sweep(now)
+        bucket = self._buckets.get((key, action))
+        if bucket is None:
+            rate, capacity = self.limits[action]
+            bucket = self._buckets[(key, action)] = TokenBucket(rate, capacity, now)
+        return bucket.consume(now)
+
+    def _sweep(self, now: float) -> None:
+        self._buckets = {k: b for k, b in self._buckets.items() if not b.is_full(now)}
+        self._swept_at = now
+
+
+class Throttle:
+    """Общий для многих корутин token bucket: acquire() ждёт свободный токен.
+
+    pause() останавливает выдачу токенов на заданное время — так исполняется
+    retry_after от Telegram, который относится ко всему боту, а не к одному чату.
+    Лимит с parent — подбюджет одного отправителя: токен берётся и у него, и у
+    родителя, а пауза и снижение темпа после 429 действуют на родителя, то есть
+    на всех отправителей сразу.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0, parent: Optional["Throttle"] = None):
+        self.rate = rate
+        self.parent = parent
+        self._base_rate = rate
+        self._bucket = TokenBucket(rate, capacity)
+        self._paused_until = 0.0
+        self._slowed_at = 0.0
+
+    @property
+    def root(self) -> "Throttle":
+        return self if self.parent is None else self.parent.root
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if self.rate < self._base_rate and now - self._slowed_at >= THROTTLE_RECOVERY:
+                self._apply_rate(self._base_rate)  # давно без 429 — снижение темпа снимается
+            if self._bucket.consume(now):
+                break
+            await asyncio.sleep((1.0 - self._bucket.tokens) / self.rate)
+        if self.parent is not None:
+            await self.parent.acquire()
+
+    def pause(self, seconds: float) -> bool:
+        """Приостановить выдачу токенов. True — новая пауза, а не продление идущей."""
+        if self.parent is not None:
+            return self.parent.pause(seconds)
+        now = time.monotonic()
+        started = self._paused_until <= now
+        self._paused_until = max(self._paused_until, now + seconds)
+        return started
+
+    def flood_wait(self, seconds: float, slowdown: float) -> bool:
+        """Исполнить retry_after: пауза и снижение темпа общего лимита. True — новая пауза."""
+        root = self.root
+        started = root.pause(seconds)
+        if started:
+            root._apply_rate(max(1.0, root.rate * slowdown))
+            root._slowed_at = time.monotonic()
+        return started
+
+    def set_rate(self, rate: float) -> None:
+        self._base_rate = rate
+        self._apply_rate(rate)
+
+    def _apply_rate(self, rate: float) -> None:
+        self.rate = self._bucket.rate = rate
+
+
+# Через сколько секунд без 429 темп, сниженный flood_wait, возвращается к заданному
+THROTTLE_RECOVERY = 60.0
+
+_bot_throttle: Optional[Throttle] = None
+
+
+def bot_throttle() -> Throttle:
+    """Лимит исходящих сообщений всего бота (BOT_SEND_RATE в секунду).
+
+    Рассылки, уведомления о поступлении и outbox берут токены здесь через свои
+    подбюджеты (Throttle с parent), поэтому вместе не превышают лимит Telegram.
+    """
+    global _bot_throttle
+    if _bot_throttle is None:
+        from src.config import settings
+
+        _bot_throttle = Throttle(settings.BOT_SEND_RATE)
+    return _bot_throttle